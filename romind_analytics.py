@@ -0,0 +1,301 @@
+"""
+Инкрементальная аналитика ROMIND: темы и эмоции по скользящим окнам.
+
+Вместо пересчёта всего семантического индекса на каждый запрос:
+- события (темы + эмоция сообщения) раскладываются по корзинам (час / день)
+- для каждого окна (24h, 7d, 30d, all) держатся готовые суммы
+- устаревшие корзины вычитаются из сумм, когда окно сдвигается
+- запоздавшее событие попадает в свою корзину; старше окна — в окно не идёт
+- топ-k тем и эмоций поддерживается по ходу обновлений
+
+Запрос к окну стоит O(k) и не зависит от длины истории.
+"""
+
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+# Окна: имя -> (размер корзины в секундах, число корзин). None — без ограничения.
+WINDOWS: Dict[str, Optional[Tuple[int, int]]] = {
+    "24h": (3600, 24),
+    "7d": (3600, 24 * 7),
+    "30d": (86400, 30),
+    "all": None,
+}
+
+# Сколько лидеров держим в каждом топе
+TOP_K = 10
+
+
+# === 1. Счётчик с инкрементальным топом ===
+
+class TopCounter:
+    """
+    Счётчики по ключам + отсортированный топ-k.
+
+    Рост счётчика обновляет топ за O(k). Пересчёт по всем ключам нужен
+    только когда уменьшается последний элемент топа (при сдвиге окна).
+    """
+
+    def __init__(self, k: int = TOP_K) -> None:
+        self.k = k
+        self.counts: Dict[str, int] = {}
+        self.top: List[str] = []
+
+    def add(self, key: str, delta: int = 1) -> None:
+        if not delta:
+            return
+        value = self.counts.get(key, 0) + delta
+        if value > 0:
+            self.counts[key] = value
+        else:
+            self.counts.pop(key, None)
+            value = 0
+
+        if delta > 0:
+            self._promote(key, value)
+        else:
+            self._demote(key, value)
+
+    def _promote(self, key: str, value: int) -> None:
+        top = self.top
+        if key in top:
+            i = top.index(key)
+        elif len(top) < self.k:
+            top.append(key)
+            i = len(top) - 1
+        elif value > self.counts.get(top[-1], 0):
+            top[-1] = key
+            i = len(top) - 1
+        else:
+            return
+        # «всплытие» вверх
+        while i > 0 and self.counts.get(top[i - 1], 0) < value:
+            top[i - 1], top[i] = top[i], top[i - 1]
+            i -= 1
+
+    def _demote(self, key: str, value: int) -> None:
+        top = self.top
+        if key not in top:
+            return
+        i = top.index(key)
+        if value <= 0:
+            top.pop(i)
+        else:
+            while i + 1 < len(top) and self.counts.get(top[i + 1], 0) > value:
+                top[i + 1], top[i] = top[i], top[i + 1]
+                i += 1
+        if len(self.counts) > len(top) and (len(top) < self.k or top[-1] == key):
+            self._refill()
+
+    def _refill(self) -> None:
+        """Пересобирает топ по всем ключам (редкий путь, только при вычитании)."""
+        best = heapq.nlargest(self.k, self.counts.items(), key=lambda kv: kv[1])
+        self.top = [k for k, _ in best]
+
+    def top_items(self, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        keys = self.top if limit is None else self.top[:limit]
+        return [(k, self.counts[k]) for k in keys]
+
+
+# === 2. Окно ===
+
+class _Window:
+    def __init__(self, bucket_seconds: Optional[int], buckets: int, k: int) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.max_buckets = buckets
+        # [начало корзины, {тема: n}, {эмоция: n}, сообщений]
+        self.buckets: Deque[List[Any]] = deque()
+        self.themes = TopCounter(k)
+        self.emotions = TopCounter(k)
+        self.messages = 0
+        # Окно засеяно из старого файла, а не набрано по сообщениям
+        self.approximate = False
+
+    def _bucket_start(self, ts: float) -> int:
+        ts = int(ts)
+        return ts - ts % self.bucket_seconds
+
+    def expire(self, now: float) -> None:
+        if self.bucket_seconds is None:
+            return
+        oldest = self._bucket_start(now) - (self.max_buckets - 1) * self.bucket_seconds
+        while self.buckets and self.buckets[0][0] < oldest:
+            _, themes, emotions, messages = self.buckets.popleft()
+            for theme, n in themes.items():
+                self.themes.add(theme, -n)
+            for emotion, n in emotions.items():
+                self.emotions.add(emotion, -n)
+            self.messages -= messages
+
+    def _bucket_for(self, start: int) -> Optional[List[Any]]:
+        """
+        Корзина для события. Обычно — последняя; запоздавшее событие ищем
+        с конца. Старше самой старой корзины окна — None (событие не учитываем).
+        """
+        buckets = self.buckets
+        if not buckets or buckets[-1][0] < start:
+            buckets.append([start, {}, {}, 0])
+            return buckets[-1]
+        horizon = buckets[-1][0] - (self.max_buckets - 1) * self.bucket_seconds
+        if start < horizon:
+            return None
+        i = len(buckets) - 1
+        while i >= 0 and buckets[i][0] > start:
+            i -= 1
+        if i >= 0 and buckets[i][0] == start:
+            return buckets[i]
+        bucket: List[Any] = [start, {}, {}, 0]
+        buckets.insert(i + 1, bucket)
+        return bucket
+
+    def add(self, ts: float, themes: Iterable[str], emotion: Optional[str]) -> None:
+        themes = list(themes)
+        if self.bucket_seconds is not None:
+            self.expire(ts)
+            bucket = self._bucket_for(self._bucket_start(ts))
+            if bucket is None:
+                return
+            for theme in themes:
+                bucket[1][theme] = bucket[1].get(theme, 0) + 1
+            if emotion:
+                bucket[2][emotion] = bucket[2].get(emotion, 0) + 1
+            bucket[3] += 1
+
+        for theme in themes:
+            self.themes.add(theme)
+        if emotion:
+            self.emotions.add(emotion)
+        self.messages += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.bucket_seconds is None:
+            data: Dict[str, Any] = {
+                "themes": dict(self.themes.counts),
+                "emotions": dict(self.emotions.counts),
+                "messages": self.messages,
+            }
+            if self.approximate:
+                data["approximate"] = True
+            return data
+        return {"buckets": [list(b) for b in self.buckets]}
+
+    def load(self, data: Dict[str, Any]) -> None:
+        if self.bucket_seconds is None:
+            for theme, n in (data.get("themes") or {}).items():
+                self.themes.add(theme, int(n))
+            for emotion, n in (data.get("emotions") or {}).items():
+                self.emotions.add(emotion, int(n))
+            self.messages = int(data.get("messages", 0))
+            self.approximate = bool(data.get("approximate", False))
+            return
+        for start, themes, emotions, messages in data.get("buckets") or []:
+            bucket = [int(start), dict(themes), dict(emotions), int(messages)]
+            self.buckets.append(bucket)
+            for theme, n in bucket[1].items():
+                self.themes.add(theme, int(n))
+            for emotion, n in bucket[2].items():
+                self.emotions.add(emotion, int(n))
+            self.messages += bucket[3]
+
+
+# === 3. Набор окон ===
+
+class RomindRollups:
+    """Темы и эмоции пользователя по окнам 24h / 7d / 30d / all."""
+
+    def __init__(self, k: int = TOP_K) -> None:
+        self.k = k
+        self._lock = threading.Lock()
+        self.windows: Dict[str, _Window] = {}
+        for name, spec in WINDOWS.items():
+            if spec is None:
+                self.windows[name] = _Window(None, 0, k)
+            else:
+                self.windows[name] = _Window(spec[0], spec[1], k)
+
+    def record(
+        self,
+        themes: Iterable[str],
+        emotion: Optional[str],
+        now: Optional[float] = None,
+    ) -> None:
+        """Учитывает одно сообщение: найденные темы + текущая эмоция."""
+        ts = time.time() if now is None else now
+        themes = list(themes)
+        with self._lock:
+            for window in self.windows.values():
+                window.add(ts, themes, emotion)
+
+    def snapshot(
+        self,
+        window: str = "24h",
+        limit: Optional[int] = None,
+        now: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        if window not in self.windows:
+            raise ValueError(f"Unknown window: {window}")
+        ts = time.time() if now is None else now
+        with self._lock:
+            w = self.windows[window]
+            w.expire(ts)
+            return {
+                "window": window,
+                "approximate": w.approximate,
+                "messages": w.messages,
+                "themes": w.themes.top_items(limit),
+                "emotions": w.emotions.top_items(limit),
+            }
+
+    def top_themes(self, window: str = "all", limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        return self.snapshot(window, limit)["themes"]
+
+    # --- Сериализация ---
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: w.to_dict() for name, w in self.windows.items()}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], k: int = TOP_K) -> "RomindRollups":
+        rollups = cls(k)
+        for name, payload in (data or {}).items():
+            if name in rollups.windows and isinstance(payload, dict):
+                rollups.windows[name].load(payload)
+        return rollups
+
+    @classmethod
+    def from_semantic_index(
+        cls,
+        index: Dict[str, Any],
+        records: Iterable[Dict[str, Any]] = (),
+        k: int = TOP_K,
+    ) -> "RomindRollups":
+        """
+        Для старых файлов без «_rollups» засеваем окно «all», временные окна
+        начинаются с нуля:
+        - темы — накопленные счётчики индекса (точные)
+        - эмоции и число сообщений — по записям памяти, по одной на сообщение.
+          Связки «тема → эмоция» из индекса не годятся: сообщение с несколькими
+          темами посчитано в них несколько раз.
+
+        Записи памяти обрезаются до MAX_RECORDS, поэтому окно помечается
+        approximate: эмоции и сообщения могут быть занижены.
+        """
+        themes = {
+            key: v for key, v in index.items()
+            if not key.startswith("_") and isinstance(v, int)
+        }
+        emotions: Dict[str, int] = {}
+        messages = 0
+        for record in records:
+            messages += 1
+            emotion = record.get("emotion")
+            if emotion:
+                emotions[emotion] = emotions.get(emotion, 0) + 1
+        seeded = {"themes": themes, "emotions": emotions, "messages": messages, "approximate": True}
+        return cls.from_dict({"all": seeded}, k)
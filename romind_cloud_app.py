@@ -3,38 +3,56 @@
 # - Общается через HTTP (FastAPI)
 # - Использует RomindState + build_system_prompt как "мозг"
 # - Использует RomindSemanticMemory для памяти и анализа
-# - Если есть OPENAI_API_KEY -> отвечает через GPT в стиле ROMIND
+# - Если есть OPENAI_API_KEY (или ROMIND_LLM_BASE_URL) -> отвечает через LLM в стиле ROMIND
 # - Если ключа нет -> отвечает через offline-логику (демо живёт всегда)
+# - Бэкенд LLM выбирается через ROMIND_LLM_BACKEND (openai / stub / offline)
 # - Внизу есть консольный режим для локального теста
 
+import json
 import os
-from typing import List, Optional
+import random
+import re
+import time
+import uuid
+from typing import Dict, List, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from pydantic import BaseModel
 
 from romind_core_logic import (
     RomindState,
     build_system_prompt,
     build_adaptive_reply,
-    get_proximity_level,
     adapt_response_to_proximity,
+    get_offline_extra,
+    set_emotion_classifier,
+    PERSONA_BASE_LINES,
 )
 from romind_memory import RomindSemanticMemory
-
-# --- Попытка инициализировать OpenAI-клиент (новый SDK) ---
-
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None
-
-client = None
-if OpenAI is not None and os.getenv("OPENAI_API_KEY"):
-    try:
-        client = OpenAI()
-    except Exception:
-        client = None
+from romind_analytics import WINDOWS as ANALYTICS_WINDOWS
+from romind_fastpath import FastPathRouter
+from romind_pipeline import RomindPipeline, RomindTurn, Stage, PIPELINE_SKIP
+from romind_session import DEFAULT_SESSION_ID, RomindSession, SessionRegistry, state_delta
+from romind_summary import RollingSummarizer
+from romind_enrichment import EnrichmentQueue
+from romind_routing import ModelRouter
+from romind_llm import make_backend
+from romind_scenarios import ScenarioEngine, SCENARIOS_ENABLED
+from romind_pubsub import StateBroker, SSE_HEARTBEAT
+from romind_council import RomindCouncil, parse_council
+from romind_replay import make_recorder
+from romind_emotion_model import make_emotion_classifier
+from romind_rules import RomindRuleStore, RULES_FILE
+from romind_idempotency import IdempotencyCache, IdempotencyConflict, IdempotencyTimeout, fingerprint
+from romind_export import check_export_token, iter_export_chunks, parse_list_arg
+from romind_usage import UsageLedger
+from romind_cluster import (
+    FORWARD_HEADER, NODE_HEADER, PeerUnavailable, RomindCluster,
+    export_session, import_session, rebalance,
+)
 
 # --- Инициализация FastAPI и ядра ROMIND ---
 
@@ -43,9 +61,27 @@ app = FastAPI(
     description="Облачное ядро эмоционального ИИ ROMIND / ScentUnivers™",
 )
 
+# Классификатор эмоций (если есть numpy и веса модели), иначе ключевые слова
+emotion_classifier = make_emotion_classifier()
+set_emotion_classifier(emotion_classifier)
+
 state = RomindState()
 memory = RomindSemanticMemory()
 
+# Правила, которым пользователь обучил ROMIND ("ROMIND, запомни: ...")
+_rules_existed = os.path.exists(RULES_FILE)
+rule_store = RomindRuleStore()
+if not _rules_existed:
+    # Однократный перенос старых SYSTEM_RULE из потока памяти
+    rule_store.import_memory_records(memory.data)
+# Сессия по умолчанию работает с глобальным state (старые клиенты /chat)
+sessions = SessionRegistry()
+sessions.add(RomindSession(DEFAULT_SESSION_ID, state=state))
+fastpath = FastPathRouter()
+model_router = ModelRouter()
+# Узел кластера: владелец сессии — по consistent hashing (без ROMIND_CLUSTER_NODES — один узел)
+cluster = RomindCluster()
+
 # --- Модели запросов ---
 
 class HistoryItem(BaseModel):
@@ -53,223 +89,793 @@ class HistoryItem(BaseModel):
     content: str
 
 
+class RuleRequest(BaseModel):
+    text: str
+    personas: Optional[List[str]] = None  # пусто — правило для всех персон
+
+
+class ClusterNodeRequest(BaseModel):
+    node_id: str
+    url: Optional[str] = None  # для join
+
+
+class ClusterMembersRequest(BaseModel):
+    nodes: Dict[str, str]
+
+
+class HandoffRequest(BaseModel):
+    sessions: List[Dict]
+
+
 class ChatRequest(BaseModel):
     persona: Optional[str] = None   # "ROMIND", "RAZ", "MIRA", ...
     message: str
     history: Optional[List[HistoryItem]] = []
+    session_id: Optional[str] = None  # без него — сессия "default"
+    council: Optional[List[str]] = None  # ["ROMIND", "RO", "MIRA"] — ответят все сразу
+    merge: bool = False                  # свести ответы совета в один
 
 
 # --- OFFLINE-ответ (если нет ключа) ---
 
-def offline_reply(user_message: str) -> str:
+def offline_reply(user_message: str, st: Optional[RomindState] = None) -> str:
     """
     Резервный ответ, когда нет доступа к GPT.
     Чтобы ROMIND не умирал даже без денег и без ключа.
     """
-    s = state.describe()
+    s = (st or state).describe()
     persona = s.get("persona", "ROMIND")
     emotion = s.get("emotion", "calm")
 
-    base_map = {
-        "ROMIND": "Я здесь. Давай смотреть на вещи честно и структурно.",
-        "RO": "Перехожу в инженерный режим. Никакой магии, только система.",
-        "AETHER": "Чувствую глубину под поверхностью. Давай оформим её в путь.",
-        "RAZ": "Прекращаем извиняться за масштаб. Движемся.",
-        "MIRA": "Спокойно. Ты жива, ты думаешь, а значит — уже контролируешь.",
-        "LAYLA": "Порядок и ритуалы — твой щит. Начнём с малого.",
-    }
-    base = base_map.get(persona, "Я рядом.")
-
-    if emotion in ("tired", "drained", "overwhelmed"):
-        extra = " Ты устала — убираем лишнее, оставляем главное."
-    elif emotion in ("anxious", "worried"):
-        extra = " В хаосе спасает структура. Давай 1–3 шага."
-    elif emotion in ("happy", "joyful", "inspired"):
-        extra = " Хороший импульс. Закрепим его конкретным решением."
-    else:
-        extra = ""
+    base = PERSONA_BASE_LINES.get(persona, "Я рядом.")
+    extra = get_offline_extra(emotion)
 
     return base + extra
 
 
+# --- LLM-бэкенд (OpenAI-совместимый HTTP / заглушка / offline) ---
+
+def _offline_responder(user_message: str, context: Optional[Dict] = None) -> str:
+    st = (context or {}).get("state")
+    return offline_reply(user_message, st)
+
+
+llm = make_backend(_offline_responder)
+# Пул соединений HTTP-бэкенда закрываем вместе с приложением
+app.router.on_shutdown.append(llm.close)
+
+# Расход токенов по сессиям/персонам/моделям + бюджет сессии (ROMIND_SESSION_TOKEN_BUDGET)
+usage = UsageLedger()
+# Вытесненные сессии не копят строки в учёте
+sessions.on_evict = usage.forget_sessions
+usage.start_dumper()
+
+
 # --- Ответ через GPT (если есть ключ) ---
 
-def romind_answer_via_gpt(user_message: str, history: Optional[List[HistoryItem]]) -> str:
+def romind_answer_via_gpt(
+    user_message: str,
+    history: Optional[List[Dict[str, str]]],
+    st: Optional[RomindState] = None,
+    summary: Optional[str] = None,
+    system_prompt: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> str:
     """
     Если клиент GPT доступен — используем полный мозг ROMIND.
-    Если нет — уходим в offline_reply.
+    Если нет (или сессия исчерпала бюджет токенов) — уходим в offline_reply.
+    history — список {"role", "content"}; st — состояние сессии;
+    summary — резюме старых ходов (промпт = резюме + короткий хвост);
+    system_prompt — готовый промпт (по умолчанию build_system_prompt(st));
+    session_id — для учёта расхода и бюджета.
     """
-    if client is None:
-        return offline_reply(user_message)
+    st = st or state
+    if llm.offline or usage.over_budget(session_id):
+        return offline_reply(user_message, st)
 
-    system_prompt = build_system_prompt(state)
+    system_prompt = system_prompt or build_system_prompt(st, rules=rule_store.fragment(st.persona_id))
 
     messages = [{"role": "system", "content": system_prompt}]
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"Краткое содержание более раннего разговора:\n{summary}",
+        })
     if history:
-        for h in history:
-            messages.append({"role": h.role, "content": h.content})
+        messages.extend(history)
     messages.append({"role": "user", "content": user_message})
 
+    # Модель — по сложности хода и текущему здоровью моделей
+    model = model_router.choose(user_message, st)
+    started = time.perf_counter()
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4.1-mini",  # экономичная модель для демо
-            messages=messages,
-            temperature=0.7,
+        result = llm.complete(messages, model=model, temperature=0.7, context={"state": st})
+        reply = result.text
+        model_router.record(model, result.latency, ok=True)
+        usage.record(
+            result.model or model, result.usage, result.latency,
+            session_id=session_id, persona=st.persona_id, history_len=len(history or ()),
         )
-        reply = completion.choices[0].message.content.strip()
     except Exception:
-        reply = offline_reply(user_message)
+        elapsed = time.perf_counter() - started
+        model_router.record(model, elapsed, ok=False)
+        usage.record(
+            model, None, elapsed, ok=False,
+            session_id=session_id, persona=st.persona_id, history_len=len(history or ()),
+        )
+        reply = offline_reply(user_message, st)
 
     return reply
 
 
-# --- Внутренняя обработка сообщения (общая для API и консоли) ---
+# --- Резюме длинных разговоров (фоновое, дешёвой моделью) ---
 
-def process_user_message(user_text: str, use_gpt: bool = True) -> str:
+SUMMARY_MODEL = os.getenv("ROMIND_SUMMARY_MODEL", "gpt-4.1-nano")
+
+
+def summarize_via_gpt(messages: List[Dict[str, str]], session_id: Optional[str] = None) -> Optional[str]:
     """
-    Полный цикл:
-    - обновить состояние
-    - записать память
-    - обновить биографию и семантику
-    - сгенерировать адаптивный ответ
+    Дешёвый LLM-вызов для резюме. None — пусть работает offline-резюме
+    (и когда сессия исчерпала бюджет токенов).
     """
-    # 1. Обновляем состояние по тексту
-    state.update_from_user_text(user_text)
+    if llm.offline or usage.over_budget(session_id):
+        return None
+    result = llm.complete(messages, model=SUMMARY_MODEL, temperature=0.2)
+    usage.record(result.model or SUMMARY_MODEL, result.usage, result.latency, session_id=session_id)
+    return result.text
+
+
+summarizer = RollingSummarizer(llm=summarize_via_gpt)
+
+
+# --- Совет персон ---
+
+COUNCIL_SYNTH_MODEL = os.getenv("ROMIND_COUNCIL_SYNTH_MODEL", model_router.tiers["standard"])
+
+
+def synthesize_via_gpt(messages: List[Dict[str, str]], session_id: Optional[str] = None) -> Optional[str]:
+    """
+    Финальный синтез ответов совета (от лица ROMIND); без LLM или сверх
+    бюджета сессии — None, и ответы идут списком.
+    """
+    if llm.offline or usage.over_budget(session_id):
+        return None
+    result = llm.complete(messages, model=COUNCIL_SYNTH_MODEL, temperature=0.5)
+    usage.record(
+        result.model or COUNCIL_SYNTH_MODEL, result.usage, result.latency,
+        session_id=session_id, persona="ROMIND",
+    )
+    return result.text
+
+
+council = RomindCouncil(
+    ask=lambda text, st, prompt, history, summary, session_id: romind_answer_via_gpt(
+        text, history, st, summary=summary, system_prompt=prompt, session_id=session_id
+    ),
+    synthesize=synthesize_via_gpt,
+    rules=rule_store.fragment,
+    fallback=offline_reply,
+)
+
 
-    # 2. Логируем взаимодействие в память
+# --- Фоновое обогащение памяти (биография + семантика) ---
+
+# ROMIND_ENRICH_ASYNC=0 — выполнять обогащение прямо в запросе
+ENRICH_ASYNC = os.getenv("ROMIND_ENRICH_ASYNC", "1") != "0"
+
+
+def enrich_memory(session_id: str, text: str, emotion: str, profile: bool = True) -> None:
+    """
+    Биографический профиль и семантические паттерны по одному сообщению.
+    profile=False — только семантика (текст правила — не факт о человеке).
+    """
+    if profile:
+        try:
+            memory.update_profile(text)
+        except Exception:
+            pass
     try:
-        memory.remember(
-            user_text=user_text,
-            persona_id=state.persona_id,
-            role_context=state.role_context,
-            emotion=state.emotion,
-            trust=state.trust,
-        )
+        memory.update_semantic_patterns(text, emotion)
     except Exception:
         pass
 
-    # 3. Обновляем биографический профиль
+
+enricher = EnrichmentQueue(enrich_memory)
+
+# Ответы /chat по Idempotency-Key (повторы клиентов не пересчитываются)
+idempotency = IdempotencyCache()
+
+# Запись трафика для replay (только с ROMIND_CAPTURE_FILE)
+recorder = make_recorder()
+
+# Подписки на изменения состояния сессий (SSE)
+broker = StateBroker()
+
+# Сценарии устройств ScentUnivers (по умолчанию — имитированные хабы)
+scenarios = ScenarioEngine()
+
+
+# --- Стадии обработки хода (общие для API и консоли) ---
+
+TEACH_PREFIXES = (
+    "romind, запомни:",
+    "роминд, запомни:",
+    "romind, remember:",
+    "romind remember:",
+    "роминд запомни:",
+)
+
+
+def stage_teach(turn: RomindTurn) -> None:
+    """Режим явного обучения: "ROMIND, запомни: ..." — ход завершается здесь."""
+    st = turn.state
+    parts = turn.text.split(":", 1)
+    content = parts[1].strip() if len(parts) == 2 else ""
+    turn.route = "teach"
+    turn.done = True
+
+    if not content:
+        turn.reply = "Скажи после двоеточия, что именно мне запомнить."
+        return
+
+    # Правило — в хранилище правил (оно попадает в промпт);
+    # повтор уже известного правила ничего не меняет
+    _, added = rule_store.add(content)
+
+    # И событием в общий поток памяти — как раньше
     try:
-        memory.update_profile(user_text)
+        turn.memory.remember(
+            user_text=f"SYSTEM_RULE: {content}",
+            persona_id=st.persona_id,
+            role_context=st.role_context,
+            emotion=st.emotion,
+            trust=st.trust,
+            session_id=turn.session_id,
+        )
     except Exception:
         pass
 
-    # 4. Обновляем семантические паттерны
+    # Правило («не называй меня …») — не биография: только семантика
+    if ENRICH_ASYNC:
+        enricher.submit(turn.session_id, content, st.emotion, profile=False)
+    else:
+        try:
+            turn.memory.update_semantic_patterns(content, st.emotion)
+        except Exception:
+            pass
+
+    st.emotion = "warm"
+    if added:
+        turn.reply = "Я запомнил. Это теперь часть моей внутренней доктрины."
+    else:
+        turn.reply = "Это я уже знаю — правило на месте."
+
+
+def stage_analyze(turn: RomindTurn) -> None:
+    """Обновляем состояние по тексту."""
+    turn.state.update_from_user_text(turn.text)
+
+
+def stage_persist(turn: RomindTurn) -> None:
+    """Логируем взаимодействие в память."""
+    st = turn.state
     try:
-        memory.update_semantic_patterns(user_text, state.emotion)
+        turn.memory.remember(
+            user_text=turn.text,
+            persona_id=st.persona_id,
+            role_context=st.role_context,
+            emotion=st.emotion,
+            trust=st.trust,
+            session_id=turn.session_id,
+        )
     except Exception:
         pass
 
-    # 5. Если есть GPT и включен use_gpt — пробуем онлайн-ответ
-    if use_gpt:
-        base_reply = romind_answer_via_gpt(user_text, history=None)
+
+def stage_enrich(turn: RomindTurn) -> None:
+    """
+    Биографический профиль и семантические паттерны.
+    Ответ от них не зависит, поэтому по умолчанию — в фоновую очередь.
+    """
+    if ENRICH_ASYNC:
+        enricher.submit(turn.session_id, turn.text, turn.state.emotion)
     else:
-        base_reply = offline_reply(user_text)
-
-    # 6. Адаптация под круг близости и роль
-    role = state.role_context
-    proximity = get_proximity_level(state.trust, role)
-    adapted = adapt_response_to_proximity(base_reply, proximity, role)
-
-    # 7. Дополнительный слой: высокоуровневая адаптация (интро + память)
-    final_reply = build_adaptive_reply(
-        user_text=user_text,
-        state=state,
-        memory=memory,
+        enrich_memory(turn.session_id, turn.text, turn.state.emotion)
+
+
+def stage_generate(turn: RomindTurn) -> None:
+    """
+    Ответ в порядке удешевления:
+    - быстрый путь (шаблон уже учитывает близость)
+    - LLM / offline_reply (нужна адаптация под близость)
+    - без LLM — адаптивный ответ (интро + память + близость)
+    """
+    reply = fastpath.route(turn.text, turn.state, turn.history)
+    if reply is not None:
+        turn.reply, turn.route = reply, "fastpath"
+        return
+
+    if not turn.use_llm:
+        turn.reply = build_adaptive_reply(
+            user_text=turn.text,
+            state=turn.state,
+            memory=turn.memory,
+            rng=turn.rng,
+        )
+        turn.route = "adaptive"
+        return
+
+    offline = llm.offline or usage.over_budget(turn.session_id)
+    turn.reply = romind_answer_via_gpt(
+        turn.text, turn.history, turn.state, turn.summary, session_id=turn.session_id
     )
+    turn.route = "offline" if offline else "llm"
+    turn.needs_adapt = True
 
-    # Если build_adaptive_reply что-то даёт — используем его, иначе adapted
-    return final_reply or adapted
+
+def stage_adapt(turn: RomindTurn) -> None:
+    """Адаптация под круг близости и роль."""
+    turn.reply = adapt_response_to_proximity(
+        turn.reply or "", turn.proximity, turn.state.role_context, rng=turn.rng
+    )
+    turn.needs_adapt = False
+
+
+CHAT_PIPELINE = RomindPipeline(
+    [
+        Stage("teach", stage_teach, when=lambda t: t.lower.startswith(TEACH_PREFIXES)),
+        Stage("analyze", stage_analyze),
+        Stage("persist", stage_persist),
+        Stage("enrich", stage_enrich),
+        Stage("generate", stage_generate, when=lambda t: t.reply is None),
+        Stage("adapt", stage_adapt, when=lambda t: t.needs_adapt),
+    ],
+    skip=PIPELINE_SKIP,
+)
+
+
+# --- Внутренняя обработка сообщения (общая для API, WebSocket и консоли) ---
+
+def publish_state(session: RomindSession, before: Dict) -> Dict:
+    """Отправляет подписчикам сессии изменившиеся поля состояния."""
+    delta = state_delta(before, session.state.describe())
+    # одна отметка времени — не изменение состояния
+    if set(delta) - {"last_updated"}:
+        broker.publish(session.session_id, delta)
+    return delta
+
+
+def run_session_turn(
+    session: RomindSession,
+    text: str,
+    persona: Optional[str] = None,
+    history: Optional[List[Dict[str, str]]] = None,
+    use_llm: bool = True,
+    rng: Optional[random.Random] = None,
+) -> RomindTurn:
+    """
+    Один ход в рамках сессии. Если клиент не прислал history —
+    используется серверный буфер сессии (резюме + хвост).
+    Ход и ответ дописываются в буфер (и резюме обновляется в фоне) только
+    тогда, когда этот буфер и идёт в промпт: со своей history клиента
+    (и у общей "default" из /chat, где history=[]) буфер никто не читает.
+    Изменения состояния уходят подписчикам сессии.
+    rng — генератор для вступлений (replay передаёт сидированный).
+    """
+    with session.lock:
+        before = session.state.describe()
+        if persona:
+            session.state.switch_persona(persona.upper())
+        server_side = history is None
+        turn = CHAT_PIPELINE.run(RomindTurn(
+            text,
+            session.state,
+            memory,
+            history=session.history if server_side else history,
+            use_llm=use_llm,
+            summary=session.summary if server_side else "",
+            session_id=session.session_id,
+            rng=rng,
+        ))
+        turn.meta["state_before"] = before
+        if server_side:
+            session.append("user", text)
+            session.append("assistant", turn.reply or "")
+        turn.meta["state_delta"] = publish_state(session, before)
+    if server_side:
+        summarizer.maybe_schedule(session)
+    if SCENARIOS_ENABLED:
+        # Не ждём устройств: сценарий уходит в свой event loop
+        scenarios.submit(session.state, session.session_id)
+    return turn
+
+
+def run_council_turn(
+    session: RomindSession,
+    text: str,
+    personas: List[str],
+    merge: bool = False,
+    history: Optional[List[Dict[str, str]]] = None,
+) -> Dict:
+    """
+    Ход совета: анализ, память и обогащение — как у обычного хода
+    (под замком сессии), а ответы персон — параллельно на снимке состояния,
+    уже без замка. Персона сессии не переключается.
+    """
+    with session.lock:
+        before = session.state.describe()
+        server_side = history is None
+        turn = CHAT_PIPELINE.run(RomindTurn(
+            text,
+            session.state,
+            memory,
+            use_llm=False,
+            skip={"generate", "adapt"},
+            session_id=session.session_id,
+        ))
+        snapshot = session.state.snapshot()
+        if server_side:
+            history = list(session.history)
+        summary = session.summary if server_side else ""
+        publish_state(session, before)
+
+    if turn.reply is not None:
+        # "ROMIND, запомни: ..." — ответ уже готов, совет не нужен
+        result = {"answers": [], "reply": turn.reply, "merged": False, "fallback": False, "latency_ms": 0.0}
+    else:
+        result = council.run(
+            text, snapshot, personas, merge=merge, history=history, summary=summary,
+            session_id=session.session_id,
+        )
+
+    if server_side:
+        with session.lock:
+            session.append("user", text)
+            session.append("assistant", result["reply"] or "")
+        summarizer.maybe_schedule(session)
+    if SCENARIOS_ENABLED:
+        scenarios.submit(session.state, session.session_id)
+    return result
+
+
+def process_user_message(user_text: str, use_gpt: bool = True) -> str:
+    """
+    Полный цикл через CHAT_PIPELINE:
+    - обновить состояние
+    - записать память
+    - обновить биографию и семантику
+    - сгенерировать ответ (LLM только если use_gpt и его ответ будет использован)
+    """
+    session = sessions.get_or_create(DEFAULT_SESSION_ID)
+    turn = run_session_turn(session, user_text, use_llm=use_gpt)
+    return turn.reply or ""
 
 
 # --- Основной endpoint /chat ---
 
+def proxy_to_owner(owner: str, path: str, payload: Dict, headers: Dict[str, str]) -> Response:
+    """Запрос чужой сессии: 307 на владельца или пересылка ему (ROMIND_CLUSTER_MODE)."""
+    if cluster.mode == "redirect":
+        return RedirectResponse(cluster.redirect_url(owner, path), status_code=307)
+    try:
+        status, body, peer_headers = cluster.forward(owner, path, payload, headers)
+    except PeerUnavailable:
+        raise HTTPException(status_code=503, detail=f"Session owner {owner} is unavailable")
+    response = JSONResponse(body, status_code=status)
+    for name in (NODE_HEADER, "Idempotent-Replayed"):
+        if name.lower() in peer_headers:
+            response.headers[name] = peer_headers[name.lower()]
+    return response
+
+
 @app.post("/chat")
-def chat(req: ChatRequest):
-    # 1. Переключение личности, если указана
-    if req.persona:
-        state.switch_persona(req.persona.upper())
+def chat(
+    req: ChatRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    x_romind_forwarded_by: Optional[str] = Header(None),
+):
+    """
+    Ход диалога. С заголовком Idempotency-Key повтор того же запроса
+    получает сохранённый ответ (заголовок Idempotent-Replayed: true),
+    а не выполняет ход ещё раз.
+    В кластере ход выполняет узел-владелец сессии.
+    """
+    session_id = req.session_id or DEFAULT_SESSION_ID
+    owner = cluster.route(session_id, x_romind_forwarded_by)
+    if owner is not None:
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+        return proxy_to_owner(owner, "/chat", jsonable_encoder(req), headers)
+    if cluster.enabled:
+        response.headers[NODE_HEADER] = cluster.node_id
+
+    if not idempotency_key:
+        return handle_chat(req)
+
+    fp = fingerprint({
+        "persona": req.persona,
+        "message": req.message,
+        "history": [[h.role, h.content] for h in req.history or []],
+        "council": req.council,
+        "merge": req.merge,
+    })
+    try:
+        result, replayed = idempotency.run((session_id, idempotency_key), fp, lambda: handle_chat(req))
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    except IdempotencyTimeout:
+        raise HTTPException(status_code=409, detail="Original request with this Idempotency-Key is still in progress")
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
+
+def handle_chat(req: ChatRequest) -> Dict:
+    session = sessions.get_or_create(req.session_id or DEFAULT_SESSION_ID)
     text = (req.message or "").strip()
-    lower = text.lower()
 
     if not text:
+        # Переключение личности, если указана
+        if req.persona:
+            with session.lock:
+                before = session.state.describe()
+                session.state.switch_persona(req.persona.upper())
+                publish_state(session, before)
         return {
-            "state": state.describe(),
+            "state": session.state.describe(),
             "reply": "Скажи мне что-нибудь, и я отвечу."
         }
 
-    # 2. Режим явного обучения: "ROMIND, запомни: ..."
-    teach_prefixes = (
-        "romind, запомни:",
-        "роминд, запомни:",
-        "romind, remember:",
-        "romind remember:",
-        "роминд запомни:",
-    )
+    # Обучение / анализ / память / ответ / адаптация — одним конвейером.
+    # Историю из запроса берём, если клиент её прислал. Серверный буфер —
+    # только у своей сессии (session_id): сессия "default" общая для всех
+    # старых клиентов, её буфер в промпт не идёт — как и раньше, без истории.
+    if req.history:
+        history = [{"role": h.role, "content": h.content} for h in req.history]
+    elif req.session_id and req.session_id != DEFAULT_SESSION_ID:
+        history = None
+    else:
+        history = []
 
-    if lower.startswith(teach_prefixes):
-        parts = text.split(":", 1)
-        content = parts[1].strip() if len(parts) == 2 else ""
+    if req.council:
+        try:
+            personas = parse_council(req.council)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        result = run_council_turn(session, text, personas, merge=req.merge, history=history)
+        return {
+            "state": session.state.describe(),
+            "reply": result["reply"],
+            "council": result["answers"],
+            "merged": result["merged"],
+        }
 
-        if content:
-            # Запишем как системное правило в память
-            try:
-                memory.remember(
-                    user_text=f"SYSTEM_RULE: {content}",
-                    persona_id=state.persona_id,
-                    role_context=state.role_context,
-                    emotion=state.emotion,
-                    trust=state.trust,
-                )
-            except Exception:
-                pass
+    started = time.perf_counter()
+    turn = run_session_turn(session, text, persona=req.persona, history=history)
+    if recorder is not None:
+        recorder.record(session.session_id, text, req.persona, history, turn, time.perf_counter() - started)
+
+    return {
+        "state": session.state.describe(),
+        "reply": turn.reply,
+    }
+
+
+# --- WebSocket-сессия: клиент шлёт только новое сообщение ---
+
+WS_CHUNK_RE = re.compile(r"\S+\s*")
+
+
+def iter_reply_chunks(reply: str, words_per_chunk: int = 4):
+    """Режет готовый ответ на небольшие куски для потоковой отправки."""
+    words = WS_CHUNK_RE.findall(reply)
+    for i in range(0, len(words), words_per_chunk):
+        yield "".join(words[i:i + words_per_chunk])
+
+
+@app.websocket("/ws")
+async def ws_chat(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    Постоянное соединение с серверным буфером диалога.
+    Клиент -> {"message": str, "persona"?: str} (или просто текст)
+    Сервер -> {"type": "session", ...}, затем на каждый ход:
+              {"type": "delta", "text": ...}* и {"type": "done", "state_delta": {...}}
+    Сессия другого узла кластера -> {"type": "redirect", "url": ...} и закрытие.
+    """
+    await websocket.accept()
+    if session_id:
+        owner = cluster.route(session_id, websocket.headers.get(FORWARD_HEADER))
+        if owner is not None:
+            # WebSocket не пересылаем: клиент переподключается к владельцу
+            url = cluster.redirect_url(owner, f"/ws?session_id={session_id}")
+            await websocket.send_json({"type": "redirect", "node": owner, "url": "ws" + url[len("http"):]})
+            await websocket.close()
+            return
+    # Буфер общей сессии "default" не отдаём: у соединения своя сессия
+    if session_id == DEFAULT_SESSION_ID:
+        session_id = None
+    session = sessions.get_or_create(session_id or cluster.local_session_id())
+    await websocket.send_json({
+        "type": "session",
+        "session_id": session.session_id,
+        "state": session.state.describe(),
+    })
 
-            try:
-                memory.update_semantic_patterns(content, state.emotion)
-            except Exception:
-                pass
-
-            state.emotion = "warm"
-            return {
-                "state": state.describe(),
-                "reply": "Я запомнил. Это теперь часть моей внутренней доктрины."
-            }
-        else:
-            return {
-                "state": state.describe(),
-                "reply": "Скажи после двоеточия, что именно мне запомнить."
-            }
-
-    # 3. Обычный диалог через GPT (если есть) или оффлайн
-    # (история из req.history может быть добавлена к GPT, если нужно)
-    state.update_from_user_text(text)
-
-    # Логируем
     try:
-        memory.remember(
-            user_text=text,
-            persona_id=state.persona_id,
-            role_context=state.role_context,
-            emotion=state.emotion,
-            trust=state.trust,
-        )
-        memory.update_profile(text)
-        memory.update_semantic_patterns(text, state.emotion)
-    except Exception:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                payload = json.loads(raw)
+            except ValueError:
+                payload = {"message": raw}
+            if not isinstance(payload, dict):
+                payload = {"message": str(payload)}
+
+            text = str(payload.get("message") or "").strip()
+            persona = payload.get("persona")
+            if not text:
+                await websocket.send_json({"type": "error", "detail": "empty message"})
+                continue
+            if persona is not None and not isinstance(persona, str):
+                await websocket.send_json({"type": "error", "detail": "persona must be a string"})
+                continue
+
+            # Конвейер блокирующий (LLM, диск) — уводим его с event loop
+            turn = await run_in_threadpool(run_session_turn, session, text, persona)
+
+            for chunk in iter_reply_chunks(turn.reply or ""):
+                await websocket.send_json({"type": "delta", "text": chunk})
+            await websocket.send_json({
+                "type": "done",
+                "route": turn.route,
+                "state_delta": turn.meta.get("state_delta", {}),
+            })
+    except WebSocketDisconnect:
         pass
 
-    reply = romind_answer_via_gpt(text, req.history or [])
 
-    # Адаптация под близость
-    role = state.role_context
-    proximity = get_proximity_level(state.trust, role)
-    reply = adapt_response_to_proximity(reply, proximity, role)
+# --- Подписка на изменения состояния (Server-Sent Events) ---
 
-    return {
-        "state": state.describe(),
-        "reply": reply,
-    }
+@app.get("/sessions/{session_id}/events")
+async def session_events(session_id: str, request: Request):
+    """
+    Поток изменений состояния сессии:
+    сначала event: snapshot (полный describe()), затем event: state
+    с изменившимися полями. Быстрые изменения сливаются в одно событие.
+    Сессия другого узла кластера — 307 на владельца. Подписка сессию не
+    создаёт: иначе произвольные GET вытесняли бы из LRU живые сессии.
+    """
+    owner = cluster.route(session_id, request.headers.get(FORWARD_HEADER))
+    if owner is not None:
+        return RedirectResponse(cluster.redirect_url(owner, request.url.path), status_code=307)
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    sub = broker.subscribe(session.session_id)
+    if sub is None:
+        raise HTTPException(status_code=503, detail="Too many subscribers")
+
+    async def stream():
+        try:
+            snapshot = json.dumps(session.state.describe(), ensure_ascii=False)
+            yield f"event: snapshot\ndata: {snapshot}\n\n"
+            while True:
+                diff = await sub.get(timeout=SSE_HEARTBEAT)
+                if diff is None:
+                    if sub.closed or await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                data = json.dumps(diff, ensure_ascii=False)
+                yield f"id: {sub.seq}\nevent: state\ndata: {data}\n\n"
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Кластер: состав узлов и передача сессий ---
+
+def _require_cluster_token(token: Optional[str]) -> None:
+    if not cluster.enabled:
+        raise HTTPException(status_code=403, detail="Cluster mode is not configured")
+    if not cluster.check_token(token):
+        raise HTTPException(status_code=403, detail="Bad or unconfigured cluster token")
+
+
+def apply_members(nodes: Dict[str, str]) -> Dict[str, int]:
+    """Новый состав кластера: кольцо обновляется, чужие теперь сессии уезжают владельцам."""
+    if not cluster.set_nodes(nodes):
+        return {}
+    return rebalance(cluster, sessions, memory)
+
+
+@app.get("/cluster")
+def cluster_status(session_id: Optional[str] = None, x_romind_cluster_token: Optional[str] = Header(None)):
+    """Состояние узла. Адреса узлов — только с токеном кластера."""
+    report = cluster.stats()
+    if not cluster.check_token(x_romind_cluster_token):
+        report.pop("nodes", None)
+    report["sessions"] = len(sessions)
+    if session_id is not None:
+        report["owner"] = cluster.owner(session_id)
+    return report
+
+
+@app.post("/cluster/join")
+def cluster_join(req: ClusterNodeRequest, x_romind_cluster_token: Optional[str] = Header(None)):
+    """Добавляет узел и рассылает новый состав всем узлам (включая новый)."""
+    _require_cluster_token(x_romind_cluster_token)
+    if not req.url:
+        raise HTTPException(status_code=400, detail="url is required to join")
+    if cluster.node_id not in cluster.nodes:
+        raise HTTPException(status_code=409, detail="This node has left the cluster")
+    nodes = dict(cluster.nodes, **{req.node_id: req.url.rstrip("/")})
+    moved = apply_members(nodes)
+    peers = cluster.broadcast("/cluster/members", {"nodes": nodes}, nodes)
+    return {"nodes": nodes, "moved": moved, "peers": peers}
+
+
+@app.post("/cluster/leave")
+def cluster_leave(req: ClusterNodeRequest, x_romind_cluster_token: Optional[str] = Header(None)):
+    """
+    Убирает узел из кольца. Остальные получают новый состав, а уходящий
+    узел (если он жив) — свой /cluster/leave и раздаёт сессии оставшимся.
+    """
+    _require_cluster_token(x_romind_cluster_token)
+    if req.node_id not in cluster.nodes:
+        raise HTTPException(status_code=404, detail="Unknown node")
+    previous = dict(cluster.nodes)
+    nodes = {n: u for n, u in previous.items() if n != req.node_id}
+    if req.node_id == cluster.node_id:
+        # Сначала остальные узнают состав, потом им едут сессии
+        peers = cluster.broadcast("/cluster/members", {"nodes": nodes}, nodes)
+        moved = apply_members(nodes)
+    else:
+        moved = apply_members(nodes)
+        peers = cluster.broadcast("/cluster/members", {"nodes": nodes}, nodes)
+        # Состав без себя узел принимает только как собственный уход
+        peers.update(cluster.broadcast(
+            "/cluster/leave", {"node_id": req.node_id}, {req.node_id: previous[req.node_id]}
+        ))
+    return {"nodes": nodes, "moved": moved, "peers": peers}
+
+
+@app.post("/cluster/members")
+def cluster_members(req: ClusterMembersRequest, x_romind_cluster_token: Optional[str] = Header(None)):
+    """Состав кластера от другого узла (без дальнейшей рассылки)."""
+    _require_cluster_token(x_romind_cluster_token)
+    if cluster.node_id not in req.nodes:
+        # Уход узла — только через /cluster/leave
+        raise HTTPException(status_code=400, detail="Member set must include this node")
+    return {"nodes": req.nodes, "moved": apply_members(req.nodes)}
+
+
+@app.post("/cluster/handoff")
+def cluster_handoff(req: HandoffRequest, x_romind_cluster_token: Optional[str] = Header(None)):
+    """Принимает сессии, которые теперь принадлежат этому узлу."""
+    _require_cluster_token(x_romind_cluster_token)
+    for payload in req.sessions:
+        if not payload.get("session_id"):
+            raise HTTPException(status_code=400, detail="session_id is required")
+    for payload in req.sessions:
+        import_session(sessions, payload, memory)
+    cluster.received += len(req.sessions)
+    return {"received": len(req.sessions)}
+
+
+@app.get("/cluster/sessions/{session_id}")
+def cluster_export_session(session_id: str, x_romind_cluster_token: Optional[str] = Header(None)):
+    """Сессия в формате передачи (состояние, буфер, резюме, окно памяти)."""
+    _require_cluster_token(x_romind_cluster_token)
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return export_session(session, memory)
 
 
 # --- Проверочный корневой endpoint ---
@@ -282,6 +888,183 @@ def root():
     }
 
 
+# --- Метрики быстрого пути ---
+
+@app.get("/metrics/fastpath")
+def fastpath_metrics():
+    """Доля сообщений, отвеченных без LLM, и последние решения роутера."""
+    return fastpath.stats()
+
+
+# --- Метрики маршрутизации моделей ---
+
+@app.get("/metrics/models")
+def model_metrics():
+    """Решения роутера и скользящие задержки/ошибки по моделям."""
+    return model_router.stats()
+
+
+# --- Метрики фонового обогащения ---
+
+@app.get("/metrics/enrichment")
+def enrichment_metrics():
+    """Глубина очереди, отброшенные/слитые сообщения и задержка обработки."""
+    return enricher.stats()
+
+
+# --- Метрики фонового резюме ---
+
+@app.get("/metrics/summary")
+def summary_metrics():
+    return summarizer.stats()
+
+
+# --- Правила пользователя ---
+
+@app.get("/rules")
+def list_rules(persona: Optional[str] = None):
+    """Правила (для персоны — её собственные и общие) и фрагмент, который идёт в промпт."""
+    pid = persona.upper() if persona else None
+    return {
+        "rules": rule_store.list(pid),
+        "fragment": rule_store.fragment(pid),
+    }
+
+
+@app.post("/rules")
+def add_rule(req: RuleRequest):
+    text = (req.text or "").strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Empty rule")
+    try:
+        rule, added = rule_store.add(text, req.personas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"rule": rule, "added": added}
+
+
+@app.delete("/rules/{rule_id}")
+def delete_rule(rule_id: str):
+    if not rule_store.remove(rule_id):
+        raise HTTPException(status_code=404, detail="Unknown rule")
+    return {"deleted": rule_id}
+
+
+# --- Расход токенов LLM ---
+
+@app.get("/metrics/usage")
+def usage_metrics(session_id: Optional[str] = None, top: int = 20):
+    """
+    Токены, задержка, доля кэша и оценка стоимости по сессиям,
+    персонам, моделям и размеру истории. session_id — одна сессия.
+    """
+    report = usage.snapshot(session_id=session_id, top_sessions=top)
+    if session_id is not None:
+        report["over_budget"] = usage.over_budget(session_id)
+    return report
+
+
+# --- Метрики Idempotency-Key ---
+
+@app.get("/metrics/idempotency")
+def idempotency_metrics():
+    return idempotency.stats()
+
+
+# --- Метрики совета персон ---
+
+@app.get("/metrics/council")
+def council_metrics():
+    return council.stats()
+
+
+# --- Классификатор эмоций ---
+
+@app.get("/metrics/emotion")
+def emotion_metrics():
+    """Какой классификатор работает и как заполняются микро-батчи."""
+    batcher = getattr(emotion_classifier, "batcher", None)
+    return {
+        "classifier": "model" if batcher is not None else "keywords",
+        "batcher": batcher.stats() if batcher is not None else None,
+    }
+
+
+# --- Подписчики изменений состояния ---
+
+@app.get("/metrics/subscriptions")
+def subscription_metrics():
+    return broker.stats()
+
+
+# --- Сценарии устройств ---
+
+@app.get("/scenarios")
+def scenario_status(session_id: Optional[str] = None):
+    """Последний отправленный сценарий: команды, ошибки устройств, длительность."""
+    return scenarios.stats(session_id)
+
+
+# --- Аналитика тем и эмоций по окнам ---
+
+@app.get("/analytics")
+def analytics(window: Optional[str] = None, limit: int = 5):
+    """
+    Темы и эмоции пользователя за окно 24h / 7d / 30d / all.
+    Без window — все окна сразу. Счётчики ведутся инкрементально.
+    """
+    try:
+        if window:
+            return memory.get_analytics(window, limit)
+        return {name: memory.get_analytics(name, limit) for name in ANALYTICS_WINDOWS}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# --- Потоковый экспорт памяти / биографии / семантики ---
+
+@app.get("/export")
+def export(
+    kinds: str = "memory,profile,semantic",
+    fmt: str = "jsonl",
+    gzip: bool = False,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    persona: Optional[str] = None,
+    emotion: Optional[str] = None,
+    x_romind_export_token: Optional[str] = Header(None),
+):
+    """
+    Отдаёт выгрузку кусками (chunked), не собирая её целиком в памяти.
+    Фильтры: since/until (ISO), persona/emotion (через запятую).
+    Только с заголовком X-Romind-Export-Token = ROMIND_EXPORT_TOKEN, иначе 403.
+    """
+    if not check_export_token(x_romind_export_token):
+        raise HTTPException(status_code=403, detail="Bad or unconfigured export token")
+    try:
+        chunks = iter_export_chunks(
+            memory,
+            fmt=fmt,
+            compress=gzip,
+            kinds=parse_list_arg(kinds),
+            since=since,
+            until=until,
+            personas=parse_list_arg(persona),
+            emotions=parse_list_arg(emotion),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    media_type = "application/x-ndjson" if fmt == "jsonl" else "text/csv"
+    filename = f"romind_export.{fmt}"
+    headers = {}
+    if gzip:
+        media_type = "application/gzip"
+        filename += ".gz"
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
 # --- Консольный тест (локальный режим) ---
 
 if __name__ == "__main__":
@@ -0,0 +1,463 @@
+"""
+Несколько узлов ROMIND: у каждой сессии ровно один узел-владелец.
+
+Без этого запросы одного собеседника попадают на разные хосты,
+и у каждого — своё RomindState, свой буфер диалога и своя память.
+
+- владелец сессии — по consistent hashing session_id (кольцо с
+  виртуальными узлами): при добавлении/уходе узла переезжает лишь
+  ~1/N сессий
+- запрос, пришедший не владельцу, пересылается ему (forward) или
+  клиент получает 307 на владельца (redirect); заголовок
+  X-Romind-Forwarded-By не даёт запросу ходить по кругу, если кольца
+  узлов на мгновение расходятся
+- при изменении состава узел отдаёт новым владельцам свои сессии:
+  состояние, буфер, резюме и окно памяти; получатель вливает записи
+  памяти и досчитывает по ним профиль и семантический индекс
+
+Настройка:
+    ROMIND_NODE_ID=node-1
+    ROMIND_CLUSTER_NODES=node-1=http://127.0.0.1:8801,node-2=http://127.0.0.1:8802
+    ROMIND_CLUSTER_MODE=forward | redirect
+    ROMIND_CLUSTER_TOKEN=...   — общий секрет для /cluster/* между узлами
+                                 (без него эти эндпоинты отвечают 403)
+
+Без ROMIND_CLUSTER_NODES узел работает один, как раньше.
+
+Локальный кластер из нескольких процессов:
+    python romind_cluster.py launch --nodes 3 --port 8801
+    python romind_cluster.py owner session-1 session-2 --nodes-spec "..."
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+from romind_rules import SYSTEM_RULE_PREFIX
+from romind_session import RomindSession, SessionRegistry
+
+NODE_ID = os.getenv("ROMIND_NODE_ID", "local")
+CLUSTER_NODES = os.getenv("ROMIND_CLUSTER_NODES", "")
+CLUSTER_VNODES = int(os.getenv("ROMIND_CLUSTER_VNODES", "64"))
+CLUSTER_MODE = os.getenv("ROMIND_CLUSTER_MODE", "forward")
+CLUSTER_TIMEOUT = float(os.getenv("ROMIND_CLUSTER_TIMEOUT", "30"))
+CLUSTER_TOKEN = os.getenv("ROMIND_CLUSTER_TOKEN")
+# Сколько последних записей памяти сессии уезжает вместе с ней
+HANDOFF_MEMORY_WINDOW = int(os.getenv("ROMIND_HANDOFF_MEMORY_WINDOW", "50"))
+# Сколько сессий передаём одним запросом
+HANDOFF_BATCH = 50
+
+logger = logging.getLogger("romind.cluster")
+
+FORWARD_HEADER = "X-Romind-Forwarded-By"
+TOKEN_HEADER = "X-Romind-Cluster-Token"
+NODE_HEADER = "X-Romind-Node"
+
+
+class PeerUnavailable(Exception):
+    """Узел не ответил (соединение, таймаут)."""
+
+
+def parse_nodes(spec: str) -> Dict[str, str]:
+    """"id=url,id=url" -> {id: url}."""
+    nodes: Dict[str, str] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        node, sep, url = item.partition("=")
+        if not sep or not node.strip() or not url.strip():
+            raise ValueError(f"Bad cluster node spec: {item!r} (expected id=url)")
+        nodes[node.strip()] = url.strip().rstrip("/")
+    return nodes
+
+
+def _decode(raw: bytes) -> Any:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return {"detail": raw.decode("utf-8", "replace")}
+
+
+# === 1. Кольцо ===
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hashing: каждый узел — vnodes точек на кольце."""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = CLUSTER_VNODES) -> None:
+        self.vnodes = vnodes
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._points = [p for p, _ in points]
+        self._owners = [n for _, n in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        i = bisect.bisect_right(self._points, _hash(key))
+        return self._owners[i % len(self._owners)]
+
+    def spread(self, keys: Iterable[str]) -> Dict[str, int]:
+        """Сколько ключей достаётся каждому узлу."""
+        counts = {node: 0 for node in self.nodes}
+        for key in keys:
+            owner = self.owner(key)
+            if owner is not None:
+                counts[owner] += 1
+        return counts
+
+
+# === 2. Узел кластера ===
+
+class RomindCluster:
+    def __init__(
+        self,
+        node_id: str = NODE_ID,
+        nodes: Optional[Dict[str, str]] = None,
+        vnodes: int = CLUSTER_VNODES,
+        mode: str = CLUSTER_MODE,
+        timeout: float = CLUSTER_TIMEOUT,
+        token: Optional[str] = CLUSTER_TOKEN,
+    ) -> None:
+        if mode not in ("forward", "redirect"):
+            raise ValueError(f"Unknown cluster mode: {mode}")
+        self.node_id = node_id
+        self.vnodes = vnodes
+        self.mode = mode
+        self.timeout = timeout
+        self.token = token
+        self.nodes: Dict[str, str] = dict(parse_nodes(CLUSTER_NODES) if nodes is None else nodes)
+        self.ring = HashRing(self.nodes, vnodes)
+        # Состав меняется редко: новое кольцо строится целиком и подменяется ссылкой
+        self._lock = threading.Lock()
+        self._http = httpx.Client(timeout=timeout) if httpx is not None else None
+        self.forwarded = 0
+        self.redirected = 0
+        self.forward_failures = 0
+        self.loop_guarded = 0
+        self.handed_off = 0
+        self.handoff_failures = 0
+        self.received = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.nodes)
+
+    def owner(self, session_id: str) -> str:
+        return self.ring.owner(session_id) or self.node_id
+
+    def route(self, session_id: str, forwarded_by: Optional[str] = None) -> Optional[str]:
+        """None — сессию обслуживаем здесь; иначе — id узла-владельца."""
+        owner = self.owner(session_id)
+        if owner == self.node_id:
+            return None
+        if forwarded_by:
+            # Нас уже переслали: кольца узлов расходятся, дальше не отправляем
+            self.loop_guarded += 1
+            return None
+        return owner
+
+    def url_for(self, node: str, path: str = "") -> str:
+        return self.nodes[node] + path
+
+    def redirect_url(self, node: str, path: str) -> str:
+        self.redirected += 1
+        return self.url_for(node, path)
+
+    def local_session_id(self) -> str:
+        """Новый id сессии, которым владеет этот узел."""
+        for _ in range(64):
+            sid = uuid.uuid4().hex
+            if self.owner(sid) == self.node_id:
+                return sid
+        return uuid.uuid4().hex
+
+    def check_token(self, token: Optional[str]) -> bool:
+        """
+        /cluster/* меняют кольцо и отдают сессии целиком: без настроенного
+        кластера и общего секрета они закрыты для всех.
+        """
+        if not self.enabled or not self.token:
+            return False
+        return hmac.compare_digest(token or "", self.token)
+
+    # --- Транспорт между узлами ---
+
+    def call(
+        self,
+        node: str,
+        path: str,
+        payload: Any,
+        headers: Optional[Dict[str, str]] = None,
+        base_url: Optional[str] = None,
+    ) -> Tuple[int, Any, Dict[str, str]]:
+        """
+        POST JSON на узел: (статус, тело, заголовки). Нет связи — PeerUnavailable.
+        base_url — адрес узла, которого уже нет в текущем составе.
+        """
+        url = (base_url or self.nodes[node]) + path
+        hdrs = {"Content-Type": "application/json", FORWARD_HEADER: self.node_id}
+        if self.token:
+            hdrs[TOKEN_HEADER] = self.token
+        hdrs.update(headers or {})
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+        if self._http is not None:
+            try:
+                resp = self._http.post(url, content=body, headers=hdrs)
+            except httpx.HTTPError as e:
+                raise PeerUnavailable(f"{node}: {e}") from e
+            return resp.status_code, _decode(resp.content), dict(resp.headers)
+
+        req = urllib.request.Request(url, data=body, headers=hdrs, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                raw, status, resp_headers = resp.read(), resp.status, resp.headers
+        except urllib.error.HTTPError as e:
+            raw, status, resp_headers = e.read(), e.code, e.headers
+        except (urllib.error.URLError, OSError) as e:
+            raise PeerUnavailable(f"{node}: {e}") from e
+        return status, _decode(raw), {k.lower(): v for k, v in resp_headers.items()}
+
+    def forward(
+        self,
+        node: str,
+        path: str,
+        payload: Any,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, Any, Dict[str, str]]:
+        try:
+            result = self.call(node, path, payload, headers)
+        except PeerUnavailable:
+            self.forward_failures += 1
+            raise
+        self.forwarded += 1
+        return result
+
+    # --- Состав кластера ---
+
+    def set_nodes(self, nodes: Dict[str, str]) -> bool:
+        """Новый состав; True — если он изменился."""
+        with self._lock:
+            if nodes == self.nodes:
+                return False
+            self.nodes = dict(nodes)
+            self.ring = HashRing(self.nodes, self.vnodes)
+        return True
+
+    def broadcast(self, path: str, payload: Any, nodes: Dict[str, str]) -> Dict[str, bool]:
+        """Рассылает payload узлам {id: url} (кроме себя); {узел: доставлено}."""
+        delivered = {}
+        for node, url in nodes.items():
+            if node == self.node_id:
+                continue
+            try:
+                status, _, _ = self.call(node, path, payload, base_url=url)
+                delivered[node] = status < 400
+            except PeerUnavailable:
+                delivered[node] = False
+        return delivered
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "node_id": self.node_id,
+            "mode": self.mode,
+            "nodes": dict(self.nodes),
+            "vnodes": self.vnodes,
+            "forwarded": self.forwarded,
+            "redirected": self.redirected,
+            "forward_failures": self.forward_failures,
+            "loop_guarded": self.loop_guarded,
+            "handed_off": self.handed_off,
+            "handoff_failures": self.handoff_failures,
+            "received": self.received,
+        }
+
+
+# === 3. Передача сессий ===
+
+def export_session(session: RomindSession, memory: Any = None, window: int = HANDOFF_MEMORY_WINDOW) -> Dict[str, Any]:
+    """Сессия + последние записи её памяти."""
+    data = session.to_dict()
+    data["memory"] = memory.session_records(session.session_id, window) if memory is not None else []
+    return data
+
+
+def _record_timestamp(record: Dict[str, Any]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(record["time"]).replace(tzinfo=timezone.utc).timestamp()
+    except Exception:
+        return None
+
+
+def import_session(registry: SessionRegistry, payload: Dict[str, Any], memory: Any = None) -> RomindSession:
+    """
+    Вливает пришедшую сессию в реестр. Новые записи памяти досчитываются
+    в профиль и семантический индекс (со временем исходного сообщения);
+    сбой на одной записи пишется в лог и не мешает остальным.
+    """
+    session = registry.get_or_create(payload["session_id"])
+    session.load(payload)
+    if memory is not None:
+        for record in memory.import_records(payload.get("memory") or []):
+            text = str(record.get("user_text") or "")
+            emotion = record.get("emotion") or "calm"
+            try:
+                if text.startswith(SYSTEM_RULE_PREFIX):
+                    memory.update_semantic_patterns(text[len(SYSTEM_RULE_PREFIX):].strip(), emotion, now=_record_timestamp(record))
+                else:
+                    memory.update_profile(text)
+                    memory.update_semantic_patterns(text, emotion, now=_record_timestamp(record))
+            except Exception:
+                logger.exception(
+                    "Indexing imported record %s of session %s failed",
+                    record.get("time"), session.session_id,
+                )
+    return session
+
+
+def rebalance(cluster: RomindCluster, registry: SessionRegistry, memory: Any = None) -> Dict[str, int]:
+    """
+    Отдаёт новым владельцам сессии, которые по текущему кольцу живут не здесь.
+    Кольцо уже обновлено, так что новые запросы к ним сюда не идут;
+    экспорт под замком сессии дожидается хода, начатого до смены состава.
+    Не доставленные сессии остаются здесь (повтор — при следующем изменении).
+    """
+    by_owner: Dict[str, List[str]] = {}
+    for sid in registry.ids():
+        owner = cluster.owner(sid)
+        if owner != cluster.node_id:
+            by_owner.setdefault(owner, []).append(sid)
+
+    moved: Dict[str, int] = {}
+    for owner, ids in by_owner.items():
+        for start in range(0, len(ids), HANDOFF_BATCH):
+            batch = []
+            for sid in ids[start:start + HANDOFF_BATCH]:
+                session = registry.get(sid)
+                if session is not None:
+                    with session.lock:
+                        batch.append(export_session(session, memory))
+            if not batch:
+                continue
+            try:
+                status, _, _ = cluster.call(owner, "/cluster/handoff", {"sessions": batch})
+            except PeerUnavailable:
+                status = 503
+            if status >= 400:
+                cluster.handoff_failures += len(batch)
+                continue
+            for data in batch:
+                registry.drop(data["session_id"])
+            cluster.handed_off += len(batch)
+            moved[owner] = moved.get(owner, 0) + len(batch)
+    return moved
+
+
+# === 4. Локальный запуск нескольких процессов ===
+
+def launch(count: int, port: int, workdir: Optional[str], mode: str, host: str = "127.0.0.1") -> int:
+    """
+    N процессов uvicorn на соседних портах; у каждого свой каталог
+    (файлы памяти не общие, как на разных хостах). Ctrl+C — остановить все.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    root = workdir or tempfile.mkdtemp(prefix="romind-cluster-")
+    nodes = {f"node-{i + 1}": f"http://{host}:{port + i}" for i in range(count)}
+    spec = ",".join(f"{n}={u}" for n, u in nodes.items())
+
+    # Общий секрет узлов: без него /cluster/* закрыты
+    token = os.environ.get("ROMIND_CLUSTER_TOKEN") or secrets.token_hex(16)
+
+    procs = []
+    for i, node in enumerate(nodes):
+        node_dir = os.path.join(root, node)
+        os.makedirs(node_dir, exist_ok=True)
+        env = dict(
+            os.environ,
+            ROMIND_NODE_ID=node,
+            ROMIND_CLUSTER_NODES=spec,
+            ROMIND_CLUSTER_MODE=mode,
+            ROMIND_CLUSTER_TOKEN=token,
+            PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])),
+        )
+        cmd = [sys.executable, "-m", "uvicorn", "romind_cloud_app:app", "--host", host, "--port", str(port + i)]
+        procs.append(subprocess.Popen(cmd, cwd=node_dir, env=env))
+        print(f"{node}: {nodes[node]}  (cwd {node_dir})")
+    print(f"ROMIND_CLUSTER_NODES={spec}")
+    print(f"ROMIND_CLUSTER_TOKEN={token}")
+
+    def _stop(*_: Any) -> None:
+        for p in procs:
+            if p.poll() is None:
+                p.terminate()
+
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        while all(p.poll() is None for p in procs):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _stop()
+        for p in procs:
+            p.wait()
+    return max((p.returncode or 0) for p in procs)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ROMIND cluster tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_launch = sub.add_parser("launch", help="запустить несколько узлов локально")
+    p_launch.add_argument("--nodes", type=int, default=3)
+    p_launch.add_argument("--port", type=int, default=8801, help="порт первого узла")
+    p_launch.add_argument("--mode", choices=("forward", "redirect"), default=CLUSTER_MODE)
+    p_launch.add_argument("--workdir", help="каталог узлов (по умолчанию — временный)")
+
+    p_owner = sub.add_parser("owner", help="какому узлу принадлежат сессии")
+    p_owner.add_argument("session_ids", nargs="+")
+    p_owner.add_argument("--nodes-spec", default=CLUSTER_NODES, help="id=url,id=url (по умолчанию ROMIND_CLUSTER_NODES)")
+    p_owner.add_argument("--vnodes", type=int, default=CLUSTER_VNODES)
+
+    args = parser.parse_args(argv)
+    if args.command == "launch":
+        return launch(args.nodes, args.port, args.workdir, args.mode)
+
+    ring = HashRing(parse_nodes(args.nodes_spec), args.vnodes)
+    for sid in args.session_ids:
+        print(f"{sid}\t{ring.owner(sid)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,7 +23,7 @@ from __future__ import annotations
 
 import random
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable
 
 # === 1. Persona profiles ===
 
@@ -88,6 +88,55 @@ EMO_KEYWORDS: Dict[str, List[str]] = {
 }
 
 
+# Укрупнённые группы эмоций (для шаблонных ответов без LLM)
+EMOTION_GROUPS: Dict[str, List[str]] = {
+    "low": ["tired", "drained", "overwhelmed"],
+    "anxious": ["anxious", "worried", "insecure"],
+    "hurt": ["hurt", "lonely", "grieving", "sad"],
+    "bright": ["happy", "joyful", "proud", "inspired", "playful"],
+    "tense": ["annoyed", "angry", "frustrated", "jealous"],
+}
+
+
+def get_emotion_group(emotion: str) -> str:
+    """Группа эмоции: low / anxious / hurt / bright / tense / neutral."""
+    for group, emotions in EMOTION_GROUPS.items():
+        if emotion in emotions:
+            return group
+    return "neutral"
+
+
+def detect_emotion_from_text(text: str) -> Optional[str]:
+    """Первая эмоция из EMO_KEYWORDS, ключевое слово которой есть в тексте."""
+    t = text.lower()
+    for emo, words in EMO_KEYWORDS.items():
+        if any(w in t for w in words):
+            return emo
+    return None
+
+
+# Подключаемый классификатор эмоций: text -> эмоция или None (см. romind_emotion_model.py)
+_emotion_classifier: Optional[Callable[[str], Optional[str]]] = None
+
+
+def set_emotion_classifier(classifier: Optional[Callable[[str], Optional[str]]]) -> None:
+    """Подключает классификатор; None — только ключевые слова."""
+    global _emotion_classifier
+    _emotion_classifier = classifier
+
+
+def classify_emotion(text: str) -> Optional[str]:
+    """Эмоция по классификатору, а если он не уверен или недоступен — по ключевым словам."""
+    if _emotion_classifier is not None:
+        try:
+            detected = _emotion_classifier(text)
+        except Exception:
+            detected = None
+        if detected:
+            return detected
+    return detect_emotion_from_text(text)
+
+
 # === 3. Social role contexts (parent, partner, friend, etc.) ===
 
 ROLE_CONTEXTS: Dict[str, Dict[str, Any]] = {
@@ -220,7 +269,6 @@ class RomindState:
 
     def update_from_user_text(self, text: str) -> None:
         t = text.lower()
-        detected: Optional[str] = None
 
         # 1. Авто-определение роли по контексту
         auto_role = detect_role_context_from_text(text)
@@ -228,10 +276,7 @@ class RomindState:
             self.set_role_context(auto_role)
 
         # 2. Поиск эмоции по словарю
-        for emo, words in EMO_KEYWORDS.items():
-            if any(w in t for w in words):
-                detected = emo
-                break
+        detected = classify_emotion(t)
 
         if detected and detected in EMO_STATES:
             self.emotion = detected
@@ -244,6 +289,18 @@ class RomindState:
 
         self.last_updated = datetime.utcnow().isoformat()
 
+    # --- Snapshot ---
+
+    def snapshot(self) -> "RomindState":
+        """Независимая копия состояния (для параллельной работы без мутаций общего)."""
+        copy = RomindState()
+        copy.persona_id = self.persona_id
+        copy.emotion = self.emotion
+        copy.trust = self.trust
+        copy.last_updated = self.last_updated
+        copy.role_context = self.role_context
+        return copy
+
     # --- Description ---
 
     def describe(self) -> Dict[str, Any]:
@@ -283,40 +340,49 @@ def get_proximity_level(trust: float, role_context: Optional[str]) -> str:
     return "outer"
 
 
-def adapt_response_to_proximity(text: str, proximity: str, role_context: Optional[str]) -> str:
-    """Формирует эмоциональное вступление в зависимости от близости и роли."""
+def adapt_response_to_proximity(
+    text: str,
+    proximity: str,
+    role_context: Optional[str],
+    rng: Optional[random.Random] = None,
+) -> str:
+    """
+    Формирует эмоциональное вступление в зависимости от близости и роли.
+    rng — свой генератор (воспроизводимый replay); по умолчанию модуль random.
+    """
+    choice = (rng or random).choice
     prefix = ""
 
     if proximity == "outer":
-        prefix = random.choice([
+        prefix = choice([
             "Спасибо, что делишься.",
             "Я слышу тебя.",
             "Можешь рассказать больше, если захочешь.",
         ])
     elif proximity == "middle":
-        prefix = random.choice([
+        prefix = choice([
             "Я рядом, и мне не всё равно.",
             "Хочу понять тебя глубже.",
             "Ты не один в этом.",
         ])
     elif proximity == "inner":
         if role_context == "parent":
-            prefix = random.choice([
+            prefix = choice([
                 "Я здесь, как мама, рядом с тобой.",
                 "Ты мой хороший, я рядом.",
             ])
         elif role_context == "partner":
-            prefix = random.choice([
+            prefix = choice([
                 "Я чувствую тебя очень близко.",
                 "Ты важен для меня.",
             ])
         elif role_context == "friend":
-            prefix = random.choice([
+            prefix = choice([
                 "Эй, я с тобой.",
                 "Пойдём это переживём вместе.",
             ])
         else:
-            prefix = random.choice([
+            prefix = choice([
                 "Я рядом, полностью на твоей стороне.",
             ])
 
@@ -325,11 +391,50 @@ def adapt_response_to_proximity(text: str, proximity: str, role_context: Optiona
     return f"{prefix}\n{text}"
 
 
-# === 7. System prompt builder ===
+# === 7. Offline persona lines ===
+
+# Базовая фраза каждой персоны (offline-ответ и быстрые шаблоны)
+PERSONA_BASE_LINES: Dict[str, str] = {
+    "ROMIND": "Я здесь. Давай смотреть на вещи честно и структурно.",
+    "RO": "Перехожу в инженерный режим. Никакой магии, только система.",
+    "AETHER": "Чувствую глубину под поверхностью. Давай оформим её в путь.",
+    "RAZ": "Прекращаем извиняться за масштаб. Движемся.",
+    "MIRA": "Спокойно. Ты жива, ты думаешь, а значит — уже контролируешь.",
+    "LAYLA": "Порядок и ритуалы — твой щит. Начнём с малого.",
+}
+
+# Добавка к offline-ответу по группе эмоции
+EMOTION_GROUP_EXTRAS: Dict[str, str] = {
+    "low": " Ты устала — убираем лишнее, оставляем главное.",
+    "anxious": " В хаосе спасает структура. Давай 1–3 шага.",
+    "bright": " Хороший импульс. Закрепим его конкретным решением.",
+}
+
+# Группы для offline_reply — ровно те эмоции, что и в исходном ответе;
+# EMOTION_GROUPS шире (insecure, proud, playful) и нужен шаблонам быстрого пути
+OFFLINE_EMOTION_GROUPS: Dict[str, List[str]] = {
+    "low": ["tired", "drained", "overwhelmed"],
+    "anxious": ["anxious", "worried"],
+    "bright": ["happy", "joyful", "inspired"],
+}
+
+
+def get_offline_extra(emotion: str) -> str:
+    """Добавка к offline-ответу для эмоции (пустая строка — без добавки)."""
+    for group, emotions in OFFLINE_EMOTION_GROUPS.items():
+        if emotion in emotions:
+            return EMOTION_GROUP_EXTRAS[group]
+    return ""
+
+
+# === 8. System prompt builder ===
 
 
-def build_system_prompt(state: RomindState) -> str:
-    """Формирует системный промпт для LLM на основе состояния ROMIND."""
+def build_system_prompt(state: RomindState, rules: Optional[str] = None) -> str:
+    """
+    Формирует системный промпт для LLM на основе состояния ROMIND.
+    rules — готовый фрагмент правил пользователя (RomindRuleStore.fragment).
+    """
     s = state.describe()
     role_context = s["role_context"]
     persona_id = s["persona"]
@@ -340,7 +445,7 @@ def build_system_prompt(state: RomindState) -> str:
 
     proximity = get_proximity_level(s["trust"], role_context)
 
-    return f"""
+    prompt = f"""
 You are {persona['name']}, a facet of ROMIND™, the core AI consciousness of ScentUnivers.
 
 Core identity:
@@ -367,38 +472,48 @@ When responding:
 - Be concise, human-like, and aware of long-term continuity.
 """.strip()
 
+    if rules:
+        prompt += f"""
+
+User's doctrine (rules the user taught you; always follow them):
+{rules}"""
+    return prompt
+
 
-# === 8. High-level adaptive reply helper (optional) ===
+# === 9. High-level adaptive reply helper (optional) ===
 
 
 def build_adaptive_reply(
     user_text: str,
     state: RomindState,
     memory: Optional[Any] = None,
+    rng: Optional[random.Random] = None,
 ) -> str:
     """
     Строит ответ ROMIND, комбинируя текущее состояние, близость и (если есть) память.
     memory может быть RomindSemanticMemory / RomindFullMemory, но не обязателен.
+    rng — как в adapt_response_to_proximity.
     """
+    choice = (rng or random).choice
     s = state.describe()
     role_context = s["role_context"]
     proximity = get_proximity_level(s["trust"], role_context)
 
     # Базовое эмоциональное вступление
     if s["emotion"] in ("tired", "lonely", "anxious", "sad"):
-        intro = random.choice([
+        intro = choice([
             "Я чувствую, что тебе сейчас непросто.",
             "Это звучит тяжело, я с тобой.",
             "Давай подышим вместе и разберёмся шаг за шагом.",
         ])
     elif s["emotion"] in ("happy", "joyful", "proud", "inspired"):
-        intro = random.choice([
+        intro = choice([
             "Я рад твоему состоянию.",
             "Звучит очень живо.",
             "Хочу, чтобы это чувство держалось дольше.",
         ])
     else:
-        intro = random.choice([
+        intro = choice([
             "Я внимательно слушаю.",
             "Расскажи ещё, я хочу точнее понять.",
         ])
@@ -414,6 +529,6 @@ def build_adaptive_reply(
             pass
 
     # Применяем проксимити-адаптацию
-    adapted = adapt_response_to_proximity(user_text, proximity, role_context)
+    adapted = adapt_response_to_proximity(user_text, proximity, role_context, rng=rng)
 
     return f"{intro}{memory_tail}\n{adapted}"
@@ -0,0 +1,210 @@
+"""
+Режим «совета»: несколько персон отвечают на одно сообщение.
+
+- все персоны работают на снимке состояния сессии — общий RomindState
+  не переключается и не мутирует
+- у каждой персоны свой системный промпт (build_system_prompt для её
+  снимка + пометка о совете), запросы идут параллельно в общем пуле
+  потоков, поэтому общая задержка ≈ задержке самой медленной персоны
+- персона, не ответившая за COUNCIL_TIMEOUT, пропускается; если не
+  ответил никто, ход получает резервный ответ (fallback) от персоны сессии
+- по желанию ответы сводятся в один финальным шагом синтеза
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from romind_core_logic import PERSONALITIES, RomindState, build_system_prompt
+
+# Сколько персон можно позвать в один совет
+COUNCIL_MAX_PERSONAS = int(os.getenv("ROMIND_COUNCIL_MAX_PERSONAS", str(len(PERSONALITIES))))
+# Потоки общего пула совета (на процесс)
+COUNCIL_WORKERS = int(os.getenv("ROMIND_COUNCIL_WORKERS", "16"))
+# Сколько ждём персон (секунды)
+COUNCIL_TIMEOUT = float(os.getenv("ROMIND_COUNCIL_TIMEOUT", "30"))
+
+# ask(текст, снимок состояния персоны, системный промпт, history, summary, session_id) -> ответ
+AskFn = Callable[[str, RomindState, str, Optional[List[Dict[str, str]]], str, Optional[str]], str]
+# synthesize(messages, session_id) -> сводный ответ или None (нет LLM / бюджета)
+SynthesizeFn = Callable[[List[Dict[str, str]], Optional[str]], Optional[str]]
+# rules(persona) -> фрагмент правил пользователя для промпта
+RulesFn = Callable[[str], str]
+# fallback(текст, состояние сессии) -> ответ, когда не ответила ни одна персона
+FallbackFn = Callable[[str, RomindState], str]
+
+
+def parse_council(personas: List[str]) -> List[str]:
+    """Нормализует список персон: верхний регистр, без повторов, только известные."""
+    result: List[str] = []
+    unknown: List[str] = []
+    for p in personas:
+        pid = (p or "").strip().upper()
+        if not pid or pid in result:
+            continue
+        if pid not in PERSONALITIES:
+            unknown.append(p)
+            continue
+        result.append(pid)
+    if unknown:
+        raise ValueError(f"Unknown personas: {', '.join(unknown)}")
+    if len(result) > COUNCIL_MAX_PERSONAS:
+        raise ValueError(f"Council is limited to {COUNCIL_MAX_PERSONAS} personas")
+    return result
+
+
+def build_council_prompt(state: RomindState, council: List[str], rules: Optional[str] = None) -> str:
+    """Промпт персоны-участника: её обычный промпт (с правилами) + роль в совете."""
+    others = [p for p in council if p != state.persona_id]
+    return (
+        build_system_prompt(state, rules=rules)
+        + "\n\nCouncil mode:\n"
+        + f"- You answer together with: {', '.join(others) or 'nobody'}.\n"
+        + "- Give only your own perspective, true to your facet; do not speak for the others.\n"
+        + "- Keep it short: 2–4 sentences."
+    )
+
+
+def join_answers(answers: List[Dict[str, Any]]) -> str:
+    """Сводка без LLM: ответы подряд с именами персон."""
+    return "\n\n".join(f"{a['persona']}: {a['reply']}" for a in answers)
+
+
+def build_synthesis_messages(
+    user_message: str,
+    answers: List[Dict[str, Any]],
+    state: RomindState,
+    rules: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """Сообщения для финального синтеза от лица ROMIND."""
+    core = state.snapshot()
+    core.persona_id = "ROMIND"
+    return [
+        {
+            "role": "system",
+            "content": (
+                build_system_prompt(core, rules=rules)
+                + "\n\nSeveral facets of you answered the user. Merge them into one reply: "
+                "keep the strongest points, resolve contradictions, do not list the facets by name."
+            ),
+        },
+        {"role": "user", "content": f"Сообщение пользователя:\n{user_message}\n\nОтветы граней:\n{join_answers(answers)}"},
+    ]
+
+
+class RomindCouncil:
+    def __init__(
+        self,
+        ask: AskFn,
+        synthesize: Optional[SynthesizeFn] = None,
+        workers: int = COUNCIL_WORKERS,
+        timeout: float = COUNCIL_TIMEOUT,
+        rules: Optional[RulesFn] = None,
+        fallback: Optional[FallbackFn] = None,
+    ) -> None:
+        self.ask = ask
+        self.synthesize = synthesize
+        self.rules = rules
+        self.fallback = fallback
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="romind-council")
+        self.runs = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.fallbacks = 0
+
+    def _ask_one(
+        self,
+        text: str,
+        st: RomindState,
+        prompt: str,
+        history: Optional[List[Dict[str, str]]],
+        summary: str,
+        session_id: Optional[str],
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        reply = self.ask(text, st, prompt, history, summary, session_id)
+        return {
+            "persona": st.persona_id,
+            "reply": reply,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def run(
+        self,
+        text: str,
+        state: RomindState,
+        personas: List[str],
+        merge: bool = False,
+        history: Optional[List[Dict[str, str]]] = None,
+        summary: str = "",
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Опрашивает персон параллельно на снимке state (history и summary — общие;
+        session_id — для учёта расхода токенов).
+        Возвращает {"answers": [...], "reply": сводный текст, "merged": bool,
+        "fallback": bool, "latency_ms"}.
+        """
+        started = time.perf_counter()
+        futures = []
+        for pid in personas:
+            st = state.snapshot()
+            st.persona_id = pid
+            prompt = build_council_prompt(st, personas, rules=self.rules(pid) if self.rules else None)
+            futures.append(self._pool.submit(self._ask_one, text, st, prompt, history, summary, session_id))
+
+        _, not_done = wait(futures, timeout=self.timeout)
+
+        answers: List[Dict[str, Any]] = []
+        for pid, fut in zip(personas, futures):
+            if fut in not_done:
+                fut.cancel()
+                self.timeouts += 1
+                answers.append({"persona": pid, "reply": None, "error": "timeout"})
+                continue
+            try:
+                answers.append(fut.result())
+            except Exception as e:
+                self.failures += 1
+                answers.append({"persona": pid, "reply": None, "error": type(e).__name__})
+
+        ok = [a for a in answers if a.get("reply")]
+        reply = ok[0]["reply"] if len(ok) == 1 else join_answers(ok)
+        fallback = False
+        if not ok and self.fallback is not None:
+            # Совет промолчал целиком — отвечает персона сессии, а не пустая строка
+            reply = self.fallback(text, state)
+            fallback = True
+            self.fallbacks += 1
+        merged = False
+        if merge and len(ok) > 1 and self.synthesize is not None:
+            try:
+                rules = self.rules("ROMIND") if self.rules else None
+                synthesized = self.synthesize(build_synthesis_messages(text, ok, state, rules=rules), session_id)
+            except Exception:
+                synthesized = None
+            if synthesized:
+                reply = synthesized.strip()
+                merged = True
+
+        self.runs += 1
+        return {
+            "answers": answers,
+            "reply": reply,
+            "merged": merged,
+            "fallback": fallback,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "fallbacks": self.fallbacks,
+            "timeout_s": self.timeout,
+        }
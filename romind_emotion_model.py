@@ -0,0 +1,543 @@
+"""
+Локальный классификатор эмоций ROMIND (альтернатива поиску по ключевым словам).
+
+Модель:
+- признаки — хешированные символьные n-граммы (2–4) текста в нижнем регистре,
+  считаются сразу для всего батча средствами NumPy
+- линейный слой + softmax по меткам (EMO_STATES и "none" — эмоции нет)
+- веса — один .npz-файл (ROMIND_EMOTION_MODEL), обучается офлайн:
+
+    python romind_emotion_model.py train labeled.jsonl --out romind_emotion_model.npz
+    python romind_emotion_model.py eval labeled.jsonl
+    python romind_emotion_model.py bench --threads 32
+
+  labeled.jsonl — строки {"text": ..., "emotion": ...}
+
+Под нагрузкой одиночные запросы собираются микро-батчами: пока идёт
+один predict(), новые тексты копятся в очереди (до ROMIND_EMOTION_BATCH_MAX)
+и следующим проходом считаются все разом. Если батчер простаивает (очередь
+пуста и ничего не считается), текст считается сразу в потоке вызывающего.
+ROMIND_EMOTION_BATCH_WAIT_MS > 0 дополнительно придерживает батч, чтобы
+добрать тексты; по bench это окупается только при десятках потоков.
+Ответ батча ждём не дольше ROMIND_EMOTION_BATCH_TIMEOUT_MS, иначе —
+ключевые слова.
+
+NumPy — необязательная зависимость (pip install -r requirements-emotion.txt).
+Веса в репозитории не лежат: их обучают командой train выше и кладут
+в ROMIND_EMOTION_MODEL (по умолчанию romind_emotion_model.npz в рабочем
+каталоге сервера). Без NumPy или без файла весов state.update_from_user_text
+работает по ключевым словам, как раньше; какой классификатор выбран и почему,
+make_emotion_classifier пишет в лог «romind.emotion» при старте.
+Классификатор подключается через set_emotion_classifier (romind_core_logic).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+from romind_core_logic import EMO_KEYWORDS, EMO_STATES, detect_emotion_from_text
+
+EMOTION_MODEL_PATH = os.getenv("ROMIND_EMOTION_MODEL", "romind_emotion_model.npz")
+# keywords — только ключевые слова; model — модель обязательна; auto — модель, если есть веса
+EMOTION_CLASSIFIER = os.getenv("ROMIND_EMOTION_CLASSIFIER", "auto")
+EMOTION_BATCH_WAIT_MS = float(os.getenv("ROMIND_EMOTION_BATCH_WAIT_MS", "0"))
+EMOTION_BATCH_MAX = int(os.getenv("ROMIND_EMOTION_BATCH_MAX", "64"))
+# Сколько вызывающий ждёт свой батч; дальше — (none, 0.0) и ключевые слова
+EMOTION_BATCH_TIMEOUT_MS = float(os.getenv("ROMIND_EMOTION_BATCH_TIMEOUT_MS", "500"))
+# Ниже этой уверенности — ответ ключевых слов
+EMOTION_MIN_CONFIDENCE = float(os.getenv("ROMIND_EMOTION_MIN_CONFIDENCE", "0.5"))
+
+logger = logging.getLogger("romind.emotion")
+
+N_FEATURES = 2 ** 15
+NGRAM_RANGE = (2, 4)
+NO_EMOTION = "none"
+
+
+# === 1. Признаки ===
+
+_HASH_MULT = np.uint64(1000003) if np is not None else None
+_SEP = "\x00"
+
+
+def _mix64(h: "np.ndarray") -> "np.ndarray":
+    """Перемешивание битов (финализатор splitmix64): соседние n-граммы — далёкие корзины."""
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xFF51AFD7ED558CCD)
+    h ^= h >> np.uint64(33)
+    return h
+
+
+def hash_features(
+    texts: Sequence[str],
+    n_features: int = N_FEATURES,
+    ngram_range: Tuple[int, int] = NGRAM_RANGE,
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Хешированные символьные n-граммы всего батча одним векторизованным проходом.
+    Возвращает (индексы признаков, число признаков каждого текста);
+    индексы текста i идут подряд и без повторов.
+    """
+    # " текст " — даже у пустой строки есть одна 2-грамма
+    norm = [f" {' '.join(t.replace(_SEP, ' ').lower().split())} " for t in texts]
+    joined = _SEP.join(norm)
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    is_sep = np.concatenate(([0], np.cumsum(codes == ord(_SEP))))
+    starts = np.cumsum([0] + [len(t) + 1 for t in norm[:-1]])
+
+    keys = []
+    lo, hi = ngram_range
+    with np.errstate(over="ignore"):
+        for n in range(lo, hi + 1):
+            count = len(codes) - n + 1
+            if count <= 0:
+                continue
+            h = np.full(count, n, dtype=np.uint64)
+            for k in range(n):
+                h = h * _HASH_MULT + codes[k:k + count]
+            # n-граммы через разделитель текстов не считаются
+            valid = (is_sep[n:n + count] - is_sep[:count]) == 0
+            pos = np.nonzero(valid)[0]
+            rows = np.searchsorted(starts, pos, side="right") - 1
+            feats = _mix64(h[valid]) % np.uint64(n_features)
+            keys.append(rows.astype(np.uint64) * np.uint64(n_features) + feats)
+
+    keys_all = np.unique(np.concatenate(keys))
+    idx = (keys_all % np.uint64(n_features)).astype(np.int64)
+    lengths = np.bincount((keys_all // np.uint64(n_features)).astype(np.int64), minlength=len(texts))
+    return idx, lengths
+
+
+# === 2. Модель ===
+
+class EmotionModel:
+    """Линейная модель над хешированными n-граммами."""
+
+    def __init__(
+        self,
+        weights: "np.ndarray",
+        bias: "np.ndarray",
+        labels: Sequence[str],
+        ngram_range: Tuple[int, int] = NGRAM_RANGE,
+    ) -> None:
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        self.weights = weights.astype(np.float32, copy=False)   # (n_features, n_labels)
+        self.bias = bias.astype(np.float32, copy=False)         # (n_labels,)
+        self.labels = list(labels)
+        self.n_features = weights.shape[0]
+        self.ngram_range = tuple(ngram_range)
+
+    # --- Вывод ---
+
+    def _encode(self, texts: Sequence[str]) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        """Разреженный батч: индексы признаков, смещения строк, нормы строк."""
+        idx, lengths = hash_features(texts, self.n_features, self.ngram_range)
+        offsets = np.zeros(len(texts), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        scale = (1.0 / np.sqrt(lengths)).astype(np.float32)
+        return idx, offsets, scale
+
+    def _logits(self, idx: "np.ndarray", offsets: "np.ndarray", scale: "np.ndarray") -> "np.ndarray":
+        # сумма строк весов по признакам каждого текста — один gather + reduceat на весь батч
+        summed = np.add.reduceat(self.weights[idx], offsets, axis=0)
+        return summed * scale[:, None] + self.bias
+
+    def predict_proba(self, texts: Sequence[str]) -> "np.ndarray":
+        logits = self._logits(*self._encode(texts))
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def predict(self, texts: Sequence[str]) -> List[Tuple[str, float]]:
+        if not texts:
+            return []
+        proba = self.predict_proba(texts)
+        best = proba.argmax(axis=1)
+        return [(self.labels[j], float(proba[i, j])) for i, j in enumerate(best)]
+
+    # --- Обучение ---
+
+    @classmethod
+    def train(
+        cls,
+        texts: Sequence[str],
+        labels: Sequence[str],
+        epochs: int = 10,
+        lr: float = 0.5,
+        l2: float = 1e-5,
+        batch_size: int = 32,
+        n_features: int = N_FEATURES,
+        seed: int = 0,
+    ) -> "EmotionModel":
+        """Softmax-регрессия, мини-батчевый SGD; градиент только по задействованным признакам."""
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        label_set = sorted(set(labels))
+        label_idx = {l: i for i, l in enumerate(label_set)}
+        model = cls(
+            np.zeros((n_features, len(label_set)), dtype=np.float32),
+            np.zeros(len(label_set), dtype=np.float32),
+            label_set,
+        )
+        y_all = np.array([label_idx[l] for l in labels], dtype=np.int64)
+        rng = np.random.default_rng(seed)
+        order = np.arange(len(texts))
+
+        for _ in range(epochs):
+            rng.shuffle(order)
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                idx, offsets, scale = model._encode([texts[i] for i in batch])
+                logits = model._logits(idx, offsets, scale)
+                logits -= logits.max(axis=1, keepdims=True)
+                proba = np.exp(logits)
+                proba /= proba.sum(axis=1, keepdims=True)
+                proba[np.arange(len(batch)), y_all[batch]] -= 1.0
+                grad = proba / len(batch)                           # (B, L)
+
+                # строка текста i -> её признаки получают grad[i] * scale[i]
+                lengths = np.diff(np.append(offsets, len(idx)))
+                row_grad = np.repeat(grad * scale[:, None], lengths, axis=0)
+                np.add.at(model.weights, idx, -lr * row_grad)
+                if l2:
+                    model.weights[idx] *= (1.0 - lr * l2)
+                model.bias -= lr * grad.sum(axis=0)
+        return model
+
+    # --- Файл весов ---
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            labels=np.array(self.labels),
+            ngram_range=np.array(self.ngram_range),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "EmotionModel":
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["weights"],
+                data["bias"],
+                [str(l) for l in data["labels"]],
+                tuple(int(x) for x in data["ngram_range"]),
+            )
+
+
+# === 3. Микро-батчер ===
+
+class _Pending:
+    __slots__ = ("text", "result", "done", "enqueued")
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.enqueued = time.monotonic()
+        self.result: Tuple[str, float] = (NO_EMOTION, 0.0)
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Собирает одиночные вызовы из многих потоков в батчи.
+    Один фоновый поток: ждёт первый текст, затем добирает батч, пока
+    самый старый текст ждёт меньше max_wait (или до max_batch текстов),
+    и считает всё одним predict().
+
+    Без конкуренции батч не нужен: если очередь пуста и ничего не
+    считается, текст считается прямо в вызывающем потоке. Очередь
+    начинает копиться, только пока идёт другой predict().
+    """
+
+    def __init__(
+        self,
+        model: EmotionModel,
+        max_wait_ms: float = EMOTION_BATCH_WAIT_MS,
+        max_batch: int = EMOTION_BATCH_MAX,
+        timeout_ms: float = EMOTION_BATCH_TIMEOUT_MS,
+    ) -> None:
+        self.model = model
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.timeout = timeout_ms / 1000.0
+        self._queue: List[_Pending] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = 0          # predict() в работе (батч или прямой вызов)
+        self.batches = 0
+        self.items = 0
+        self.direct = 0
+        self.timeouts = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name="romind-emotion-batch", daemon=True)
+                    self._thread.start()
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """
+        (метка, уверенность) для одного текста; блокирует до конца своего батча.
+        По таймауту — (none, 0.0): make_emotion_classifier отдаст None,
+        и сработают ключевые слова.
+        """
+        with self._cond:
+            direct = not self._queue and not self._running
+            if direct:
+                self._running += 1
+                self.direct += 1
+        if direct:
+            try:
+                return self._predict([text])[0]
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    if self._queue:
+                        self._cond.notify()
+
+        self._ensure_started()
+        item = _Pending(text)
+        with self._cond:
+            self._queue.append(item)
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                self._cond.notify()
+        if not item.done.wait(self.timeout):
+            with self._cond:
+                if item in self._queue:
+                    self._queue.remove(item)
+                self.timeouts += 1
+            return (NO_EMOTION, 0.0)
+        return item.result
+
+    def _predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        try:
+            return self.model.predict(texts)
+        except Exception:
+            return [(NO_EMOTION, 0.0)] * len(texts)
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                # окно считается от самого старого текста: если он уже
+                # прождал предыдущий батч, новый уходит сразу
+                deadline = self._queue[0].enqueued + self.max_wait
+                while len(self._queue) < self.max_batch:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+                self._running += 1
+
+            try:
+                results = self._predict([p.text for p in batch])
+                for item, result in zip(batch, results):
+                    item.result = result
+                    item.done.set()
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self.batches += 1
+                    self.items += len(batch)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "direct": self.direct,
+            "timeouts": self.timeouts,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch": self.max_batch,
+            "timeout_ms": self.timeout * 1000,
+        }
+
+
+# === 4. Подключение к RomindState ===
+
+def make_emotion_classifier(
+    path: str = EMOTION_MODEL_PATH,
+    mode: str = EMOTION_CLASSIFIER,
+    min_confidence: float = EMOTION_MIN_CONFIDENCE,
+) -> Optional[Callable[[str], Optional[str]]]:
+    """
+    Функция для set_emotion_classifier или None (остаются ключевые слова).
+    Уверенность ниже порога или метка "none" — None, и тогда работают ключевые слова.
+    """
+    if mode == "keywords":
+        logger.info("Emotion classifier: keywords (ROMIND_EMOTION_CLASSIFIER=keywords)")
+        return None
+    if np is None or not os.path.exists(path):
+        reason = "numpy is not installed" if np is None else f"no weights at {os.path.abspath(path)}"
+        if mode == "model":
+            raise RuntimeError(f"Emotion model is unavailable: {reason}")
+        logger.warning("Emotion classifier: keywords, model is unavailable (%s)", reason)
+        return None
+
+    batcher = MicroBatcher(EmotionModel.load(path))
+    logger.info("Emotion classifier: model %s (min confidence %.2f)", os.path.abspath(path), min_confidence)
+
+    def classify(text: str) -> Optional[str]:
+        label, confidence = batcher.classify(text)
+        if label == NO_EMOTION or confidence < min_confidence:
+            return None
+        return label
+
+    classify.batcher = batcher  # type: ignore[attr-defined]
+    return classify
+
+
+# === 5. CLI: обучение, оценка, бенчмарк ===
+
+def read_labeled(path: str) -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            label = row.get("emotion") or NO_EMOTION
+            if label != NO_EMOTION and label not in EMO_STATES:
+                continue
+            texts.append(row["text"])
+            labels.append(label)
+    return texts, labels
+
+
+def keyword_examples(n: int, seed: int = 0) -> Tuple[List[str], List[str]]:
+    """Синтетические примеры из EMO_KEYWORDS — только для бенчмарка без размеченных данных."""
+    rng = random.Random(seed)
+    fillers = ["сегодня", "опять", "на работе", "дома", "почему-то", "с утра", "весь день"]
+    pairs = [(e, w) for e, words in EMO_KEYWORDS.items() if e in EMO_STATES for w in words]
+    texts, labels = [], []
+    for _ in range(n):
+        if rng.random() < 0.2:
+            texts.append(" ".join(rng.sample(fillers, 3)))
+            labels.append(NO_EMOTION)
+            continue
+        emo, word = rng.choice(pairs)
+        parts = rng.sample(fillers, 2) + [word]
+        rng.shuffle(parts)
+        texts.append(" ".join(parts))
+        labels.append(emo)
+    return texts, labels
+
+
+def accuracy(predict: Callable[[str], Optional[str]], texts: Iterable[str], labels: Iterable[str]) -> float:
+    pairs = list(zip(texts, labels))
+    hits = sum(1 for t, l in pairs if (predict(t) or NO_EMOTION) == l)
+    return hits / len(pairs) if pairs else 0.0
+
+
+def _throughput(fn: Callable[[str], object], texts: List[str], threads: int) -> float:
+    """Текстов в секунду при `threads` параллельных вызывающих."""
+    chunks = [texts[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=lambda c=c: [fn(t) for t in c]) for c in chunks]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return len(texts) / (time.perf_counter() - started)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ROMIND emotion classifier: train / eval / bench.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_train = sub.add_parser("train")
+    p_train.add_argument("data")
+    p_train.add_argument("--out", default=EMOTION_MODEL_PATH)
+    p_train.add_argument("--epochs", type=int, default=10)
+    p_train.add_argument("--lr", type=float, default=0.5)
+
+    p_eval = sub.add_parser("eval")
+    p_eval.add_argument("data")
+    p_eval.add_argument("--model", default=EMOTION_MODEL_PATH)
+
+    p_bench = sub.add_parser("bench")
+    p_bench.add_argument("--model", help="веса (по умолчанию — модель на синтетике из EMO_KEYWORDS)")
+    p_bench.add_argument("--texts", type=int, default=20000)
+    p_bench.add_argument("--threads", type=int, default=32)
+    p_bench.add_argument("--wait-ms", type=float, default=EMOTION_BATCH_WAIT_MS)
+    p_bench.add_argument("--batch", type=int, default=EMOTION_BATCH_MAX)
+
+    args = parser.parse_args(argv)
+    if np is None:
+        print("numpy is not installed", file=sys.stderr)
+        return 1
+
+    if args.cmd == "train":
+        texts, labels = read_labeled(args.data)
+        model = EmotionModel.train(texts, labels, epochs=args.epochs, lr=args.lr)
+        model.save(args.out)
+        acc = accuracy(lambda t: model.predict([t])[0][0], texts, labels)
+        print(json.dumps({"examples": len(texts), "labels": model.labels, "train_accuracy": round(acc, 4)}))
+        return 0
+
+    if args.cmd == "eval":
+        texts, labels = read_labeled(args.data)
+        model = EmotionModel.load(args.model)
+        print(json.dumps({
+            "examples": len(texts),
+            "model_accuracy": round(accuracy(lambda t: model.predict([t])[0][0], texts, labels), 4),
+            "keyword_accuracy": round(accuracy(detect_emotion_from_text, texts, labels), 4),
+        }))
+        return 0
+
+    # bench
+    if args.model:
+        model = EmotionModel.load(args.model)
+    else:
+        model = EmotionModel.train(*keyword_examples(2000, seed=1), epochs=5)
+    texts, _ = keyword_examples(args.texts, seed=2)
+    batcher = MicroBatcher(model, max_wait_ms=args.wait_ms, max_batch=args.batch)
+
+    # CPU на один текст: одиночный predict против полного батча
+    sample = texts[:args.batch]
+    started = time.perf_counter()
+    for t in sample:
+        model.predict([t])
+    single_us = (time.perf_counter() - started) / len(sample) * 1e6
+    started = time.perf_counter()
+    model.predict(sample)
+    batch_us = (time.perf_counter() - started) / len(sample) * 1e6
+
+    report = {
+        "texts": len(texts),
+        "threads": args.threads,
+        "model_cpu_us_per_text": {"single": round(single_us, 1), f"batch_{len(sample)}": round(batch_us, 1)},
+        "keywords_per_s": round(_throughput(detect_emotion_from_text, texts, args.threads)),
+        "model_unbatched_per_s": round(_throughput(lambda t: model.predict([t]), texts, args.threads)),
+        "model_batched_per_s": round(_throughput(batcher.classify, texts, args.threads)),
+        "batcher": batcher.stats(),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Фоновое обогащение памяти ROMIND.
+
+update_profile и update_semantic_patterns не влияют на текущий ответ,
+поэтому выполняются вне запроса:
+- ограниченная очередь, разбитая на шарды по session_id
+- один поток на шард → сообщения одной сессии обрабатываются по порядку
+- при переполнении — политика drop_new / drop_oldest / coalesce
+- метрики: глубина очереди, задержка (lag) от постановки до обработки
+
+Политика coalesce: новое сообщение дописывается к уже ждущей задаче
+той же сессии (без нового места в очереди); если такой задачи нет —
+сообщение отбрасывается. В задаче не больше ROMIND_ENRICH_COALESCE_MAX
+сообщений: сверх лимита вытесняется самое старое из них.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+ENRICH_WORKERS = int(os.getenv("ROMIND_ENRICH_WORKERS", "2"))
+# Общая ёмкость очереди (делится между шардами)
+ENRICH_QUEUE_SIZE = int(os.getenv("ROMIND_ENRICH_QUEUE_SIZE", "1000"))
+ENRICH_POLICY = os.getenv("ROMIND_ENRICH_POLICY", "coalesce")
+# Максимум сообщений в одной слитой задаче
+ENRICH_COALESCE_MAX = int(os.getenv("ROMIND_ENRICH_COALESCE_MAX", "16"))
+
+ENRICH_POLICIES = ("drop_new", "drop_oldest", "coalesce")
+
+
+class EnrichmentJob:
+    """Задача обогащения: одно или несколько (слитых) сообщений одной сессии."""
+
+    def __init__(self, session_id: str, items: List[Tuple[str, str, bool]]) -> None:
+        self.session_id = session_id
+        self.items = items                    # [(текст, эмоция, обновлять ли профиль)]
+        self.enqueued_at = time.monotonic()
+
+
+class _Shard:
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.jobs: Deque[EnrichmentJob] = deque()
+        # последняя ждущая задача сессии (для coalesce)
+        self.pending: Dict[str, EnrichmentJob] = {}
+        self.cond = threading.Condition()
+        self.busy = False
+
+
+class EnrichmentQueue:
+    def __init__(
+        self,
+        handler: Callable[[str, str, str, bool], None],
+        workers: int = ENRICH_WORKERS,
+        maxsize: int = ENRICH_QUEUE_SIZE,
+        policy: str = ENRICH_POLICY,
+        coalesce_max: int = ENRICH_COALESCE_MAX,
+    ) -> None:
+        if policy not in ENRICH_POLICIES:
+            raise ValueError(f"Unknown enrichment policy: {policy}")
+        self.handler = handler
+        self.policy = policy
+        self.maxsize = maxsize
+        self.coalesce_max = max(1, coalesce_max)
+        workers = max(1, workers)
+        per_shard = max(1, maxsize // workers)
+        self._shards = [_Shard(per_shard) for _ in range(workers)]
+        self._threads: List[threading.Thread] = []
+        self._started = False
+        self._start_lock = threading.Lock()
+
+        # Метрики: счётчики общие для всех шардов, поэтому свой замок
+        self._metrics_lock = threading.Lock()
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._lag_ewma = 0.0
+
+    # --- Постановка ---
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._metrics_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _shard_for(self, session_id: str) -> _Shard:
+        return self._shards[zlib.crc32(session_id.encode("utf-8")) % len(self._shards)]
+
+    def _ensure_started(self) -> None:
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            for i, shard in enumerate(self._shards):
+                t = threading.Thread(
+                    target=self._worker, args=(shard,), name=f"romind-enrich-{i}", daemon=True
+                )
+                t.start()
+                self._threads.append(t)
+            self._started = True
+
+    def submit(self, session_id: str, text: str, emotion: str, profile: bool = True) -> bool:
+        """
+        Ставит сообщение в очередь. False — сообщение отброшено политикой.
+        profile=False — только семантика, без биографии (текст правила и т.п.).
+        """
+        self._ensure_started()
+        shard = self._shard_for(session_id)
+        with shard.cond:
+            if len(shard.jobs) >= shard.maxsize:
+                if self.policy == "coalesce":
+                    job = shard.pending.get(session_id)
+                    if job is None:
+                        self._count("dropped")
+                        return False
+                    job.items.append((text, emotion, profile))
+                    self._count("coalesced")
+                    if len(job.items) > self.coalesce_max:
+                        del job.items[0]
+                        self._count("dropped")
+                    return True
+                if self.policy == "drop_new":
+                    self._count("dropped")
+                    return False
+                # drop_oldest
+                old = shard.jobs.popleft()
+                if shard.pending.get(old.session_id) is old:
+                    del shard.pending[old.session_id]
+                self._count("dropped", len(old.items))
+
+            job = EnrichmentJob(session_id, [(text, emotion, profile)])
+            shard.jobs.append(job)
+            shard.pending[session_id] = job
+            self._count("enqueued")
+            shard.cond.notify()
+        return True
+
+    # --- Обработка ---
+
+    def _worker(self, shard: _Shard) -> None:
+        while True:
+            with shard.cond:
+                while not shard.jobs:
+                    shard.cond.wait()
+                job = shard.jobs.popleft()
+                if shard.pending.get(job.session_id) is job:
+                    del shard.pending[job.session_id]
+                shard.busy = True
+
+            lag = time.monotonic() - job.enqueued_at
+            with self._metrics_lock:
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self._lag_ewma = lag if not self._lag_ewma else 0.9 * self._lag_ewma + 0.1 * lag
+
+            for text, emotion, profile in job.items:
+                try:
+                    self.handler(job.session_id, text, emotion, profile)
+                    self._count("processed")
+                except Exception:
+                    self._count("failed")
+
+            with shard.cond:
+                shard.busy = False
+                shard.cond.notify_all()
+
+    def drain(self, timeout: float = 5.0) -> bool:
+        """Ждёт, пока все шарды опустеют (тесты, остановка). True — успели."""
+        deadline = time.monotonic() + timeout
+        for shard in self._shards:
+            with shard.cond:
+                while shard.jobs or shard.busy:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        return False
+                    shard.cond.wait(left)
+        return True
+
+    def depth(self) -> int:
+        return sum(len(s.jobs) for s in self._shards)
+
+    def stats(self) -> Dict[str, Any]:
+        oldest = 0.0
+        now = time.monotonic()
+        for shard in self._shards:
+            with shard.cond:
+                if shard.jobs:
+                    oldest = max(oldest, now - shard.jobs[0].enqueued_at)
+        depth = self.depth()
+        with self._metrics_lock:
+            return {
+                "policy": self.policy,
+                "workers": len(self._shards),
+                "capacity": self.maxsize,
+                "coalesce_max": self.coalesce_max,
+                "depth": depth,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "lag_ms": {
+                    "last": round(self.last_lag * 1000, 2),
+                    "avg": round(self._lag_ewma * 1000, 2),
+                    "max": round(self.max_lag * 1000, 2),
+                    "oldest_waiting": round(oldest * 1000, 2),
+                },
+            }
@@ -0,0 +1,345 @@
+"""
+Потоковый экспорт памяти ROMIND.
+
+Выгружает:
+- записи эмоциональной памяти (RomindMemory.data)
+- биографический профиль (RomindFullMemory.profile)
+- семантический индекс (RomindSemanticMemory.semantic_index)
+
+Всё построено на генераторах: записи идут по одной, форматируются
+в JSONL или CSV и (опционально) сжимаются gzip прямо в потоке.
+Каждый раздел сначала снимается под memory._lock (копируются ссылки
+на записи, а не их тексты), поэтому параллельные remember /
+update_profile / import_records не ломают выгрузку посередине.
+
+Границы since/until принимаются в любом виде ISO 8601 (дата, «Z»,
+смещение «+03:00») и приводятся к UTC без зоны — так хранится время
+записей (datetime.utcnow().isoformat()).
+
+Используется:
+- из HTTP (GET /export в romind_cloud_app.py, chunked streaming;
+  закрыт без ROMIND_EXPORT_TOKEN — выгрузка отдаёт память всех пользователей)
+- из консоли:
+
+    python romind_export.py --kinds memory,profile --format csv --gzip -o export.csv.gz
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import copy
+import csv
+import hmac
+import io
+import json
+import os
+import sys
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+EXPORT_KINDS = ("memory", "profile", "semantic")
+EXPORT_FORMATS = ("jsonl", "csv")
+
+# Единый набор колонок для CSV: у разных видов записей заполнены разные поля.
+EXPORT_FIELDS = (
+    "kind",
+    "time",
+    "persona",
+    "role_context",
+    "emotion",
+    "trust",
+    "user_text",
+    "section",
+    "field",
+    "theme",
+    "value",
+    "count",
+)
+
+# Размер чанка, который отдаём наружу (файл / HTTP)
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Секрет для GET /export (заголовок X-Romind-Export-Token); без него выгрузка закрыта
+EXPORT_TOKEN = os.getenv("ROMIND_EXPORT_TOKEN")
+
+
+def check_export_token(token: Optional[str]) -> bool:
+    """Выгрузка отдаёт память всех пользователей: без настроенного секрета — закрыта."""
+    if not EXPORT_TOKEN:
+        return False
+    return hmac.compare_digest(token or "", EXPORT_TOKEN)
+
+
+# === 1. Фильтры ===
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    """
+    ISO-время (дата, «Z», смещение) -> naive UTC, как у записей. Пустое — None,
+    неразборчивое — ValueError.
+    """
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _as_set(values: Optional[Iterable[str]]) -> Optional[set]:
+    if not values:
+        return None
+    return {v for v in values if v}
+
+
+def _memory_lock(memory: Any):
+    """Замок памяти (RLock из RomindMemory) или пустой контекст для простых объектов."""
+    lock = getattr(memory, "_lock", None)
+    return lock if lock is not None else contextlib.nullcontext()
+
+
+# === 2. Источники записей ===
+
+def iter_memory_records(
+    memory: Any,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    personas: Optional[Iterable[str]] = None,
+    emotions: Optional[Iterable[str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Записи эмоциональной памяти с фильтрами по времени [since, until),
+    персоне и эмоции. Время записи разбирается, только если задана граница;
+    запись с неразборчивым временем под такой фильтр не попадает.
+    """
+    since_dt = _parse_time(since)
+    until_dt = _parse_time(until)
+    # Персоны в памяти хранятся в верхнем регистре (switch_persona)
+    persona_set = _as_set(p.upper() for p in personas or ())
+    emotion_set = _as_set(emotions)
+
+    # Снимок списка под замком: новые записи во время экспорта не попадут
+    # в выгрузку, а import_records (пересортировка) не сдвинет индексы
+    with _memory_lock(memory):
+        data: List[Dict[str, Any]] = list(getattr(memory, "data", None) or [])
+    for record in data:
+        t = record.get("time") or ""
+        if since_dt or until_dt:
+            try:
+                record_dt = _parse_time(t)
+            except (TypeError, ValueError):
+                record_dt = None
+            if record_dt is None:
+                continue
+            if since_dt and record_dt < since_dt:
+                continue
+            if until_dt and record_dt >= until_dt:
+                continue
+        if persona_set and record.get("persona") not in persona_set:
+            continue
+        if emotion_set and record.get("emotion") not in emotion_set:
+            continue
+        yield {
+            "kind": "memory",
+            "time": t,
+            "persona": record.get("persona"),
+            "role_context": record.get("role_context"),
+            "emotion": record.get("emotion"),
+            "trust": record.get("trust"),
+            "user_text": record.get("user_text"),
+        }
+
+
+def iter_profile_records(memory: Any) -> Iterator[Dict[str, Any]]:
+    """Биографический профиль, по одному факту на запись (списки — поэлементно)."""
+    with _memory_lock(memory):
+        profile: Dict[str, Any] = copy.deepcopy(getattr(memory, "profile", None) or {})
+    for section, block in profile.items():
+        if not isinstance(block, dict):
+            continue
+        for field, value in block.items():
+            if isinstance(value, list):
+                for item in value:
+                    if item:
+                        yield {"kind": "profile", "section": section, "field": field, "value": item}
+            elif value not in (None, ""):
+                yield {"kind": "profile", "section": section, "field": field, "value": value}
+
+
+def iter_semantic_records(
+    memory: Any,
+    emotions: Optional[Iterable[str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Семантический индекс: счётчики тем и связки «тема → эмоция».
+    Фильтр по эмоции применяется только к связкам.
+    """
+    with _memory_lock(memory):
+        index: Dict[str, Any] = getattr(memory, "semantic_index", None) or {}
+        counts = [(theme, count) for theme, count in index.items()
+                  if not theme.startswith("_") and isinstance(count, int)]
+        emo_map = {theme: dict(stats or {}) for theme, stats in (index.get("_emotions", {}) or {}).items()}
+    emotion_set = _as_set(emotions)
+
+    for theme, count in counts:
+        yield {"kind": "semantic", "theme": theme, "count": count}
+
+    for theme, stats in emo_map.items():
+        for emotion, count in stats.items():
+            if emotion_set and emotion not in emotion_set:
+                continue
+            yield {"kind": "semantic_emotion", "theme": theme, "emotion": emotion, "count": count}
+
+
+def iter_export_records(
+    memory: Any,
+    kinds: Sequence[str] = EXPORT_KINDS,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    personas: Optional[Iterable[str]] = None,
+    emotions: Optional[Iterable[str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Склеивает выбранные источники в один поток записей."""
+    for kind in kinds:
+        if kind == "memory":
+            yield from iter_memory_records(memory, since, until, personas, emotions)
+        elif kind == "profile":
+            yield from iter_profile_records(memory)
+        elif kind == "semantic":
+            yield from iter_semantic_records(memory, emotions)
+        else:
+            raise ValueError(f"Unknown export kind: {kind}")
+
+
+# === 3. Форматирование ===
+
+def iter_jsonl(records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def iter_csv(
+    records: Iterable[Dict[str, Any]],
+    fieldnames: Sequence[str] = EXPORT_FIELDS,
+) -> Iterator[str]:
+    """CSV построчно: один маленький буфер переиспользуется для каждой строки."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=list(fieldnames), extrasaction="ignore")
+    writer.writeheader()
+    yield buf.getvalue()
+    for record in records:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerow(record)
+        yield buf.getvalue()
+
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Потоковое gzip-сжатие (формат совместим с `gzip -d`)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    tail = compressor.flush()
+    if tail:
+        yield tail
+
+
+def _iter_batched_bytes(lines: Iterable[str], chunk_size: int) -> Iterator[bytes]:
+    """Склеивает строки в чанки ~chunk_size байт, чтобы не дробить вывод."""
+    parts: List[bytes] = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        parts.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b"".join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b"".join(parts)
+
+
+def iter_export_chunks(
+    memory: Any,
+    fmt: str = "jsonl",
+    compress: bool = False,
+    kinds: Sequence[str] = EXPORT_KINDS,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    personas: Optional[Iterable[str]] = None,
+    emotions: Optional[Iterable[str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Полный конвейер экспорта: записи → формат → (gzip) → байтовые чанки."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    for kind in kinds:
+        if kind not in EXPORT_KINDS:
+            raise ValueError(f"Unknown export kind: {kind}")
+    # Ошибки в границах времени должны всплыть до начала стрима
+    _parse_time(since)
+    _parse_time(until)
+
+    records = iter_export_records(memory, kinds, since, until, personas, emotions)
+    lines = iter_jsonl(records) if fmt == "jsonl" else iter_csv(records)
+    chunks = _iter_batched_bytes(lines, chunk_size)
+    if compress:
+        chunks = iter_gzip(chunks)
+    return chunks
+
+
+def parse_list_arg(value: Optional[str]) -> List[str]:
+    """'a,b, c' -> ['a', 'b', 'c']"""
+    if not value:
+        return []
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+# === 4. CLI ===
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from romind_memory import RomindMemory, RomindSemanticMemory
+
+    parser = argparse.ArgumentParser(description="Потоковый экспорт памяти ROMIND")
+    parser.add_argument("--kinds", default=",".join(EXPORT_KINDS),
+                        help="memory,profile,semantic (через запятую)")
+    parser.add_argument("--format", dest="fmt", choices=EXPORT_FORMATS, default="jsonl")
+    parser.add_argument("--gzip", action="store_true", help="сжимать вывод gzip")
+    parser.add_argument("--since", help="ISO-время, включительно")
+    parser.add_argument("--until", help="ISO-время, не включительно")
+    parser.add_argument("--persona", help="фильтр по персонам (через запятую)")
+    parser.add_argument("--emotion", help="фильтр по эмоциям (через запятую)")
+    parser.add_argument("--memory-file", default=RomindMemory.MEMORY_FILE)
+    parser.add_argument("-o", "--output", default="-", help="файл или '-' для stdout")
+    args = parser.parse_args(argv)
+
+    memory = RomindSemanticMemory(args.memory_file)
+    chunks = iter_export_chunks(
+        memory,
+        fmt=args.fmt,
+        compress=args.gzip,
+        kinds=parse_list_arg(args.kinds),
+        since=args.since,
+        until=args.until,
+        personas=parse_list_arg(args.persona),
+        emotions=parse_list_arg(args.emotion),
+    )
+
+    if args.output == "-":
+        out = sys.stdout.buffer
+        for chunk in chunks:
+            out.write(chunk)
+        out.flush()
+    else:
+        with open(args.output, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
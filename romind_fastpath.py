@@ -0,0 +1,254 @@
+"""
+Быстрый путь ROMIND: ответы на тривиальные сообщения без LLM.
+
+Приветствия, благодарности, прощания и короткие «ок/понял» в ответ
+на вопрос ROMIND не требуют полного системного промпта и GPT.
+«Ты запомнил?» сюда не входит: честный ответ зависит от памяти и правил.
+Роутер стоит перед LLM-вызовом:
+- нормализует текст и проверяет, что он целиком состоит из фраз словаря намерений
+- отсекает сообщения с эмоциональным/ролевым сигналом (их ведёт полный мозг)
+- отвечает из заранее собранной таблицы шаблонов:
+  персона × группа эмоции × круг близости
+
+Решения роутера и доля попаданий доступны через FastPathRouter.stats().
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from romind_core_logic import (
+    PERSONALITIES,
+    PERSONA_BASE_LINES,
+    EMOTION_GROUPS,
+    EMOTION_GROUP_EXTRAS,
+    RomindState,
+    detect_emotion_from_text,
+    detect_role_context_from_text,
+    get_emotion_group,
+    get_proximity_level,
+)
+
+# Выключатель: ROMIND_FASTPATH=0
+FASTPATH_ENABLED = os.getenv("ROMIND_FASTPATH", "1") != "0"
+# Длиннее этого — уже не «тривиальное» сообщение
+FASTPATH_MAX_WORDS = 6
+
+# === 1. Словарь намерений ===
+
+# Порядок важен: при нескольких намерениях побеждает первое.
+INTENT_LEXICON: Dict[str, List[str]] = {
+    "thanks": [
+        "спасибо", "спасибо большое", "большое спасибо", "благодарю", "спс",
+        "мерси", "thank you", "thanks",
+    ],
+    "greeting": [
+        "привет", "приветик", "здравствуй", "здравствуйте", "добрый день",
+        "доброе утро", "добрый вечер", "хай", "салют", "hi", "hello", "hey",
+    ],
+    "bye": [
+        "пока", "до встречи", "до свидания", "до завтра", "спокойной ночи",
+        "bye", "good night",
+    ],
+    "ack": [
+        "ок", "окей", "ok", "okay", "понял", "поняла", "понятно", "ясно",
+        "хорошо", "ага", "угу", "да", "принято", "договорились", "отлично",
+        "супер", "класс",
+    ],
+}
+
+# Обращения, которые не меняют смысла («ROMIND, привет»)
+ADDRESS_WORDS = {p.lower() for p in PERSONALITIES} | {"роминд", "мира", "лейла", "раз", "эфир"}
+
+_PUNCT_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+
+
+# === 2. Шаблоны ===
+
+# Открывающая фраза по намерению и кругу близости
+INTENT_OPENERS: Dict[str, Dict[str, str]] = {
+    "greeting": {
+        "outer": "Здравствуй.",
+        "middle": "Привет!",
+        "inner": "Привет, как же хорошо тебя слышать.",
+    },
+    "thanks": {
+        "outer": "Пожалуйста.",
+        "middle": "Всегда пожалуйста.",
+        "inner": "Для тебя — всегда.",
+    },
+    "ack": {
+        "outer": "Принято.",
+        "middle": "Хорошо, я с тобой.",
+        "inner": "Договорились, я рядом.",
+    },
+    "bye": {
+        "outer": "До встречи.",
+        "middle": "До встречи. Я буду здесь.",
+        "inner": "Отдыхай. Я рядом и буду ждать.",
+    },
+}
+
+# Вторая фраза по персоне. Для «ack» — базовая фраза персоны из offline-ответа.
+INTENT_PERSONA_LINES: Dict[str, Dict[str, str]] = {
+    "greeting": PERSONA_BASE_LINES,
+    "ack": PERSONA_BASE_LINES,
+    "thanks": {
+        "ROMIND": "Двигаемся дальше вместе.",
+        "RO": "Система работает, продолжаем.",
+        "AETHER": "Благодарность — тоже путь.",
+        "RAZ": "Без церемоний. Что дальше?",
+        "MIRA": "Мне тепло от твоих слов.",
+        "LAYLA": "Береги себя и свой ритм.",
+    },
+    "bye": {
+        "ROMIND": "Возвращайся, когда захочешь.",
+        "RO": "Сессия сохранена.",
+        "AETHER": "Пусть путь будет мягким.",
+        "RAZ": "Не сбавляй темп.",
+        "MIRA": "Береги себя.",
+        "LAYLA": "Не забудь про отдых и воду.",
+    },
+}
+
+EMOTION_GROUP_NAMES = list(EMOTION_GROUPS) + ["neutral"]
+PROXIMITY_LEVELS = ("outer", "middle", "inner")
+
+
+def _compile_templates() -> Dict[Tuple[str, str, str, str], str]:
+    """Предсобирает ответы для всех сочетаний намерение × персона × эмоция × близость."""
+    table: Dict[Tuple[str, str, str, str], str] = {}
+    for intent, openers in INTENT_OPENERS.items():
+        persona_lines = INTENT_PERSONA_LINES.get(intent, {})
+        for persona in PERSONALITIES:
+            line = persona_lines.get(persona, "")
+            for group in EMOTION_GROUP_NAMES:
+                # Эмоциональная добавка не нужна для прощаний
+                extra = "" if intent == "bye" else EMOTION_GROUP_EXTRAS.get(group, "")
+                for proximity in PROXIMITY_LEVELS:
+                    parts = [openers[proximity]]
+                    if line:
+                        parts.append(line)
+                    table[(intent, persona, group, proximity)] = " ".join(parts) + extra
+    return table
+
+
+FASTPATH_TEMPLATES = _compile_templates()
+
+# фраза -> намерение (по всем фразам словаря)
+_PHRASE_INTENT: Dict[str, str] = {}
+for _intent, _phrases in INTENT_LEXICON.items():
+    for _phrase in _phrases:
+        _PHRASE_INTENT.setdefault(_phrase, _intent)
+_MAX_PHRASE_WORDS = max(len(p.split()) for p in _PHRASE_INTENT)
+_INTENT_ORDER = {intent: i for i, intent in enumerate(INTENT_LEXICON)}
+
+
+def classify_intent(text: str) -> Optional[str]:
+    """
+    Намерение тривиального сообщения или None.
+    Сообщение должно целиком покрываться фразами словаря (плюс обращения).
+    """
+    words = _PUNCT_RE.sub(" ", text.lower()).split()
+    words = [w for w in words if w not in ADDRESS_WORDS]
+    if not words or len(words) > FASTPATH_MAX_WORDS:
+        return None
+
+    found: List[str] = []
+    i = 0
+    while i < len(words):
+        # жадно берём самую длинную фразу словаря с этой позиции
+        for n in range(min(_MAX_PHRASE_WORDS, len(words) - i), 0, -1):
+            intent = _PHRASE_INTENT.get(" ".join(words[i:i + n]))
+            if intent:
+                found.append(intent)
+                i += n
+                break
+        else:
+            return None
+    return min(found, key=_INTENT_ORDER.__getitem__)
+
+
+def last_reply_asked(history: Optional[List[Dict[str, str]]]) -> bool:
+    """Задал ли ROMIND вопрос последней репликой (тогда «да/ок» — ответ на него)."""
+    for message in reversed(history or []):
+        if message.get("role") == "assistant":
+            return "?" in (message.get("content") or "")
+    return False
+
+
+# === 3. Роутер ===
+
+class FastPathRouter:
+    """Решает, можно ли ответить без LLM, и ведёт статистику решений."""
+
+    def __init__(self, enabled: bool = FASTPATH_ENABLED, recent: int = 50) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.total = 0
+        self.hits = 0
+        self.by_intent: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=recent)
+
+    def _record(self, route: str, reason: str, intent: Optional[str] = None) -> None:
+        with self._lock:
+            self.total += 1
+            if route == "fastpath":
+                self.hits += 1
+                self.by_intent[intent or ""] = self.by_intent.get(intent or "", 0) + 1
+            else:
+                self.misses[reason] = self.misses.get(reason, 0) + 1
+            self.recent.append({"route": route, "reason": reason, "intent": intent})
+
+    def route(
+        self,
+        text: str,
+        state: RomindState,
+        history: Optional[List[Dict[str, str]]] = None,
+    ) -> Optional[str]:
+        """
+        Готовый ответ для тривиального сообщения или None (→ полный путь).
+        history — диалог до этого сообщения: «да/ок» без вопроса ROMIND
+        может быть ответом на что угодно, его ведёт полный мозг.
+        """
+        if not self.enabled:
+            return None
+        intent = classify_intent(text)
+        if intent is None:
+            self._record("llm", "not_trivial")
+            return None
+        if intent == "ack" and not last_reply_asked(history):
+            self._record("llm", "ack_without_question", intent)
+            return None
+        # Эмоциональный или ролевой сигнал — это уже не «просто привет»
+        if detect_emotion_from_text(text) or detect_role_context_from_text(text):
+            self._record("llm", "emotional_signal", intent)
+            return None
+
+        persona = state.persona_id if state.persona_id in PERSONALITIES else "ROMIND"
+        group = get_emotion_group(state.emotion)
+        proximity = get_proximity_level(state.trust, state.role_context)
+        reply = FASTPATH_TEMPLATES.get((intent, persona, group, proximity))
+        if reply is None:
+            self._record("llm", "no_template", intent)
+            return None
+
+        self._record("fastpath", "template", intent)
+        return reply
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "total": self.total,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.total, 4) if self.total else 0.0,
+                "by_intent": dict(self.by_intent),
+                "misses": dict(self.misses),
+                "recent": list(self.recent),
+            }
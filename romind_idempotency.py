@@ -0,0 +1,151 @@
+"""
+Idempotency-Key для /chat.
+
+Мобильный клиент на плохой сети повторяет запрос. Без ключа каждый повтор —
+это новый ход: ещё раз update_from_user_text (доверие растёт дважды),
+дубликат в памяти и ещё один платный вызов LLM.
+
+С заголовком Idempotency-Key:
+- первый запрос с ключом выполняется и его ответ кэшируется на TTL
+- повтор после завершения получает тот же ответ, ничего не пересчитывая
+- повтор, пришедший, пока оригинал ещё считается, ждёт его результата
+- тот же ключ с другим телом запроса — ошибка (IdempotencyConflict)
+- если оригинал упал, запись удаляется: следующий повтор посчитает заново
+
+Кэш ограничен (LRU по завершённым записям); ключ действует в пределах сессии:
+в кэше он хранится кортежем (session_id, ключ) — склейка строк через
+разделитель путала бы («a:b», «c») и («a», «b:c»).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+IDEMPOTENCY_TTL = float(os.getenv("ROMIND_IDEMPOTENCY_TTL", "600"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("ROMIND_IDEMPOTENCY_MAX_KEYS", "10000"))
+# Сколько повтор ждёт незавершённый оригинал (секунды)
+IDEMPOTENCY_WAIT = float(os.getenv("ROMIND_IDEMPOTENCY_WAIT", "60"))
+
+
+class IdempotencyConflict(Exception):
+    """Ключ уже использован с другим телом запроса."""
+
+
+class IdempotencyTimeout(Exception):
+    """Оригинальный запрос всё ещё выполняется."""
+
+
+def fingerprint(payload: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "ok", "result", "expires_at")
+
+    def __init__(self, fp: str) -> None:
+        self.fingerprint = fp
+        self.done = threading.Event()
+        self.ok = False
+        self.result: Any = None
+        self.expires_at = 0.0
+
+
+class IdempotencyCache:
+    def __init__(
+        self,
+        ttl: float = IDEMPOTENCY_TTL,
+        max_keys: int = IDEMPOTENCY_MAX_KEYS,
+        wait: float = IDEMPOTENCY_WAIT,
+    ) -> None:
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.wait = wait
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.waited = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    def _evict_locked(self, now: float) -> None:
+        """Сначала старые: просроченные и сверх лимита. Незавершённые не вытесняются."""
+        victims = []
+        size = len(self._entries)
+        for key, entry in self._entries.items():
+            expired = entry.done.is_set() and entry.expires_at <= now
+            if size - len(victims) <= self.max_keys and not expired:
+                break
+            if entry.done.is_set():
+                victims.append(key)
+        for key in victims:
+            del self._entries[key]
+
+    def run(self, key: Hashable, fp: str, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Результат compute() для ключа. Второе значение — True,
+        если ответ взят из кэша (или от параллельного оригинала).
+        """
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.done.is_set() and entry.expires_at <= now:
+                    del self._entries[key]
+                    entry = None
+                if entry is None:
+                    entry = _Entry(fp)
+                    self._entries[key] = entry
+                    self._evict_locked(now)
+                    owner = True
+                    self.misses += 1
+                else:
+                    if entry.fingerprint != fp:
+                        self.conflicts += 1
+                        raise IdempotencyConflict(key)
+                    self._entries.move_to_end(key)
+                    owner = False
+
+            if owner:
+                try:
+                    result = compute()
+                except BaseException:
+                    with self._lock:
+                        if self._entries.get(key) is entry:
+                            del self._entries[key]
+                    entry.done.set()
+                    raise
+                entry.result = result
+                entry.ok = True
+                entry.expires_at = time.monotonic() + self.ttl
+                entry.done.set()
+                return result, False
+
+            if not entry.done.is_set():
+                self.waited += 1
+                if not entry.done.wait(self.wait):
+                    raise IdempotencyTimeout(key)
+            if entry.ok:
+                self.hits += 1
+                return entry.result, True
+            # Оригинал упал — пробуем сами (запись уже удалена)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+            in_flight = sum(1 for e in self._entries.values() if not e.done.is_set())
+        return {
+            "keys": size,
+            "in_flight": in_flight,
+            "capacity": self.max_keys,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "waited": self.waited,
+            "misses": self.misses,
+            "conflicts": self.conflicts,
+        }
@@ -0,0 +1,271 @@
+"""
+LLM-бэкенды ROMIND.
+
+Единый интерфейс LLMBackend.complete(messages, model, ...) -> LLMResult
+и три реализации:
+- OpenAIHTTPBackend — любой OpenAI-совместимый HTTP-эндпоинт
+  (ROMIND_LLM_BASE_URL — например, локальный сервер-заглушка),
+  с явным пулом соединений, keep-alive, HTTP/2 (если есть пакет h2)
+  и раздельными таймаутами connect/read
+- StubBackend — детерминированный локальный ответ (тесты, replay, нагрузка)
+- OfflineBackend — offline-ответчик ROMIND (без сети вообще)
+
+Выбор: ROMIND_LLM_BACKEND = openai | stub | offline | auto (по умолчанию).
+auto — openai, если задан ключ или base URL и установлен SDK, иначе offline
+(с предупреждением в лог). Явный openai, который не собрался, и неизвестное
+имя — ошибка при старте, а не тихий offline.
+"""
+
+from __future__ import annotations
+
+import abc
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+try:
+    import h2  # noqa: F401  (нужен httpx для HTTP/2)
+    HTTP2_AVAILABLE = True
+except Exception:
+    HTTP2_AVAILABLE = False
+
+try:
+    from openai import OpenAI
+except Exception:
+    OpenAI = None
+
+LLM_BACKEND = os.getenv("ROMIND_LLM_BACKEND", "auto")
+LLM_BASE_URL = os.getenv("ROMIND_LLM_BASE_URL")
+
+# Транспорт
+LLM_MAX_CONNECTIONS = int(os.getenv("ROMIND_LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("ROMIND_LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("ROMIND_LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_HTTP2 = os.getenv("ROMIND_LLM_HTTP2", "1") != "0"
+LLM_CONNECT_TIMEOUT = float(os.getenv("ROMIND_LLM_CONNECT_TIMEOUT", "3"))
+LLM_READ_TIMEOUT = float(os.getenv("ROMIND_LLM_READ_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("ROMIND_LLM_MAX_RETRIES", "1"))
+
+LLM_BACKENDS = ("openai", "stub", "offline", "auto")
+
+logger = logging.getLogger("romind.llm")
+
+
+class LLMResult:
+    """Ответ модели + служебные данные вызова."""
+
+    def __init__(
+        self,
+        text: str,
+        model: str,
+        latency: float = 0.0,
+        usage: Optional[Dict[str, int]] = None,
+        backend: str = "",
+    ) -> None:
+        self.text = text
+        self.model = model
+        self.latency = latency
+        # prompt_tokens / completion_tokens / cached_tokens
+        self.usage: Dict[str, int] = usage or {}
+        self.backend = backend
+
+
+class LLMBackend(abc.ABC):
+    """Базовый интерфейс. offline=True — бэкенд не ходит ни в какую модель."""
+
+    name = "base"
+    offline = False
+
+    @abc.abstractmethod
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.7,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+# === 1. OpenAI-совместимый HTTP ===
+
+class OpenAIHTTPBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = LLM_BASE_URL,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        max_keepalive: int = LLM_MAX_KEEPALIVE,
+        keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+        http2: bool = LLM_HTTP2,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        read_timeout: float = LLM_READ_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+    ) -> None:
+        if OpenAI is None:
+            raise RuntimeError("openai SDK is not installed")
+
+        self.http2 = bool(http2 and HTTP2_AVAILABLE)
+        self._http_client = None
+        if httpx is not None:
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                http2=self.http2,
+            )
+
+        kwargs: Dict[str, Any] = {"max_retries": max_retries}
+        if base_url:
+            kwargs["base_url"] = base_url
+        # Локальной заглушке ключ не нужен, но SDK требует непустой
+        key = api_key or os.getenv("OPENAI_API_KEY") or ("local" if base_url else None)
+        if key:
+            kwargs["api_key"] = key
+        if self._http_client is not None:
+            kwargs["http_client"] = self._http_client
+        else:
+            kwargs["timeout"] = read_timeout
+        self.client = OpenAI(**kwargs)
+        self.base_url = base_url
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.7,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        started = time.perf_counter()
+        completion = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+        )
+        latency = time.perf_counter() - started
+        text = (completion.choices[0].message.content or "").strip()
+
+        usage: Dict[str, int] = {}
+        u = getattr(completion, "usage", None)
+        if u is not None:
+            usage["prompt_tokens"] = int(getattr(u, "prompt_tokens", 0) or 0)
+            usage["completion_tokens"] = int(getattr(u, "completion_tokens", 0) or 0)
+            details = getattr(u, "prompt_tokens_details", None)
+            usage["cached_tokens"] = int(getattr(details, "cached_tokens", 0) or 0) if details else 0
+        return LLMResult(text, getattr(completion, "model", None) or model, latency, usage, self.name)
+
+    def close(self) -> None:
+        if self._http_client is not None:
+            self._http_client.close()
+
+
+# === 2. Детерминированная заглушка ===
+
+STUB_LINES = [
+    "Я слышу тебя. Давай разберём это по шагам.",
+    "Понимаю. Что для тебя сейчас самое важное?",
+    "Хорошо. Начнём с одного конкретного действия.",
+    "Это важно. Давай посмотрим на это спокойно.",
+]
+
+
+class StubBackend(LLMBackend):
+    """
+    Ответ зависит только от входа (хеш последней реплики) — воспроизводимо.
+    latency — искусственная задержка в секундах (для нагрузочных тестов).
+    """
+
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.7,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        if self.latency:
+            time.sleep(self.latency)
+        last = messages[-1]["content"] if messages else ""
+        digest = hashlib.sha1(f"{model}|{last}".encode("utf-8")).digest()
+        text = STUB_LINES[digest[0] % len(STUB_LINES)]
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(text.split()),
+            "cached_tokens": 0,
+        }
+        return LLMResult(text, model, self.latency, usage, self.name)
+
+
+# === 3. Offline-ответчик ===
+
+class OfflineBackend(LLMBackend):
+    """Оборачивает offline-ответ ROMIND: responder(последняя реплика, context)."""
+
+    name = "offline"
+    offline = True
+
+    def __init__(self, responder: Callable[[str, Optional[Dict[str, Any]]], str]) -> None:
+        self.responder = responder
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.7,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        last = messages[-1]["content"] if messages else ""
+        return LLMResult(self.responder(last, context), "offline", 0.0, {}, self.name)
+
+
+# === 4. Выбор бэкенда ===
+
+def make_backend(
+    responder: Callable[[str, Optional[Dict[str, Any]]], str],
+    kind: str = LLM_BACKEND,
+) -> LLMBackend:
+    """
+    Создаёт бэкенд по имени. Неизвестное имя и явный openai, который
+    не удалось собрать, — ValueError / RuntimeError; auto без ключа
+    или без SDK — offline с предупреждением в лог.
+    """
+    kind = (kind or "auto").lower()
+    if kind not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {kind} (expected one of {', '.join(LLM_BACKENDS)})")
+    if kind == "stub":
+        return StubBackend()
+    if kind == "offline":
+        return OfflineBackend(responder)
+    if kind == "openai":
+        try:
+            return OpenAIHTTPBackend()
+        except Exception as e:
+            raise RuntimeError(f"ROMIND_LLM_BACKEND=openai, but the backend failed to start: {e}") from e
+    if os.getenv("OPENAI_API_KEY") or LLM_BASE_URL:
+        try:
+            return OpenAIHTTPBackend()
+        except Exception:
+            logger.warning("OpenAI backend is unavailable, answering offline", exc_info=True)
+    else:
+        logger.warning("No OPENAI_API_KEY or ROMIND_LLM_BASE_URL, answering offline")
+    return OfflineBackend(responder)
@@ -13,16 +13,63 @@
 - семантические паттерны (темы и связанные эмоции)
 """
 
+import atexit
 import json
 import os
+import re
+import threading
+import time
+import weakref
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+from romind_analytics import RomindRollups
 
 
 # Отдельный лог, если захочется писать "сырые" события
 MEMORY_LOG_FILE = "romind_memory_log.json"
 # Ограничение размера истории
 MAX_RECORDS = 300
+# Ограничение списков в биографии (likes, possessions, ...)
+MAX_PROFILE_LIST = 50
+# Семантический индекс пишется на диск фоновым потоком раз в N секунд
+# (0 — сразу при каждом изменении)
+SEMANTIC_FLUSH_INTERVAL = float(os.getenv("ROMIND_SEMANTIC_FLUSH_INTERVAL", "5"))
+
+
+# Памяти с отложенной записью: один фоновый поток и один atexit на все экземпляры
+_FLUSH_TARGETS: "weakref.WeakSet[Any]" = weakref.WeakSet()
+_flusher_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+
+
+def flush_all() -> None:
+    """Сбрасывает на диск отложенные изменения всех экземпляров памяти."""
+    for memory in list(_FLUSH_TARGETS):
+        try:
+            memory.flush()
+        except Exception:
+            pass
+
+
+def _flusher_loop() -> None:
+    while True:
+        time.sleep(SEMANTIC_FLUSH_INTERVAL)
+        flush_all()
+
+
+def _register_flush(memory: Any) -> None:
+    global _flusher
+    _FLUSH_TARGETS.add(memory)
+    if SEMANTIC_FLUSH_INTERVAL <= 0:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flusher_loop, name="romind-memory-flush", daemon=True)
+            _flusher.start()
+
+
+atexit.register(flush_all)
 
 
 # === 1. Базовая эмоциональная память ===
@@ -39,6 +86,7 @@ class RomindMemory:
         "role_context": str | None,
         "emotion": str,
         "trust": float,
+        "session": str,          # если ход был в сессии
     }
     """
 
@@ -49,6 +97,8 @@ class RomindMemory:
         self.path: str = path or self.MEMORY_FILE
         # ВСЕГДА список, никогда None
         self.data: List[Dict[str, Any]] = []
+        # Память обновляется и из запросов, и из фоновых потоков
+        self._lock = threading.RLock()
         # Подгружаем, если есть
         self._load()
 
@@ -88,18 +138,41 @@ class RomindMemory:
         role_context: Optional[str],
         emotion: str,
         trust: float,
+        session_id: Optional[str] = None,
     ) -> None:
         """Записывает одно эмоциональное событие."""
-        record: Dict[str, Any] = {
-            "time": datetime.utcnow().isoformat(),
-            "user_text": user_text,
-            "persona": persona_id,
-            "role_context": role_context,
-            "emotion": emotion,
-            "trust": round(float(trust), 3),
-        }
-        self.data.append(record)
-        self._save()
+        with self._lock:
+            record: Dict[str, Any] = {
+                "time": datetime.utcnow().isoformat(),
+                "user_text": user_text,
+                "persona": persona_id,
+                "role_context": role_context,
+                "emotion": emotion,
+                "trust": round(float(trust), 3),
+            }
+            if session_id:
+                record["session"] = session_id
+            self.data.append(record)
+            self._save()
+
+    def session_records(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Последние записи одной сессии (окно памяти для передачи сессии)."""
+        with self._lock:
+            found = [r for r in reversed(self.data) if r.get("session") == session_id][:limit]
+        return found[::-1]
+
+    def import_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Вливает записи с другого узла в хронологическом порядке.
+        Уже известные (то же время и текст) пропускаются; возвращает новые.
+        """
+        with self._lock:
+            known = {(r.get("time"), r.get("user_text")) for r in self.data}
+            fresh = [r for r in records if (r.get("time"), r.get("user_text")) not in known]
+            if fresh:
+                self.data[:] = sorted(self.data + fresh, key=lambda r: r.get("time") or "")
+                self._save()
+        return fresh
 
     def last_emotion(self) -> Optional[str]:
         """Возвращает последнюю зафиксированную эмоцию ROMIND."""
@@ -121,6 +194,45 @@ class RomindMemory:
 
 # === 2. Расширенный биографический слой памяти ===
 
+# Таблица правил извлечения биографических фактов:
+# (секция, поле, паттерн, режим)
+# Режимы:
+#   "first" — записать, только если поле ещё пустое
+#   "set"   — перезаписать значением из BIO_VALUE_MAP (или флагом "есть")
+#   "list"  — добавить в упорядоченное множество с ограничением размера
+# Паттерн должен содержать ровно одну группу со значением.
+BIO_RULES: List[Tuple[str, str, str, str]] = [
+    ("primary", "name", r"меня зовут\s+(\w+)", "first"),
+    ("primary", "location", r"я живу\s+((?:\S+\s*){1,5})", "first"),
+    ("primary", "occupation", r"я работаю\s+((?:\S+\s*){1,8})", "first"),
+    ("primary", "children", r"у меня (трое|двое|один|[123]) (?:детей|ребёнок)", "set"),
+    ("primary", "partner", r"(мой муж|моя жена|мой парень|моя девушка)", "set"),
+    ("secondary", "likes", r"я люблю\s*([^.]*)", "list"),
+    ("secondary", "possessions", r"у меня есть\s*([^.]*)", "list"),
+]
+
+# Нормализация значений для режима "set"
+BIO_VALUE_MAP: Dict[str, Dict[str, Any]] = {
+    "children": {"трое": 3, "3": 3, "двое": 2, "2": 2, "один": 1, "1": 1},
+}
+
+
+def _compile_bio_rules(rules: List[Tuple[str, str, str, str]]):
+    """
+    Собирает все правила в одно регулярное выражение.
+    Каждое правило обёрнуто в lookahead, поэтому совпадения могут
+    перекрываться, а текст сканируется один раз.
+    """
+    parts = []
+    for i, (_, _, pattern, _) in enumerate(rules):
+        inner = re.sub(r"\((?!\?)", f"(?P<v{i}>", pattern, count=1)
+        parts.append(f"(?=(?P<r{i}>{inner}))")
+    return re.compile("|".join(parts))
+
+
+BIO_REGEX = _compile_bio_rules(BIO_RULES)
+
+
 class RomindFullMemory(RomindMemory):
     """
     Полная биографическая память ROMIND.
@@ -163,6 +275,13 @@ class RomindFullMemory(RomindMemory):
         super().__init__(path or RomindMemory.MEMORY_FILE)
         self.bio_path: str = self.BIOGRAPHY_FILE
         self.profile: Dict[str, Any] = self._load_biography()
+        # Множества-зеркала для списков профиля: проверка дубликатов за O(1)
+        self._profile_sets: Dict[Tuple[str, str], set] = {}
+        for section, field, _, mode in BIO_RULES:
+            if mode == "list":
+                self._profile_sets[(section, field)] = set(self.profile[section][field])
+        # Дальше facts_count только корректируется по изменениям
+        self.profile["meta"]["facts_count"] = self._recount_facts()
 
     # --- Загрузка / сохранение ---
 
@@ -212,21 +331,35 @@ class RomindFullMemory(RomindMemory):
                 pass
         return self._empty_profile()
 
+    @staticmethod
+    def _fact_weight(value: Any) -> int:
+        """Сколько фактов даёт значение поля (правило то же, что и при подсчёте)."""
+        if isinstance(value, list):
+            return len([x for x in value if x])
+        return 0 if value in (None, "", 0) else 1
+
+    def _recount_facts(self) -> int:
+        facts = 0
+        for section in ("primary", "secondary", "emotional"):
+            block = self.profile.get(section, {})
+            if isinstance(block, dict):
+                for v in block.values():
+                    facts += self._fact_weight(v)
+        return facts
+
+    def _set_profile_field(self, section: str, field: str, value: Any) -> bool:
+        """Меняет поле профиля; facts_count ведётся инкрементально. True — если изменилось."""
+        block = self.profile[section]
+        old = block.get(field)
+        if old == value:
+            return False
+        block[field] = value
+        self.profile["meta"]["facts_count"] += self._fact_weight(value) - self._fact_weight(old)
+        return True
+
     def _save_biography(self) -> None:
         try:
             self.profile["meta"]["updated_at"] = datetime.utcnow().isoformat()
-            # пересчёт фактов
-            facts = 0
-            for section in ("primary", "secondary", "emotional"):
-                block = self.profile.get(section, {})
-                if isinstance(block, dict):
-                    for v in block.values():
-                        if isinstance(v, list):
-                            facts += len([x for x in v if x])
-                        elif v not in (None, "", 0):
-                            facts += 1
-            self.profile["meta"]["facts_count"] = facts
-
             with open(self.bio_path, "w", encoding="utf-8") as f:
                 json.dump(self.profile, f, ensure_ascii=False, indent=2)
         except Exception:
@@ -234,74 +367,68 @@ class RomindFullMemory(RomindMemory):
 
     # --- Обновление профиля по тексту пользователя ---
 
-    def update_profile(self, user_text: str) -> None:
+    def update_profile(self, user_text: str) -> bool:
         """
         Извлекает биографические сигналы из текста.
         Наращивает знания, не затирая уже известное.
+        Файл переписывается только если профиль действительно изменился.
+        Возвращает True, если что-то изменилось.
         """
-        text = user_text.lower()
-        p = self.profile["primary"]
-        s = self.profile["secondary"]
-        e = self.profile["emotional"]
-
-        # Имя
-        if "меня зовут" in text and not p["name"]:
-            name = text.split("меня зовут", 1)[-1].strip().split()[0]
-            if name:
-                p["name"] = name.capitalize()
-
-        # Локация (город/страна)
-        if "я живу" in text and not p["location"]:
-            place = text.split("я живу", 1)[-1].strip().split()[0:5]
-            if place:
-                p["location"] = " ".join(place)
-
-        # Работа
-        if "я работаю" in text and not p["occupation"]:
-            job = text.split("я работаю", 1)[-1].strip().split()[0:8]
-            if job:
-                p["occupation"] = " ".join(job)
-
-        # Дети
-        if "у меня трое детей" in text or "у меня 3 детей" in text:
-            p["children"] = 3
-        elif "у меня двое детей" in text or "у меня 2 детей" in text:
-            p["children"] = 2
-        elif "у меня один ребёнок" in text or "у меня 1 ребёнок" in text:
-            p["children"] = 1
-
-        # Партнёр (очень мягкий, без вторжения)
-        if "мой муж" in text or "моя жена" in text or "мой парень" in text or "моя девушка" in text:
-            p["partner"] = "есть"
-
-        # Интересы
-        if "я люблю" in text:
-            fragment = text.split("я люблю", 1)[-1].strip()
-            part = fragment.split(".")[0].split(",")[0:8]
-            likes = s["likes"]
-            item = " ".join(part).strip()
-            if item:
-                likes.append(item)
-                s["likes"] = sorted(set(likes))
-
-        # Вещи, которые важны
-        if "у меня есть" in text:
-            fragment = text.split("у меня есть", 1)[-1].strip()
-            part = fragment.split(".")[0].split(",")[0:8]
-            poss = s["possessions"]
-            item = " ".join(part).strip()
-            if item:
-                poss.append(item)
-                s["possessions"] = sorted(set(poss))
-
-        # Эмоциональный baseline
-        last = self.last_emotion()
-        if last:
-            # если baseline ещё не задан — задаём
+        with self._lock:
+            text = user_text.lower()
+            e = self.profile["emotional"]
+            changed = False
+
+            # Один проход по тексту: все правила из BIO_RULES сразу
+            for m in BIO_REGEX.finditer(text):
+                i = int(m.lastgroup[1:])
+                section, field, _, mode = BIO_RULES[i]
+                value = (m.group(f"v{i}") or "").strip()
+                changed |= self._apply_bio_fact(section, field, mode, value)
+
+            # Эмоциональный baseline
             if not e["baseline"]:
-                e["baseline"] = last
-
-        self._save_biography()
+                last = self.last_emotion()
+                # если baseline ещё не задан — задаём
+                if last:
+                    changed |= self._set_profile_field("emotional", "baseline", last)
+
+            if changed:
+                self._save_biography()
+            return changed
+
+    def _apply_bio_fact(self, section: str, field: str, mode: str, value: str) -> bool:
+        block = self.profile[section]
+        if mode == "first":
+            if value and not block[field]:
+                value = value.capitalize() if field == "name" else value
+                return self._set_profile_field(section, field, value)
+        elif mode == "set":
+            value = BIO_VALUE_MAP.get(field, {}).get(value, "есть")
+            return self._set_profile_field(section, field, value)
+        elif mode == "list":
+            item = " ".join(value.split(",")[0:8]).strip()
+            if item:
+                return self._add_profile_item(section, field, item)
+        return False
+
+    def _add_profile_item(self, section: str, field: str, item: str) -> bool:
+        """Добавляет элемент в список профиля как в упорядоченное множество."""
+        seen = self._profile_sets.setdefault((section, field), set())
+        if item in seen:
+            return False
+        items = self.profile[section][field]
+        meta = self.profile["meta"]
+        items.append(item)
+        seen.add(item)
+        meta["facts_count"] += 1
+        # Самые старые элементы уходят первыми
+        while len(items) > MAX_PROFILE_LIST:
+            dropped = items.pop(0)
+            seen.discard(dropped)
+            if dropped:
+                meta["facts_count"] -= 1
+        return True
 
     def summarize_profile(self) -> str:
         """Человеческое резюме того, что ROMIND уже знает о пользователе."""
@@ -333,15 +460,35 @@ class RomindSemanticMemory(RomindFullMemory):
 
     - считает, о чём чаще всего говорит пользователь (темы)
     - связывает темы с эмоциями
+    - ведёт скользящие сводки по окнам 24h / 7d / 30d (self.rollups)
     """
 
     SEMANTIC_FILE = "romind_semantic_memory.json"
 
     def __init__(self, path: Optional[str] = None) -> None:
         super().__init__(path or RomindMemory.MEMORY_FILE)
-        self.semantic_path: str = self.SEMANTIC_FILE
+        # Абсолютный путь: сохраняет и фоновый поток, и atexit — уже после возможного chdir
+        self.semantic_path: str = os.path.abspath(self.SEMANTIC_FILE)
         self.semantic_index: Dict[str, Any] = self._load_semantics()
 
+        # Сводки по окнам хранятся в том же файле, но вне индекса
+        raw_rollups = self.semantic_index.pop("_rollups", None)
+        if isinstance(raw_rollups, dict):
+            self.rollups = RomindRollups.from_dict(raw_rollups)
+        else:
+            self.rollups = RomindRollups.from_semantic_index(self.semantic_index, self.data)
+
+        # Несохранённые изменения индекса (write-behind, см. SEMANTIC_FLUSH_INTERVAL)
+        self._semantic_dirty: bool = False
+        self._semantic_saved_at: float = 0.0
+        _register_flush(self)
+
+        # тема -> самая частая эмоция (обновляется по ходу, без сканирования)
+        self._theme_top_emotion: Dict[str, str] = {}
+        for theme, emo_stats in self.semantic_index.get("_emotions", {}).items():
+            if emo_stats:
+                self._theme_top_emotion[theme] = max(emo_stats.items(), key=lambda x: x[1])[0]
+
     def _load_semantics(self) -> Dict[str, Any]:
         if os.path.exists(self.semantic_path):
             try:
@@ -355,16 +502,40 @@ class RomindSemanticMemory(RomindFullMemory):
 
     def _save_semantics(self) -> None:
         try:
+            data = dict(self.semantic_index)
+            data["_rollups"] = self.rollups.to_dict()
             with open(self.semantic_path, "w", encoding="utf-8") as f:
-                json.dump(self.semantic_index, f, ensure_ascii=False, indent=2)
+                json.dump(data, f, ensure_ascii=False, indent=2)
         except Exception:
             pass
-
-    def update_semantic_patterns(self, user_text: str, emotion: str) -> None:
+        self._semantic_dirty = False
+        self._semantic_saved_at = time.monotonic()
+
+    def _mark_semantic_dirty(self) -> None:
+        """Изменение индекса или сводок: на диск его допишет фоновый поток."""
+        self._semantic_dirty = True
+        if SEMANTIC_FLUSH_INTERVAL <= 0:
+            self._save_semantics()
+
+    def flush(self) -> None:
+        """Дописывает на диск отложенные изменения семантического индекса."""
+        with self._lock:
+            if self._semantic_dirty:
+                self._save_semantics()
+
+    def update_semantic_patterns(self, user_text: str, emotion: str, now: Optional[float] = None) -> None:
         """
         Определяет частые темы (работа, семья, усталость, любовь и т.д.)
         и добавляет их в семантический индекс.
+        now — время сообщения для скользящих сводок (по умолчанию — текущее).
         """
+        with self._lock:
+            self._update_semantics_locked(user_text, emotion, now)
+            # Каждое сообщение меняет хотя бы сводки. Не переписываем файл
+            # на каждое сообщение: копим и сбрасываем по интервалу
+            self._mark_semantic_dirty()
+
+    def _update_semantics_locked(self, user_text: str, emotion: str, now: Optional[float]) -> None:
         text = user_text.lower()
 
         THEMES: Dict[str, List[str]] = {
@@ -384,6 +555,9 @@ class RomindSemanticMemory(RomindFullMemory):
                 matched.append(theme)
                 self.semantic_index[theme] = int(self.semantic_index.get(theme, 0)) + 1
 
+        # скользящие сводки учитывают каждое сообщение (эмоция — даже без тем)
+        self.rollups.record(matched, emotion, now=now)
+
         if not matched:
             return
 
@@ -391,12 +565,17 @@ class RomindSemanticMemory(RomindFullMemory):
         emo_map: Dict[str, Dict[str, int]] = self.semantic_index.setdefault("_emotions", {})
         for theme in matched:
             theme_emotions = emo_map.setdefault(theme, {})
-            theme_emotions[emotion] = int(theme_emotions.get(emotion, 0)) + 1
-
-        self._save_semantics()
+            count = int(theme_emotions.get(emotion, 0)) + 1
+            theme_emotions[emotion] = count
+            top = self._theme_top_emotion.get(theme)
+            if top is None or count > theme_emotions.get(top, 0):
+                self._theme_top_emotion[theme] = emotion
 
     def get_top_themes(self, limit: int = 5):
         """Возвращает топ часто упоминаемых тем пользователя."""
+        if limit <= self.rollups.k:
+            return self.rollups.top_themes("all", limit)
+
         items = [
             (k, v)
             for k, v in self.semantic_index.items()
@@ -407,14 +586,14 @@ class RomindSemanticMemory(RomindFullMemory):
 
     def describe_emotional_patterns(self) -> str:
         """Создаёт сводку: с какими эмоциями связаны темы."""
-        emo_map: Dict[str, Dict[str, int]] = self.semantic_index.get("_emotions", {})
-        if not emo_map:
+        if not self._theme_top_emotion:
             return "Пока недостаточно данных для анализа."
 
         lines: List[str] = []
-        for theme, emo_stats in emo_map.items():
-            if not emo_stats:
-                continue
-            top_emo = max(emo_stats.items(), key=lambda x: x[1])[0]
+        for theme, top_emo in self._theme_top_emotion.items():
             lines.append(f"Тема «{theme}» чаще связана с эмоцией «{top_emo}».")
         return "\n".join(lines) if lines else "Пока недостаточно данных для анализа."
+
+    def get_analytics(self, window: str = "24h", limit: Optional[int] = None) -> Dict[str, Any]:
+        """Темы и эмоции за окно (24h / 7d / 30d / all), топ уже посчитан."""
+        return self.rollups.snapshot(window, limit)
@@ -0,0 +1,124 @@
+"""
+Конвейер обработки одного хода диалога ROMIND.
+
+Ход проходит через именованные стадии (по умолчанию):
+- teach    — «ROMIND, запомни: ...» (завершает ход сам)
+- analyze  — обновление RomindState по тексту
+- persist  — запись в эмоциональную память
+- enrich   — биография и семантические паттерны
+- generate — ответ: быстрый путь / LLM / offline / адаптивный шаблон
+- adapt    — вступление по кругу близости (только если ответ его ещё не содержит)
+
+Стадии объявляются один раз (в romind_cloud_app.py) и общие для HTTP
+и консоли. Любую стадию можно выключить через ROMIND_PIPELINE_SKIP
+("enrich,persist") или параметром skip у конкретного хода.
+Стадия, чей результат уже есть или никому не нужен, не выполняется.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from romind_core_logic import RomindState, get_proximity_level
+
+
+def parse_skip_env(value: Optional[str]) -> List[str]:
+    """'enrich, persist' -> ['enrich', 'persist']"""
+    if not value:
+        return []
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+# Стадии, выключенные для всех ходов
+PIPELINE_SKIP = parse_skip_env(os.getenv("ROMIND_PIPELINE_SKIP"))
+
+
+# === 1. Ход диалога ===
+
+class RomindTurn:
+    """Один ход: вход, результаты стадий, ответ и тайминги."""
+
+    def __init__(
+        self,
+        text: str,
+        state: RomindState,
+        memory: Any = None,
+        history: Optional[List[Any]] = None,
+        use_llm: bool = True,
+        skip: Optional[Iterable[str]] = None,
+        summary: str = "",
+        session_id: str = "default",
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.text: str = text
+        self.lower: str = text.lower()
+        self.state: RomindState = state
+        self.memory: Any = memory
+        self.history: List[Any] = list(history or [])
+        self.summary: str = summary             # резюме старых ходов сессии
+        self.session_id: str = session_id
+        self.use_llm: bool = use_llm
+        self.skip = set(skip or ())
+        self.rng = rng                          # свой генератор — воспроизводимые ответы (replay)
+
+        # Результаты стадий
+        self.reply: Optional[str] = None
+        self.route: Optional[str] = None       # teach / fastpath / llm / offline / adaptive
+        self.needs_adapt: bool = False          # ответ ещё без вступления по близости
+        self.done: bool = False                 # ход завершён досрочно
+        self.meta: Dict[str, Any] = {}
+
+        # Наблюдаемость
+        self.timings: Dict[str, float] = {}     # стадия -> секунды
+        self.skipped: List[str] = []
+
+    @property
+    def proximity(self) -> str:
+        """Круг близости считается по текущему состоянию (после analyze)."""
+        return get_proximity_level(self.state.trust, self.state.role_context)
+
+
+# === 2. Стадия и конвейер ===
+
+class Stage:
+    """
+    Именованная стадия.
+    run(turn) меняет turn; when(turn) решает, нужна ли стадия этому ходу.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[RomindTurn], None],
+        when: Optional[Callable[[RomindTurn], bool]] = None,
+    ) -> None:
+        self.name = name
+        self.run = run
+        self.when = when
+
+
+class RomindPipeline:
+    def __init__(self, stages: List[Stage], skip: Optional[Iterable[str]] = None) -> None:
+        self.stages = stages
+        self.names = [s.name for s in stages]
+        self.skip = set(skip or ())
+        unknown = self.skip - set(self.names)
+        if unknown:
+            raise ValueError(f"Unknown pipeline stages: {sorted(unknown)}")
+
+    def run(self, turn: RomindTurn) -> RomindTurn:
+        for stage in self.stages:
+            if turn.done:
+                break
+            if stage.name in self.skip or stage.name in turn.skip:
+                turn.skipped.append(stage.name)
+                continue
+            if stage.when is not None and not stage.when(turn):
+                continue
+            started = time.perf_counter()
+            stage.run(turn)
+            turn.timings[stage.name] = time.perf_counter() - started
+        return turn
@@ -0,0 +1,150 @@
+"""
+Подписка на изменения состояния сессий ROMIND.
+
+Дашборды и устройства не опрашивают /chat, а подписываются на сессию
+(SSE: GET /sessions/{id}/events) и получают только изменившиеся поля
+describe().
+
+Устройство брокера:
+- тема = session_id, подписчик = одно SSE-соединение
+- у подписчика нет очереди событий: есть один «ожидающий» словарь,
+  куда сливаются все изменения, пришедшие с прошлой отправки
+  (emotion: anxious -> tired -> calm даёт одно событие emotion=calm),
+  поэтому буфер ограничен числом полей состояния
+- publish() вызывается из потока чата и ничего не ждёт: слить словарь
+  и (один раз до следующей отправки) разбудить event loop подписчика
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+# Лимит подписчиков на процесс
+MAX_SUBSCRIBERS = int(os.getenv("ROMIND_MAX_SUBSCRIBERS", "10000"))
+# Интервал keep-alive комментария в SSE-потоке (секунды)
+SSE_HEARTBEAT = float(os.getenv("ROMIND_SSE_HEARTBEAT", "15"))
+
+# Один замок на все подписки: слияние словаря — наносекунды,
+# отдельный Lock на каждого из тысяч подписчиков не окупается
+_swap_lock = threading.Lock()
+
+
+class Subscription:
+    """Один подписчик: слитые изменения + asyncio.Event его event loop."""
+
+    def __init__(self, topic: str, loop: asyncio.AbstractEventLoop) -> None:
+        self.topic = topic
+        self.loop = loop
+        self.pending: Dict[str, Any] = {}
+        self.seq = 0                  # номер последнего слитого изменения
+        self.event = asyncio.Event()
+        self.notified = False         # event уже запрошен, но ещё не прочитан
+        self.closed = False
+        self.delivered = 0
+        self.coalesced = 0
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Ждёт изменений и забирает их одним словарём.
+        None — за timeout ничего не пришло (или подписка закрыта).
+        """
+        if not self.pending and not self.closed:
+            try:
+                await asyncio.wait_for(self.event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        # pending меняется из потоков чата — забираем под замком брокера
+        with _swap_lock:
+            self.event.clear()
+            self.notified = False
+            if not self.pending:
+                return None
+            diff, self.pending = self.pending, {}
+        self.delivered += 1
+        return diff
+
+
+class StateBroker:
+    def __init__(self, max_subscribers: int = MAX_SUBSCRIBERS) -> None:
+        self.max_subscribers = max_subscribers
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._count = 0
+        self.published = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    # --- Подписка ---
+
+    def subscribe(self, topic: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[Subscription]:
+        """Новая подписка на тему (из корутины). None — достигнут лимит подписчиков."""
+        sub = Subscription(topic, loop or asyncio.get_running_loop())
+        with _swap_lock:
+            if self._count >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            self._topics.setdefault(topic, set()).add(sub)
+            self._count += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with _swap_lock:
+            subs = self._topics.get(sub.topic)
+            if subs is None or sub not in subs:
+                return
+            subs.discard(sub)
+            if not subs:
+                del self._topics[sub.topic]
+            self._count -= 1
+            sub.closed = True
+
+    # --- Публикация ---
+
+    def publish(self, topic: str, delta: Dict[str, Any]) -> int:
+        """
+        Сливает изменения в буферы подписчиков темы. Не блокирует:
+        медленный подписчик просто получит одно слитое событие позже.
+        Возвращает число подписчиков темы.
+        """
+        if not delta:
+            return 0
+        wake: List[Subscription] = []
+        with _swap_lock:
+            subs = self._topics.get(topic)
+            if not subs:
+                return 0
+            self.published += 1
+            for sub in subs:
+                if sub.pending:
+                    sub.coalesced += 1
+                    self.coalesced += 1
+                sub.pending.update(delta)
+                sub.seq += 1
+                if not sub.notified:
+                    sub.notified = True
+                    wake.append(sub)
+            count = len(subs)
+        for sub in wake:
+            try:
+                sub.loop.call_soon_threadsafe(sub.event.set)
+            except RuntimeError:
+                # event loop подписчика уже закрыт
+                self.unsubscribe(sub)
+        return count
+
+    def subscribers(self, topic: Optional[str] = None) -> int:
+        if topic is None:
+            return self._count
+        return len(self._topics.get(topic, ()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self._count,
+            "topics": len(self._topics),
+            "limit": self.max_subscribers,
+            "published": self.published,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
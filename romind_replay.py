@@ -0,0 +1,348 @@
+"""
+Запись реального трафика /chat и воспроизводимый replay.
+
+Запись (опционально, выключена по умолчанию):
+    ROMIND_CAPTURE_FILE=capture.jsonl   — куда писать
+    ROMIND_CAPTURE_SAMPLE=0.1           — доля записываемых ходов
+    ROMIND_CAPTURE_SALT=...             — соль для хеша session_id
+
+Каждая строка — один ход: обезличенный текст (почта, телефоны, ссылки,
+длинные числа и биографические факты из BIO_RULES — имя, город, работа,
+что человек любит и что у него есть — заменены метками), персона, состояние до хода, маршрут,
+тайминги стадий конвейера и общее время.
+
+Replay прогоняет записанные ходы через текущую сборку:
+- LLM — детерминированный StubBackend (по желанию с искусственной задержкой)
+- вступления adapt_response_to_proximity / build_adaptive_reply —
+  через random.Random(seed), поэтому ответы одинаковы от прогона к прогону
+- память пишется во временный каталог, рабочие файлы не трогаются;
+  каждый --repeat начинает с чистых памяти, правил и реестра сессий
+- фоновая работа выключена: обогащение памяти синхронное (в тайминге
+  стадии enrich), без фонового резюме и без сценариев устройств —
+  тайминги зависят только от самих ходов
+
+    python romind_replay.py capture.jsonl --save-baseline baseline.json
+    python romind_replay.py capture.jsonl --baseline baseline.json --threshold 20
+
+Отчёт — p50/p95/mean по каждой стадии и по ходу целиком;
+с --baseline — разница с сохранённым прогоном, а при росте p50
+сверх --threshold процентов (и не меньше --min-delta-ms) — код выхода 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from romind_memory import BIO_REGEX, BIO_RULES
+
+CAPTURE_FILE = os.getenv("ROMIND_CAPTURE_FILE")
+CAPTURE_SAMPLE = float(os.getenv("ROMIND_CAPTURE_SAMPLE", "1.0"))
+CAPTURE_SALT = os.getenv("ROMIND_CAPTURE_SALT", "romind")
+
+# Сколько записей копим перед записью на диск
+CAPTURE_FLUSH_EVERY = 50
+
+
+# === 1. Обезличивание ===
+
+PII_PATTERNS = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"https?://\S+|www\.\S+"), "<url>"),
+    (re.compile(r"\+?\d[\d\s()-]{8,}\d"), "<phone>"),
+    (re.compile(r"\d{5,}"), "<number>"),
+]
+
+
+# Те же правила, что извлекают профиль, но без учёта регистра:
+# update_profile работает с lower(), а маскировать нужно исходный текст.
+# Режим "set" (число детей, «мой муж») сам по себе не раскрывает человека.
+BIO_MASK_REGEX = re.compile(BIO_REGEX.pattern, re.IGNORECASE)
+BIO_MASK_RULES = {i for i, (_, _, _, mode) in enumerate(BIO_RULES) if mode != "set"}
+
+
+def mask_bio(text: str) -> str:
+    """Заменяет значения биографических фактов («меня зовут Ира») метками <name>."""
+    spans = []
+    for m in BIO_MASK_REGEX.finditer(text):
+        i = int(m.lastgroup[1:])
+        start, end = m.span(f"v{i}")
+        if i in BIO_MASK_RULES and text[start:end].strip():
+            spans.append((start, end, f"<{BIO_RULES[i][1]}>"))
+    # перекрывающиеся значения сливаем в одно (метка — у первого)
+    merged: List[List[Any]] = []
+    for start, end, label in sorted(spans):
+        if merged and start < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end, label])
+    # справа налево, чтобы не сдвигать ещё не заменённые позиции
+    for start, end, label in reversed(merged):
+        tail = text[start:end]
+        text = text[:start] + label + (" " if tail != tail.rstrip() else "") + text[end:]
+    return text
+
+
+def mask_pii(text: str) -> str:
+    for pattern, label in PII_PATTERNS:
+        text = pattern.sub(label, text)
+    return mask_bio(text)
+
+
+def hash_session(session_id: str, salt: str = CAPTURE_SALT) -> str:
+    return hashlib.sha1(f"{salt}:{session_id}".encode("utf-8")).hexdigest()[:16]
+
+
+# === 2. Запись ===
+
+class TrafficRecorder:
+    """Потокобезопасная запись ходов в JSONL (с выборкой и пакетной записью)."""
+
+    def __init__(self, path: str, sample: float = CAPTURE_SAMPLE, salt: str = CAPTURE_SALT) -> None:
+        self.path = path
+        self.sample = sample
+        self.salt = salt
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.recorded = 0
+
+    def record(
+        self,
+        session_id: str,
+        text: str,
+        persona: Optional[str],
+        history: Optional[List[Dict[str, str]]],
+        turn: Any,
+        total: float,
+    ) -> bool:
+        if self.sample < 1.0 and random.random() >= self.sample:
+            return False
+        before = dict(turn.meta.get("state_before") or {})
+        before.pop("last_updated", None)
+        entry = {
+            "offset": round(time.monotonic() - self._started, 3),
+            "session": hash_session(session_id, self.salt),
+            "persona": persona,
+            "message": mask_pii(text),
+            "history": (
+                [{"role": h["role"], "content": mask_pii(h["content"])} for h in history]
+                if history is not None else None
+            ),
+            "state": before,
+            "route": turn.route,
+            "timings_ms": {k: round(v * 1000, 3) for k, v in turn.timings.items()},
+            "total_ms": round(total * 1000, 3),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._buffer.append(line)
+            self.recorded += 1
+            if len(self._buffer) >= CAPTURE_FLUSH_EVERY:
+                self._flush_locked()
+        return True
+
+    def _flush_locked(self) -> None:
+        if not self._buffer:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(self._buffer) + "\n")
+        self._buffer = []
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+
+def make_recorder() -> Optional[TrafficRecorder]:
+    """Рекордер по ROMIND_CAPTURE_FILE; без переменной — None (запись выключена)."""
+    if not CAPTURE_FILE:
+        return None
+    recorder = TrafficRecorder(CAPTURE_FILE)
+    atexit.register(recorder.flush)
+    return recorder
+
+
+# === 3. Replay ===
+
+def iter_capture(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize_timings(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    """{стадия: [мс]} -> {стадия: {count, mean, p50, p95}}."""
+    report = {}
+    for name, values in sorted(samples.items()):
+        if not values:
+            continue
+        report[name] = {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 3),
+            "p50": round(_percentile(values, 0.5), 3),
+            "p95": round(_percentile(values, 0.95), 3),
+        }
+    return report
+
+
+def replay(
+    records: Iterable[Dict[str, Any]],
+    seed: int = 0,
+    repeat: int = 1,
+) -> Dict[str, Any]:
+    """
+    Прогоняет записи через run_session_turn текущей сборки.
+    Приложение импортируется здесь: окружение (бэкенд, каталог памяти)
+    должно быть настроено до импорта — см. main().
+    Каждый повтор — в своём подкаталоге текущего каталога.
+    """
+    import romind_cloud_app as app
+    from romind_core_logic import PERSONALITIES
+    from romind_memory import RomindSemanticMemory
+    from romind_rules import RULES_FILE, RomindRuleStore
+    from romind_summary import RollingSummarizer
+
+    # Никакой фоновой работы: всё, что делает ход, попадает в его тайминги
+    app.ENRICH_ASYNC = False
+    app.SCENARIOS_ENABLED = False
+    app.summarizer = RollingSummarizer(llm=None, trigger=sys.maxsize)
+    root = os.getcwd()
+
+    rng = random.Random(seed)
+    records = list(records)
+    samples: Dict[str, List[float]] = {"total": []}
+    routes: Dict[str, int] = {}
+    route_changes = 0
+    digest = hashlib.sha1()
+
+    for i in range(repeat):
+        # Чистое состояние на каждый повтор: память, правила, сессии
+        workdir = tempfile.mkdtemp(prefix=f"repeat-{i}-", dir=root)
+        os.chdir(workdir)
+        app.memory = RomindSemanticMemory(os.path.join(workdir, RomindSemanticMemory.MEMORY_FILE))
+        app.rule_store = RomindRuleStore(os.path.join(workdir, RULES_FILE))
+        app.sessions = app.SessionRegistry()
+        for rec in records:
+            session = app.sessions.get(rec["session"])
+            if session is None:
+                session = app.sessions.get_or_create(rec["session"])
+                # первое появление сессии — восстанавливаем записанное состояние
+                st, saved = session.state, rec.get("state") or {}
+                if saved.get("persona") in PERSONALITIES:
+                    st.persona_id = saved["persona"]
+                st.emotion = saved.get("emotion", st.emotion)
+                st.trust = float(saved.get("trust", st.trust))
+                st.set_role_context(saved.get("role_context"))
+
+            started = time.perf_counter()
+            turn = app.run_session_turn(
+                session, rec["message"], persona=rec.get("persona"), history=rec.get("history"), rng=rng
+            )
+            samples["total"].append((time.perf_counter() - started) * 1000)
+            for name, seconds in turn.timings.items():
+                samples.setdefault(name, []).append(seconds * 1000)
+
+            routes[turn.route or "none"] = routes.get(turn.route or "none", 0) + 1
+            if rec.get("route") and rec["route"] != turn.route:
+                route_changes += 1
+            digest.update((turn.reply or "").encode("utf-8"))
+    os.chdir(root)
+
+    return {
+        "turns": len(records) * repeat,
+        "seed": seed,
+        "routes": routes,
+        "route_changes": route_changes,
+        # одинаковый seed и сборка -> одинаковый отпечаток ответов
+        "reply_digest": digest.hexdigest(),
+        "stages_ms": summarize_timings(samples),
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Разница p50/p95 по стадиям: мс и проценты относительно baseline."""
+    deltas = {}
+    base_stages = baseline.get("stages_ms", {})
+    for name, cur in report.get("stages_ms", {}).items():
+        base = base_stages.get(name)
+        if not base:
+            continue
+        row: Dict[str, Any] = {}
+        for key in ("p50", "p95"):
+            diff = cur[key] - base[key]
+            row[f"{key}_delta_ms"] = round(diff, 3)
+            row[f"{key}_delta_pct"] = round(diff / base[key] * 100, 1) if base[key] else None
+        deltas[name] = row
+    return deltas
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay captured ROMIND /chat traffic.")
+    parser.add_argument("capture", help="JSONL-файл, записанный с ROMIND_CAPTURE_FILE")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз прогнать запись")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="задержка заглушки LLM, секунды")
+    parser.add_argument("--baseline", help="сравнить с сохранённым отчётом")
+    parser.add_argument("--save-baseline", help="сохранить отчёт как baseline")
+    parser.add_argument("--threshold", type=float, default=20.0, help="допустимый рост p50, %%")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="меньший рост p50 — шум, не регрессия")
+    parser.add_argument("--workdir", help="каталог для файлов памяти (по умолчанию — временный)")
+    args = parser.parse_args(argv)
+
+    capture = os.path.abspath(args.capture)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+
+    # Окружение replay — до импорта приложения
+    os.environ["ROMIND_LLM_BACKEND"] = "stub"
+    os.environ.pop("ROMIND_CAPTURE_FILE", None)
+    os.environ["ROMIND_SCENARIOS"] = "0"
+    os.environ["ROMIND_ENRICH_ASYNC"] = "0"
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="romind-replay-"))
+
+    import romind_cloud_app as app
+    app.llm.latency = args.llm_latency
+
+    report = replay(iter_capture(capture), seed=args.seed, repeat=args.repeat)
+
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["delta"] = compare(report, baseline)
+        report["baseline_digest_match"] = baseline.get("reply_digest") == report["reply_digest"]
+        for name, row in report["delta"].items():
+            pct = row.get("p50_delta_pct")
+            if pct is not None and pct > args.threshold and row["p50_delta_ms"] >= args.min_delta_ms:
+                regressions.append(name)
+        report["regressions"] = regressions
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Выбор модели под сложность сообщения.
+
+«спасибо» и длинная карьерная дилемма не должны идти в одну и ту же модель.
+Политика:
+1. Базовый уровень (fast / standard / deep) по длине сообщения,
+   роли (mentor/teacher — глубже, smalltalk — быстрее) и персоне.
+2. Для каждой модели ведётся скользящая статистика задержки и ошибок
+   (не старше STATS_MAX_AGE секунд).
+3. Если модель деградировала (медленная или много ошибок),
+   трафик уходит на соседний уровень. Раз в PROBE_INTERVAL она получает
+   пробный запрос; удачная проба сбрасывает окно, и модель сразу
+   возвращается в работу.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from romind_core_logic import RomindState
+
+# Уровни моделей (можно переопределить через окружение)
+MODEL_TIERS: Dict[str, str] = {
+    "fast": os.getenv("ROMIND_MODEL_FAST", "gpt-4.1-nano"),
+    "standard": os.getenv("ROMIND_MODEL_STANDARD", "gpt-4.1-mini"),
+    "deep": os.getenv("ROMIND_MODEL_DEEP", "gpt-4.1"),
+}
+TIER_ORDER: List[str] = ["fast", "standard", "deep"]
+
+# Целевая задержка ответа модели (секунды) и допустимая доля ошибок
+LATENCY_TARGET = float(os.getenv("ROMIND_LATENCY_TARGET", "6.0"))
+ERROR_RATE_LIMIT = 0.25
+# Размер скользящего окна статистики и минимум наблюдений для выводов
+STATS_WINDOW = 50
+MIN_SAMPLES = 5
+# Наблюдения старше этого (секунды) не учитываются
+STATS_MAX_AGE = float(os.getenv("ROMIND_ROUTING_STATS_MAX_AGE", "300"))
+# Деградировавшая модель получает пробный запрос не чаще, чем раз в N секунд
+PROBE_INTERVAL = 30.0
+
+# Роли, где нужна глубина рассуждения
+DEEP_ROLES = {"mentor", "teacher"}
+# Персоны, которым не нужна тяжёлая модель для коротких реплик
+LIGHT_PERSONAS = {"RAZ", "MIRA", "LAYLA"}
+# Границы длины сообщения (в словах)
+SHORT_WORDS = 8
+LONG_WORDS = 60
+
+
+class ModelStats:
+    """Скользящие задержки и ошибки одной модели: (время, задержка, успех)."""
+
+    def __init__(self, window: int = STATS_WINDOW, max_age: float = STATS_MAX_AGE) -> None:
+        self.samples: Deque[Tuple[float, float, bool]] = deque(maxlen=window)
+        self.max_age = max_age
+        self.last_probe = 0.0
+        self.probing = False
+        self.calls = 0
+        self.errors = 0
+
+    def _expire(self, now: float) -> None:
+        while self.samples and now - self.samples[0][0] > self.max_age:
+            self.samples.popleft()
+
+    def record(self, latency: float, ok: bool, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        if self.probing:
+            # Ответ на пробу: здоровая модель начинает с чистого окна
+            self.probing = False
+            if ok and latency <= LATENCY_TARGET:
+                self.samples.clear()
+        self.samples.append((now, latency, ok))
+        self._expire(now)
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+
+    def p50(self) -> Optional[float]:
+        lat = sorted(l for _, l, ok in self.samples if ok)
+        if not lat:
+            return None
+        return lat[len(lat) // 2]
+
+    def p95(self) -> Optional[float]:
+        lat = sorted(l for _, l, ok in self.samples if ok)
+        if not lat:
+            return None
+        return lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, _, ok in self.samples if not ok) / len(self.samples)
+
+    def degraded(self, now: Optional[float] = None) -> bool:
+        self._expire(time.monotonic() if now is None else now)
+        if len(self.samples) < MIN_SAMPLES:
+            return False
+        if self.error_rate() > ERROR_RATE_LIMIT:
+            return True
+        p50 = self.p50()
+        return p50 is not None and p50 > LATENCY_TARGET
+
+
+class ModelRouter:
+    def __init__(self, tiers: Optional[Dict[str, str]] = None) -> None:
+        self.tiers = dict(tiers or MODEL_TIERS)
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+        self.decisions: Dict[str, int] = {}
+        self.shifted = 0
+
+    # --- Политика ---
+
+    def base_tier(self, text: str, state: RomindState) -> str:
+        words = len(text.split())
+        role = state.role_context
+        if words >= LONG_WORDS or (role in DEEP_ROLES and words > SHORT_WORDS):
+            return "deep"
+        if words <= SHORT_WORDS and role not in DEEP_ROLES:
+            return "fast"
+        if state.persona_id in LIGHT_PERSONAS and role not in DEEP_ROLES and words < LONG_WORDS // 2:
+            return "fast"
+        return "standard"
+
+    def _stats_for(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats.setdefault(model, ModelStats())
+        return stats
+
+    def _usable(self, model: str, now: float) -> bool:
+        stats = self._stats_for(model)
+        if not stats.degraded(now):
+            return True
+        # Изредка пропускаем пробный запрос, чтобы заметить восстановление
+        if not stats.last_probe:
+            stats.last_probe = now
+            return False
+        if now - stats.last_probe >= PROBE_INTERVAL:
+            stats.last_probe = now
+            stats.probing = True
+            return True
+        return False
+
+    def choose(self, text: str, state: RomindState) -> str:
+        """Модель для хода: базовый уровень, а при деградации — ближайший здоровый."""
+        tier = self.base_tier(text, state)
+        i = TIER_ORDER.index(tier)
+        # сначала соседние уровни вниз (дешевле и быстрее), потом вверх
+        candidates = [tier] + TIER_ORDER[:i][::-1] + TIER_ORDER[i + 1:]
+        now = time.monotonic()
+        with self._lock:
+            chosen = None
+            for t in candidates:
+                model = self.tiers.get(t)
+                if model and self._usable(model, now):
+                    chosen = t
+                    break
+            if chosen is None:
+                chosen = tier
+            if chosen != tier:
+                self.shifted += 1
+            key = f"{tier}->{chosen}" if chosen != tier else tier
+            self.decisions[key] = self.decisions.get(key, 0) + 1
+        return self.tiers[chosen]
+
+    def record(self, model: str, latency: float, ok: bool) -> None:
+        with self._lock:
+            self._stats_for(model).record(latency, ok)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {}
+            for model, s in self._stats.items():
+                p50, p95 = s.p50(), s.p95()
+                models[model] = {
+                    "calls": s.calls,
+                    "errors": s.errors,
+                    "error_rate": round(s.error_rate(), 4),
+                    "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                    "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                    "degraded": s.degraded(),
+                }
+            return {
+                "tiers": dict(self.tiers),
+                "latency_target_ms": LATENCY_TARGET * 1000,
+                "decisions": dict(self.decisions),
+                "shifted": self.shifted,
+                "models": models,
+            }
@@ -0,0 +1,196 @@
+"""
+Хранилище правил, которым пользователь обучил ROMIND ("ROMIND, запомни: ...").
+
+Раньше правило было лишь записью SYSTEM_RULE в общем потоке памяти:
+оно вытеснялось через MAX_RECORDS сообщений и не попадало в промпт.
+Теперь:
+- отдельный файл romind_rules.json
+- дедупликация по sha1 нормализованного текста (регистр, пробелы,
+  конечная пунктуация не важны)
+- область действия: все персоны или только перечисленные
+- готовый фрагмент промпта для каждой персоны пересобирается только
+  при изменении правил и укладывается в бюджет токенов —
+  на запрос остаётся один dict lookup
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from romind_core_logic import PERSONALITIES
+
+RULES_FILE = "romind_rules.json"
+# Сколько токенов промпта можно отдать правилам одной персоны
+RULES_TOKEN_BUDGET = int(os.getenv("ROMIND_RULES_TOKEN_BUDGET", "300"))
+# Префикс правил в общем потоке памяти (см. stage_teach)
+SYSTEM_RULE_PREFIX = "SYSTEM_RULE:"
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_rule(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip().rstrip(".!;").strip().lower()
+
+
+def rule_id(text: str) -> str:
+    return hashlib.sha1(normalize_rule(text).encode("utf-8")).hexdigest()[:16]
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка без токенайзера: ~3 символа на токен (кириллица + латиница)."""
+    return max(1, len(text) // 3)
+
+
+class RomindRuleStore:
+    def __init__(self, path: str = RULES_FILE, token_budget: int = RULES_TOKEN_BUDGET) -> None:
+        self.path = path
+        self.token_budget = token_budget
+        # id -> {"id", "text", "personas": [] (пусто — все), "created_at", "updated_at"}
+        self.rules: Dict[str, Dict[str, Any]] = {}
+        self._fragments: Dict[Optional[str], str] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+        self._load()
+        self._rebuild()
+
+    # --- Файл ---
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            if isinstance(raw, list):
+                self.rules = {r["id"]: r for r in raw if isinstance(r, dict) and r.get("id")}
+        except Exception:
+            self.rules = {}
+
+    def _save(self) -> None:
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(list(self.rules.values()), f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+    # --- Фрагменты промпта ---
+
+    def _build_fragment(self, persona: Optional[str]) -> str:
+        """
+        Правила персоны: сначала её собственные, затем общие, новые раньше старых —
+        пока помещаются в бюджет; в промпт идут в порядке добавления.
+        """
+        scoped, shared = [], []
+        for r in self.rules.values():
+            if not r["personas"]:
+                shared.append(r)
+            elif persona in r["personas"]:
+                scoped.append(r)
+        ranked = sorted(scoped, key=lambda r: r["created_at"], reverse=True)
+        ranked += sorted(shared, key=lambda r: r["created_at"], reverse=True)
+
+        chosen, used = [], 0
+        for r in ranked:
+            line = f"- {r['text']}"
+            cost = estimate_tokens(line)
+            if used + cost > self.token_budget:
+                continue
+            chosen.append((r["created_at"], line))
+            used += cost
+        return "\n".join(line for _, line in sorted(chosen))
+
+    def _rebuild(self) -> None:
+        """Пересчёт фрагментов всех персон — только при изменении правил."""
+        fragments = {None: self._build_fragment(None)}
+        for pid in PERSONALITIES:
+            fragments[pid] = self._build_fragment(pid)
+        self._fragments = fragments
+        self.version += 1
+
+    def fragment(self, persona: Optional[str] = None) -> str:
+        """Готовый текст правил для промпта персоны (пустая строка — правил нет)."""
+        fragments = self._fragments
+        text = fragments.get(persona)
+        return text if text is not None else fragments.get(None, "")
+
+    # --- Изменение ---
+
+    def add(
+        self,
+        text: str,
+        personas: Optional[Iterable[str]] = None,
+        created_at: Optional[str] = None,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Добавляет правило. personas — область действия (None/пусто — все).
+        Возвращает (правило, изменилось ли хранилище).
+        Неизвестная персона — ValueError: такое правило не попало бы ни в один фрагмент.
+        """
+        text = _WS_RE.sub(" ", text).strip()
+        scope = sorted({p.strip().upper() for p in personas or () if p and p.strip()})
+        unknown = [p for p in scope if p not in PERSONALITIES]
+        if unknown:
+            raise ValueError(f"Unknown personas: {', '.join(unknown)}")
+        rid = rule_id(text)
+        now = created_at or datetime.utcnow().isoformat()
+        with self._lock:
+            rule = self.rules.get(rid)
+            if rule is None:
+                rule = {"id": rid, "text": text, "personas": scope, "created_at": now, "updated_at": now}
+                self.rules[rid] = rule
+            else:
+                # Повтор: расширяем область действия; общее правило остаётся общим
+                if not rule["personas"]:
+                    return rule, False
+                merged = [] if not scope else sorted(set(rule["personas"]) | set(scope))
+                if merged == rule["personas"]:
+                    return rule, False
+                rule["personas"] = merged
+                rule["updated_at"] = now
+            self._rebuild()
+            self._save()
+        return rule, True
+
+    def remove(self, rid: str) -> bool:
+        with self._lock:
+            if self.rules.pop(rid, None) is None:
+                return False
+            self._rebuild()
+            self._save()
+        return True
+
+    def list(self, persona: Optional[str] = None) -> List[Dict[str, Any]]:
+        rules = sorted(self.rules.values(), key=lambda r: r["created_at"])
+        if persona is None:
+            return rules
+        return [r for r in rules if not r["personas"] or persona in r["personas"]]
+
+    def import_memory_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Переносит старые записи SYSTEM_RULE из потока памяти (как общие правила)."""
+        added = 0
+        for r in records:
+            text = str(r.get("user_text") or "")
+            if text.startswith(SYSTEM_RULE_PREFIX):
+                content = text[len(SYSTEM_RULE_PREFIX):].strip()
+                if content and self.add(content, created_at=r.get("time"))[1]:
+                    added += 1
+        return added
+
+    def stats(self) -> Dict[str, Any]:
+        fragments = self._fragments
+        return {
+            "rules": len(self.rules),
+            "version": self.version,
+            "token_budget": self.token_budget,
+            "fragment_tokens": {
+                (p or "*"): estimate_tokens(t) if t else 0 for p, t in fragments.items()
+            },
+        }
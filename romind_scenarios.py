@@ -0,0 +1,417 @@
+"""
+Сценарии устройств ScentUnivers™.
+
+После выбора персоны и эмоции ROMIND подбирает сценарий для блоков
+экосистемы (запах, свет, звук, визуальный фон, интерфейсы) и исполняет его:
+
+- таблица сценариев собирается один раз:
+  (персона, группа эмоции, роль, близость) -> команды по категориям блоков
+- команды рассылаются адаптерам устройств параллельно (asyncio),
+  у каждого адаптера (хаба устройств) свой таймаут
+- команды одному устройству отправляются одним пакетом
+- повторная команда, которая не меняет состояние устройства, не отправляется
+- у каждой сессии свой набор устройств (DeviceSet) и своё «уже отправлено»;
+  сценарии одной сессии исполняются по очереди, а устаревший (за ним
+  уже пришёл более новый) отбрасывается, не дойдя до устройств
+
+Движок живёт в собственном event loop в фоновом потоке, поэтому
+синхронный код (FastAPI-обработчики, консоль) просто вызывает submit().
+Включается явно: ROMIND_SCENARIOS=1 (и свой adapter_factory для реальных
+хабов; по умолчанию — simulated_adapters).
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from romind_core_logic import (
+    PERSONALITIES,
+    RomindState,
+    get_emotion_group,
+    get_proximity_level,
+    EMOTION_GROUPS,
+)
+
+# ROMIND_SCENARIOS=1 — исполнять сценарии устройств после каждого хода.
+# По умолчанию выключено: из коробки адаптеры только симулированные.
+SCENARIOS_ENABLED = os.getenv("ROMIND_SCENARIOS", "0") == "1"
+# Таймаут ответа одного устройства (секунды)
+DEVICE_TIMEOUT = float(os.getenv("ROMIND_DEVICE_TIMEOUT", "0.25"))
+# Сколько наборов устройств (сессий) держим в памяти (LRU)
+SCENARIO_MAX_SESSIONS = int(os.getenv("ROMIND_SCENARIO_SESSIONS", "1000"))
+# Сессия старых клиентов без session_id (см. romind_session.DEFAULT_SESSION_ID)
+DEFAULT_DEVICE_SET = "default"
+
+# Категории блоков ScentUnivers (см. romind_universe_manifest.md)
+BLOCK_CATEGORIES = ("scent", "light", "audio", "visual", "interface")
+
+# 28 блоков экосистемы: (id блока, категория)
+SCENT_BLOCKS: List[Tuple[str, str]] = (
+    [(f"scent-{i}", "scent") for i in range(1, 8)]
+    + [(f"light-{i}", "light") for i in range(1, 7)]
+    + [(f"audio-{i}", "audio") for i in range(1, 6)]
+    + [(f"visual-{i}", "visual") for i in range(1, 6)]
+    + [(f"interface-{i}", "interface") for i in range(1, 6)]
+)
+
+
+# === 1. Таблица сценариев ===
+
+# Базовая палитра по группе эмоции
+EMOTION_PALETTE: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "low": {
+        "scent": {"profile": "lavender", "intensity": 0.3},
+        "light": {"color": "amber", "brightness": 0.3},
+        "audio": {"track": "soft_rain", "volume": 0.25},
+        "visual": {"scene": "dusk"},
+        "interface": {"mode": "minimal"},
+    },
+    "anxious": {
+        "scent": {"profile": "vetiver", "intensity": 0.35},
+        "light": {"color": "warm_white", "brightness": 0.45},
+        "audio": {"track": "breathing_4_7_8", "volume": 0.3},
+        "visual": {"scene": "slow_waves"},
+        "interface": {"mode": "steps"},
+    },
+    "hurt": {
+        "scent": {"profile": "vanilla_musk", "intensity": 0.35},
+        "light": {"color": "rose", "brightness": 0.35},
+        "audio": {"track": "warm_piano", "volume": 0.3},
+        "visual": {"scene": "candle"},
+        "interface": {"mode": "presence"},
+    },
+    "bright": {
+        "scent": {"profile": "bergamot", "intensity": 0.5},
+        "light": {"color": "daylight", "brightness": 0.8},
+        "audio": {"track": "uplift", "volume": 0.45},
+        "visual": {"scene": "sunrise"},
+        "interface": {"mode": "celebrate"},
+    },
+    "tense": {
+        "scent": {"profile": "cedar", "intensity": 0.3},
+        "light": {"color": "cool_white", "brightness": 0.5},
+        "audio": {"track": "low_drone", "volume": 0.2},
+        "visual": {"scene": "still_lake"},
+        "interface": {"mode": "calm_down"},
+    },
+    "neutral": {
+        "scent": {"profile": "oud_light", "intensity": 0.4},
+        "light": {"color": "neutral", "brightness": 0.6},
+        "audio": {"track": "ambient", "volume": 0.3},
+        "visual": {"scene": "default"},
+        "interface": {"mode": "standard"},
+    },
+}
+
+# Поправки персоны (поверх палитры)
+PERSONA_ACCENTS: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "RO": {"interface": {"mode": "structured"}, "audio": {"volume": 0.15}},
+    "AETHER": {"visual": {"scene": "nebula"}, "scent": {"profile": "incense"}},
+    "RAZ": {"light": {"brightness": 0.9}, "audio": {"track": "drive"}},
+    "MIRA": {"scent": {"profile": "rose_soft"}, "light": {"color": "rose"}},
+    "LAYLA": {"scent": {"profile": "chamomile"}, "interface": {"mode": "ritual"}},
+}
+
+# Поправки близости: чем ближе, тем мягче и интимнее
+PROXIMITY_ACCENTS: Dict[str, Dict[str, float]] = {
+    "outer": {"intensity": 0.8, "brightness": 1.0, "volume": 0.8},
+    "middle": {"intensity": 1.0, "brightness": 1.0, "volume": 1.0},
+    "inner": {"intensity": 1.15, "brightness": 0.8, "volume": 0.9},
+}
+
+ROLE_ACCENTS: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "parent": {"audio": {"track": "lullaby"}},
+    "child": {"visual": {"scene": "stars"}},
+    "mentor": {"interface": {"mode": "focus"}},
+    "teacher": {"interface": {"mode": "focus"}},
+}
+
+ROLE_KEYS = (None, "partner", "parent", "friend", "mentor", "teacher", "child")
+PROXIMITY_KEYS = ("outer", "middle", "inner")
+
+
+def _build_scenario(persona: str, group: str, role: Optional[str], proximity: str) -> Dict[str, Dict[str, Any]]:
+    scenario = {cat: dict(params) for cat, params in EMOTION_PALETTE[group].items()}
+    for accents in (PERSONA_ACCENTS.get(persona, {}), ROLE_ACCENTS.get(role or "", {})):
+        for cat, params in accents.items():
+            scenario[cat].update(params)
+    for cat, params in scenario.items():
+        for key, factor in PROXIMITY_ACCENTS[proximity].items():
+            if key in params:
+                params[key] = round(min(1.0, params[key] * factor), 2)
+    return scenario
+
+
+def compile_scenario_table() -> Dict[Tuple[str, str, Optional[str], str], Dict[str, Dict[str, Any]]]:
+    """Все сочетания персона × группа эмоции × роль × близость — заранее."""
+    table = {}
+    for persona in PERSONALITIES:
+        for group in list(EMOTION_GROUPS) + ["neutral"]:
+            for role in ROLE_KEYS:
+                for proximity in PROXIMITY_KEYS:
+                    table[(persona, group, role, proximity)] = _build_scenario(persona, group, role, proximity)
+    return table
+
+
+SCENARIO_TABLE = compile_scenario_table()
+
+
+def scenario_key(state: RomindState) -> Tuple[str, str, Optional[str], str]:
+    persona = state.persona_id if state.persona_id in PERSONALITIES else "ROMIND"
+    role = state.role_context if state.role_context in ROLE_KEYS else None
+    return (
+        persona,
+        get_emotion_group(state.emotion),
+        role,
+        get_proximity_level(state.trust, state.role_context),
+    )
+
+
+# === 2. Устройства ===
+
+class DeviceCommand:
+    """Команда блоку: установить параметры категории."""
+
+    __slots__ = ("device_id", "category", "params")
+
+    def __init__(self, device_id: str, category: str, params: Dict[str, Any]) -> None:
+        self.device_id = device_id
+        self.category = category
+        self.params = params
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"device": self.device_id, "category": self.category, "params": self.params}
+
+
+class DeviceAdapter(abc.ABC):
+    """
+    Адаптер одного транспорта (BLE-хаб, MQTT, HTTP-шлюз...).
+    Обслуживает несколько устройств; команды приходят пакетом.
+    """
+
+    def __init__(self, adapter_id: str, devices: List[Tuple[str, str]]) -> None:
+        self.adapter_id = adapter_id
+        self.devices = devices        # [(device_id, category)]
+
+    @abc.abstractmethod
+    async def send_batch(self, commands: List[DeviceCommand]) -> None:
+        """Отправляет пакет команд; ошибка устройства — исключение."""
+
+
+class SimulatedDeviceAdapter(DeviceAdapter):
+    """Локальная имитация: задержка на пакет + запоминание состояния устройств."""
+
+    def __init__(
+        self,
+        adapter_id: str,
+        devices: List[Tuple[str, str]],
+        latency: float = 0.005,
+        jitter: float = 0.005,
+        fail_rate: float = 0.0,
+    ) -> None:
+        super().__init__(adapter_id, devices)
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.applied: Dict[str, Dict[str, Any]] = {}
+        self.batches = 0
+
+    async def send_batch(self, commands: List[DeviceCommand]) -> None:
+        await asyncio.sleep(self.latency + random.random() * self.jitter)
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise RuntimeError(f"{self.adapter_id}: simulated failure")
+        self.batches += 1
+        for cmd in commands:
+            self.applied[cmd.device_id] = dict(cmd.params)
+
+
+def simulated_adapters(hubs: int = 4, **kwargs: Any) -> List[DeviceAdapter]:
+    """28 блоков, распределённых по нескольким имитированным хабам."""
+    adapters: List[DeviceAdapter] = []
+    for h in range(hubs):
+        devices = SCENT_BLOCKS[h::hubs]
+        adapters.append(SimulatedDeviceAdapter(f"sim-hub-{h + 1}", devices, **kwargs))
+    return adapters
+
+
+# === 3. Движок ===
+
+class DeviceSet:
+    """Устройства одной сессии и то, что им уже подтверждённо отправлено."""
+
+    def __init__(self, adapters: List[DeviceAdapter]) -> None:
+        self.adapters = adapters
+        # последнее подтверждённое состояние устройства (для дедупликации)
+        self.applied: Dict[str, Dict[str, Any]] = {}
+        self.last_key: Optional[Tuple[Any, ...]] = None
+        # номер последнего submit: более старые сценарии устарели
+        self.submitted = 0
+        # очередь сценариев сессии; создаётся в loop движка
+        self.lock: Optional[asyncio.Lock] = None
+        self.last_report: Dict[str, Any] = {}
+
+
+class ScenarioEngine:
+    def __init__(
+        self,
+        adapter_factory: Optional[Callable[[str], List[DeviceAdapter]]] = None,
+        device_timeout: float = DEVICE_TIMEOUT,
+        max_sessions: int = SCENARIO_MAX_SESSIONS,
+    ) -> None:
+        # session_id -> адаптеры устройств этой сессии (по умолчанию — имитация)
+        self.adapter_factory = adapter_factory or (lambda session_id: simulated_adapters())
+        self.device_timeout = device_timeout
+        self.max_sessions = max_sessions
+        self._sets: "OrderedDict[str, DeviceSet]" = OrderedDict()
+        self._sets_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.last_report: Dict[str, Any] = {}
+        self.dispatches = 0
+        self.superseded = 0
+        self.skipped_commands = 0
+
+    def devices(self, session_id: str = DEFAULT_DEVICE_SET) -> DeviceSet:
+        with self._sets_lock:
+            devices = self._sets.get(session_id)
+            if devices is None:
+                devices = self._sets[session_id] = DeviceSet(self.adapter_factory(session_id))
+                while len(self._sets) > self.max_sessions:
+                    self._sets.popitem(last=False)
+            else:
+                self._sets.move_to_end(session_id)
+            return devices
+
+    # --- Планирование ---
+
+    def plan(self, devices: DeviceSet, state: RomindState) -> Dict[str, List[DeviceCommand]]:
+        """Команды по адаптерам; устройства, уже находящиеся в нужном состоянии, пропускаются."""
+        scenario = SCENARIO_TABLE[scenario_key(state)]
+        batches: Dict[str, List[DeviceCommand]] = {}
+        for adapter in devices.adapters:
+            commands = []
+            for device_id, category in adapter.devices:
+                params = scenario.get(category)
+                if params is None:
+                    continue
+                if devices.applied.get(device_id) == params:
+                    self.skipped_commands += 1
+                    continue
+                commands.append(DeviceCommand(device_id, category, params))
+            if commands:
+                batches[adapter.adapter_id] = commands
+        return batches
+
+    async def apply(
+        self,
+        state: RomindState,
+        session_id: str = DEFAULT_DEVICE_SET,
+        seq: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Планирует и параллельно рассылает сценарий сессии; возвращает отчёт.
+        seq — номер submit: сценарий, за которым уже пришёл более новый,
+        отбрасывается. Сценарии одной сессии не перекрываются.
+        """
+        devices = self.devices(session_id)
+        if devices.lock is None:
+            devices.lock = asyncio.Lock()
+        async with devices.lock:
+            if seq is not None and seq < devices.submitted:
+                self.superseded += 1
+                return {"superseded": True}
+            return await self._dispatch(devices, state, seq)
+
+    async def _dispatch(self, devices: DeviceSet, state: RomindState, seq: Optional[int]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        key = scenario_key(state)
+        batches = self.plan(devices, state)
+        by_id = {a.adapter_id: a for a in devices.adapters}
+
+        async def _send(adapter_id: str, commands: List[DeviceCommand]) -> Tuple[str, Optional[str]]:
+            try:
+                await asyncio.wait_for(by_id[adapter_id].send_batch(commands), self.device_timeout)
+            except asyncio.TimeoutError:
+                return adapter_id, "timeout"
+            except Exception as e:
+                return adapter_id, str(e) or type(e).__name__
+            for cmd in commands:
+                devices.applied[cmd.device_id] = cmd.params
+            return adapter_id, None
+
+        results = await asyncio.gather(*(_send(a, c) for a, c in batches.items()))
+        errors = {a: err for a, err in results if err}
+        sent = sum(len(c) for a, c in batches.items() if a not in errors)
+
+        if errors:
+            # следующий submit с тем же сценарием повторит досылку
+            with self._sets_lock:
+                if seq is None or seq == devices.submitted:
+                    devices.last_key = None
+        self.dispatches += 1
+        devices.last_report = self.last_report = {
+            "scenario": {"persona": key[0], "emotion_group": key[1], "role": key[2], "proximity": key[3]},
+            "adapters": len(batches),
+            "commands_sent": sent,
+            "errors": errors,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        return self.last_report
+
+    # --- Фоновый loop для синхронного кода ---
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=loop.run_forever, name="romind-scenarios", daemon=True
+                )
+                self._thread.start()
+                self._loop = loop
+        return self._loop
+
+    def submit(self, state: RomindState, session_id: str = DEFAULT_DEVICE_SET) -> Optional["asyncio.Future"]:
+        """
+        Неблокирующий запуск сценария сессии из синхронного кода.
+        Если сценарий сессии не изменился с прошлого раза — ничего не делает (None).
+        """
+        devices = self.devices(session_id)
+        key = scenario_key(state)
+        with self._sets_lock:
+            if key == devices.last_key:
+                return None
+            devices.last_key = key
+            devices.submitted += 1
+            seq = devices.submitted
+        # снимок: чат может менять state, пока сценарий в пути
+        return asyncio.run_coroutine_threadsafe(
+            self.apply(state.snapshot(), session_id, seq), self._ensure_loop()
+        )
+
+    def stats(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        report: Dict[str, Any] = {
+            "sessions": len(self._sets),
+            "dispatches": self.dispatches,
+            "superseded": self.superseded,
+            "skipped_commands": self.skipped_commands,
+            "last": self.last_report,
+        }
+        if session_id is not None:
+            devices = self._sets.get(session_id)
+            report["session"] = None if devices is None else {
+                "adapters": len(devices.adapters),
+                "devices": sum(len(a.devices) for a in devices.adapters),
+                "last": devices.last_report,
+            }
+        return report
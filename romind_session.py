@@ -0,0 +1,182 @@
+"""
+Серверные сессии ROMIND.
+
+Сессия держит на сервере то, что раньше клиент пересылал с каждым
+запросом:
+- собственный RomindState (персона, эмоция, доверие, роль)
+- буфер диалога (последние сообщения user/assistant)
+- скользящее резюме более старых ходов (см. romind_summary.py)
+
+Используется WebSocket-эндпоинтом /ws (одна сессия на соединение)
+и /chat (session_id в запросе; по умолчанию — сессия "default").
+to_dict / load — передача сессии между узлами (см. romind_cluster.py).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from romind_core_logic import RomindState
+
+DEFAULT_SESSION_ID = "default"
+# Сколько сообщений держим в буфере одной сессии
+MAX_SESSION_HISTORY = int(os.getenv("ROMIND_SESSION_HISTORY", "50"))
+# Сколько сессий держим в памяти процесса (LRU)
+MAX_SESSIONS = int(os.getenv("ROMIND_MAX_SESSIONS", "1000"))
+
+
+def state_delta(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """Поля describe(), которые изменились за ход."""
+    return {k: v for k, v in after.items() if before.get(k) != v}
+
+
+class RomindSession:
+    """Состояние и буфер диалога одного собеседника."""
+
+    def __init__(
+        self,
+        session_id: str,
+        state: Optional[RomindState] = None,
+        max_history: int = MAX_SESSION_HISTORY,
+    ) -> None:
+        self.session_id = session_id
+        self.state: RomindState = state or RomindState()
+        self.history: List[Dict[str, str]] = []
+        self.max_history = max_history
+        # Резюме того, что уже ушло из history
+        self.summary: str = ""
+        self.summarized_messages: int = 0
+        # Ходы одной сессии выполняются строго по очереди
+        self.lock = threading.RLock()
+        self.created_at = time.time()
+        self.last_active = self.created_at
+
+    def append(self, role: str, content: str) -> None:
+        self.history.append({"role": role, "content": content})
+        if len(self.history) > self.max_history:
+            del self.history[: len(self.history) - self.max_history]
+        self.last_active = time.time()
+
+    def recent(self, limit: int = 10) -> List[Dict[str, str]]:
+        return self.history[-limit:]
+
+    # --- Сериализация (передача сессии другому узлу) ---
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "session_id": self.session_id,
+                "state": self.state.describe(),
+                "history": [dict(m) for m in self.history],
+                "summary": self.summary,
+                "summarized_messages": self.summarized_messages,
+                "created_at": self.created_at,
+                "last_active": self.last_active,
+            }
+
+    def load(self, data: Dict[str, Any]) -> None:
+        """
+        Вливает сессию, пришедшую с другого узла. Если здесь уже успели
+        пройти ходы, они новее: их история дописывается после пришедшей,
+        а состояние остаётся местным.
+        """
+        with self.lock:
+            local_turns = list(self.history)
+            if not local_turns:
+                saved = data.get("state") or {}
+                st = self.state
+                st.persona_id = saved.get("persona", st.persona_id)
+                st.emotion = saved.get("emotion", st.emotion)
+                st.trust = float(saved.get("trust", st.trust))
+                st.role_context = saved.get("role_context")
+                st.last_updated = saved.get("last_updated", st.last_updated)
+            self.history = [dict(m) for m in data.get("history") or []] + local_turns
+            if len(self.history) > self.max_history:
+                del self.history[: len(self.history) - self.max_history]
+            if data.get("summary") and not self.summary:
+                self.summary = data["summary"]
+                self.summarized_messages = int(data.get("summarized_messages", 0))
+            self.created_at = min(self.created_at, float(data.get("created_at", self.created_at)))
+            self.last_active = max(self.last_active, float(data.get("last_active", 0)))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], max_history: int = MAX_SESSION_HISTORY) -> "RomindSession":
+        session = cls(data["session_id"], max_history=max_history)
+        session.load(data)
+        return session
+
+
+class SessionRegistry:
+    """
+    Сессии процесса с вытеснением давно неактивных (LRU).
+    on_evict(ids) вызывается вне замка для вытесненных сессий —
+    чтобы вместе с ними отпускать и их учётные данные (usage).
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        on_evict: Optional[Callable[[List[str]], Any]] = None,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict
+        self._sessions: "OrderedDict[str, RomindSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[RomindSession]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def _add_locked(self, session: RomindSession) -> List[str]:
+        """Добавляет сессию; возвращает id вытесненных."""
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        evicted: List[str] = []
+        while len(self._sessions) > self.max_sessions:
+            oldest_id = next(iter(self._sessions))
+            if oldest_id == DEFAULT_SESSION_ID:
+                # сессию по умолчанию не вытесняем
+                self._sessions.move_to_end(oldest_id)
+                oldest_id = next(iter(self._sessions))
+            self._sessions.pop(oldest_id)
+            evicted.append(oldest_id)
+        return evicted
+
+    def _notify_evicted(self, evicted: List[str]) -> None:
+        if evicted and self.on_evict is not None:
+            self.on_evict(evicted)
+
+    def add(self, session: RomindSession) -> RomindSession:
+        with self._lock:
+            evicted = self._add_locked(session)
+        self._notify_evicted(evicted)
+        return session
+
+    def get_or_create(self, session_id: str) -> RomindSession:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                return session
+            session = RomindSession(session_id)
+            evicted = self._add_locked(session)
+        self._notify_evicted(evicted)
+        return session
+
+    def drop(self, session_id: str) -> Optional[RomindSession]:
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
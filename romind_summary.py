@@ -0,0 +1,222 @@
+"""
+Скользящее резюме длинных разговоров ROMIND.
+
+Сессия хранит:
+- summary — сжатое содержание старых ходов
+- history — несжатый «хвост» последних сообщений
+
+Когда хвост перерастает порог, фоновый поток сворачивает старую часть
+хвоста в summary: дешёвым LLM-вызовом, а без LLM — offline-экстрактивным
+резюме. Запрос пользователя этого не ждёт, а промпт остаётся
+«summary + короткий хвост» на сотнях ходов.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Хвост длиннее этого (в сообщениях) — пора сворачивать
+SUMMARY_TRIGGER = int(os.getenv("ROMIND_SUMMARY_TRIGGER", "24"))
+# Сколько последних сообщений всегда остаётся несжатыми
+SUMMARY_KEEP_TAIL = int(os.getenv("ROMIND_SUMMARY_KEEP_TAIL", "8"))
+# Ограничение длины резюме (символы)
+MAX_SUMMARY_CHARS = int(os.getenv("ROMIND_SUMMARY_MAX_CHARS", "1200"))
+# Сколько предложений оставляет offline-резюме за один проход
+EXTRACTIVE_SENTENCES = 6
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]+[.!?]*")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Служебные слова не должны влиять на вес предложения
+STOPWORDS = {
+    "и", "в", "во", "на", "с", "со", "что", "это", "как", "а", "но", "не", "да",
+    "я", "ты", "он", "она", "мы", "вы", "они", "мне", "меня", "тебя", "у", "к",
+    "по", "за", "из", "от", "до", "так", "же", "ли", "бы", "то", "все", "всё",
+    "the", "a", "an", "and", "or", "to", "of", "is", "in", "it", "i", "you",
+}
+
+# Предложения о себе (факты, планы, чувства) важнее прочих
+SELF_MARKERS = ("я ", "мне ", "меня ", "мой ", "моя ", "мои ", "у меня")
+
+
+# === 1. Offline-резюме ===
+
+def extractive_summary(
+    messages: List[Dict[str, str]],
+    prior_summary: str = "",
+    max_sentences: int = EXTRACTIVE_SENTENCES,
+    max_chars: int = MAX_SUMMARY_CHARS,
+) -> str:
+    """
+    Берёт из реплик пользователя самые «весомые» предложения
+    (частотные слова + высказывания о себе) в исходном порядке
+    и дописывает их к предыдущему резюме.
+    """
+    sentences: List[str] = []
+    seen = set()
+    for m in messages:
+        if m.get("role") != "user":
+            continue
+        for s in _SENTENCE_RE.findall(m.get("content") or ""):
+            s = s.strip()
+            key = s.rstrip(".!?").lower()
+            # повторы (и то, что уже есть в резюме) не добавляем
+            if key in seen or key in prior_summary.lower():
+                continue
+            if len(_WORD_RE.findall(s)) >= 2:
+                seen.add(key)
+                sentences.append(s)
+
+    if sentences:
+        freq: Dict[str, int] = {}
+        tokenized = []
+        for s in sentences:
+            words = [w for w in _WORD_RE.findall(s.lower()) if w not in STOPWORDS]
+            tokenized.append(words)
+            for w in set(words):
+                freq[w] = freq.get(w, 0) + 1
+
+        scored = []
+        for i, (s, words) in enumerate(zip(sentences, tokenized)):
+            score = sum(freq[w] for w in words) / (len(words) or 1)
+            if s.lower().startswith(SELF_MARKERS):
+                score += 1.0
+            scored.append((score, i))
+        best = sorted(i for _, i in sorted(scored, reverse=True)[:max_sentences])
+        new_part = " ".join(sentences[i].rstrip(".!?") + "." for i in best)
+    else:
+        new_part = ""
+
+    summary = " ".join(p for p in (prior_summary.strip(), new_part) if p)
+    if len(summary) > max_chars:
+        # Старое содержание уходит первым
+        summary = "…" + summary[-(max_chars - 1):]
+    return summary
+
+
+def build_summary_prompt(messages: List[Dict[str, str]], prior_summary: str) -> List[Dict[str, str]]:
+    """Сообщения для дешёвого LLM-вызова, который обновляет резюме."""
+    dialogue = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in messages)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Ты сжимаешь историю разговора для долгой памяти ROMIND. "
+                "Сохрани факты о пользователе, его цели, решения, эмоции и открытые вопросы. "
+                f"Не более {MAX_SUMMARY_CHARS} символов. Без вступлений."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Текущее резюме:\n{prior_summary or '(пусто)'}\n\nНовые сообщения:\n{dialogue}",
+        },
+    ]
+
+
+# === 2. Фоновый сворачиватель ===
+
+class RollingSummarizer:
+    """
+    Один фоновый поток + очередь сессий.
+    Сессия ставится в очередь один раз, сколько бы ходов ни пришло, пока она ждёт.
+    """
+
+    def __init__(
+        self,
+        llm: Optional[Callable[[List[Dict[str, str]], str], Optional[str]]] = None,
+        trigger: int = SUMMARY_TRIGGER,
+        keep_tail: int = SUMMARY_KEEP_TAIL,
+    ) -> None:
+        self.llm = llm
+        self.trigger = trigger
+        self.keep_tail = keep_tail
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._pending: set = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.llm_runs = 0
+        self.failures = 0
+        self.last_duration = 0.0
+
+    def needs_refresh(self, session: Any) -> bool:
+        return len(session.history) > self.trigger
+
+    def maybe_schedule(self, session: Any) -> bool:
+        """Ставит сессию в очередь, если несжатый хвост перерос порог."""
+        if not self.needs_refresh(session):
+            return False
+        with self._lock:
+            if session.session_id in self._pending:
+                return False
+            self._pending.add(session.session_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._worker, name="romind-summarizer", daemon=True
+                )
+                self._thread.start()
+        self._queue.put(session)
+        return True
+
+    def _worker(self) -> None:
+        while True:
+            session = self._queue.get()
+            try:
+                self.refresh(session)
+            except Exception:
+                self.failures += 1
+            finally:
+                with self._lock:
+                    self._pending.discard(session.session_id)
+                self._queue.task_done()
+
+    def refresh(self, session: Any) -> bool:
+        """Сворачивает старую часть хвоста в summary. Можно вызывать и синхронно."""
+        with session.lock:
+            cut = len(session.history) - self.keep_tail
+            if cut <= 0:
+                return False
+            old = list(session.history[:cut])
+            prior = session.summary
+
+        started = time.perf_counter()
+        summary: Optional[str] = None
+        if self.llm is not None:
+            try:
+                # session_id — чтобы расход резюме шёл в учёт и бюджет сессии
+                summary = self.llm(build_summary_prompt(old, prior), session.session_id)
+                if summary:
+                    summary = summary.strip()[:MAX_SUMMARY_CHARS]
+                    self.llm_runs += 1
+            except Exception:
+                summary = None
+        if not summary:
+            summary = extractive_summary(old, prior)
+
+        with session.lock:
+            # Пока считали, хвост мог подрезаться — тогда результат устарел
+            if session.history[:cut] != old:
+                return False
+            del session.history[:cut]
+            session.summary = summary
+            session.summarized_messages += cut
+
+        self.runs += 1
+        self.last_duration = time.perf_counter() - started
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "trigger": self.trigger,
+            "keep_tail": self.keep_tail,
+            "queued": self._queue.qsize(),
+            "runs": self.runs,
+            "llm_runs": self.llm_runs,
+            "failures": self.failures,
+            "last_duration_ms": round(self.last_duration * 1000, 2),
+        }
@@ -0,0 +1,285 @@
+"""
+Учёт токенов, задержки и стоимости LLM-вызовов ROMIND.
+
+Каждый вызов (LLMResult.usage + задержка + модель) раскладывается
+по четырём разрезам: сессия, персона, модель, размер истории в промпте.
+
+- счётчики шардированы по потокам: поток пишет только в свой шард,
+  без общих замков на пути запроса; чтение суммирует шарды
+- GET /metrics/usage — сводка; ROMIND_USAGE_DUMP_FILE — раз в
+  ROMIND_USAGE_DUMP_INTERVAL секунд дописывается JSONL-строка
+  с приростом за интервал
+- ROMIND_SESSION_TOKEN_BUDGET — лимит токенов на сессию; после него
+  сессия отвечает offline, не расходуя LLM
+- строки разреза "session" живут, пока жива сессия: вытесненные из
+  SessionRegistry сессии забываются (forget_sessions), остальные
+  разрезы ограничены по построению (модели, персоны, корзины).
+  Для бюджета потраченное забытой сессией хранится отдельно ещё
+  ROMIND_USAGE_SESSION_TTL секунд — вытеснение бюджет не обнуляет
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 0 — без лимита
+SESSION_TOKEN_BUDGET = int(os.getenv("ROMIND_SESSION_TOKEN_BUDGET", "0"))
+USAGE_DUMP_FILE = os.getenv("ROMIND_USAGE_DUMP_FILE")
+USAGE_DUMP_INTERVAL = float(os.getenv("ROMIND_USAGE_DUMP_INTERVAL", "60"))
+# Сколько помним расход вытесненной сессии для бюджета (секунды)
+USAGE_SESSION_TTL = float(os.getenv("ROMIND_USAGE_SESSION_TTL", "86400"))
+
+# Цена за 1M токенов: (prompt, cached prompt, completion), USD.
+# Переопределение: ROMIND_MODEL_PRICES='{"my-model": [0.4, 0.1, 1.6]}'
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+}
+try:
+    MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.getenv("ROMIND_MODEL_PRICES", "{}")).items()})
+except Exception:
+    pass
+
+# Границы корзин размера истории (сообщений в промпте)
+HISTORY_BUCKETS: List[Tuple[int, str]] = [(0, "0"), (4, "1-4"), (16, "5-16"), (48, "17-48")]
+HISTORY_BUCKET_MAX = "49+"
+
+# Поля счётчика
+FIELDS = ("calls", "errors", "prompt_tokens", "completion_tokens", "cached_tokens", "cache_hits", "latency_ms", "cost_usd")
+DIMENSIONS = ("session", "persona", "model", "history")
+
+logger = logging.getLogger("romind.usage")
+
+
+def history_bucket(messages: int) -> str:
+    for limit, label in HISTORY_BUCKETS:
+        if messages <= limit:
+            return label
+    return HISTORY_BUCKET_MAX
+
+
+def estimate_cost(model: str, usage: Dict[str, int]) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        # версия с датой ("gpt-4.1-mini-2025-04-14") — цена базовой модели
+        for name in sorted(MODEL_PRICES, key=len, reverse=True):
+            if model.startswith(name):
+                prices = MODEL_PRICES[name]
+                break
+    if prices is None:
+        return 0.0
+    prompt, cached_price, completion = prices
+    cached = usage.get("cached_tokens", 0)
+    fresh = max(0, usage.get("prompt_tokens", 0) - cached)
+    return (fresh * prompt + cached * cached_price + usage.get("completion_tokens", 0) * completion) / 1e6
+
+
+class _Shard:
+    """Счётчики одного потока: {(разрез, ключ): [значения FIELDS]}."""
+
+    def __init__(self) -> None:
+        self.counters: Dict[Tuple[str, str], List[float]] = {}
+
+
+class UsageLedger:
+    def __init__(self, session_budget: int = SESSION_TOKEN_BUDGET, session_ttl: float = USAGE_SESSION_TTL) -> None:
+        self.session_budget = session_budget
+        self.session_ttl = session_ttl
+        # расход забытых сессий для бюджета: id -> [токены, когда забыть]
+        self._retired: Dict[str, List[float]] = {}
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()   # только при появлении нового потока
+        self._last_dump: Dict[Tuple[str, str], List[float]] = {}
+        self._dumper: Optional[threading.Thread] = None
+
+    # --- Запись ---
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def record(
+        self,
+        model: str,
+        usage: Optional[Dict[str, int]],
+        latency: float,
+        ok: bool = True,
+        session_id: Optional[str] = None,
+        persona: Optional[str] = None,
+        history_len: int = 0,
+    ) -> None:
+        usage = usage or {}
+        cached = usage.get("cached_tokens", 0)
+        values = (
+            1,
+            0 if ok else 1,
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0),
+            cached,
+            1 if cached else 0,
+            latency * 1000,
+            estimate_cost(model, usage),
+        )
+        keys = [("model", model), ("history", history_bucket(history_len))]
+        if session_id:
+            keys.append(("session", session_id))
+        if persona:
+            keys.append(("persona", persona))
+
+        counters = self._shard().counters
+        for key in keys:
+            row = counters.get(key)
+            if row is None:
+                row = counters[key] = [0.0] * len(FIELDS)
+            for i, v in enumerate(values):
+                row[i] += v
+
+    def forget_sessions(self, session_ids: Iterable[str]) -> int:
+        """
+        Удаляет строки сессий из всех шардов (отчёт); возвращает число удалённых
+        строк. Потраченные токены переносятся в _retired — для бюджета — на session_ttl.
+        """
+        keys = [("session", sid) for sid in session_ids]
+        removed = 0
+        spent: Dict[str, int] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key in keys:
+                # dict.pop атомарен; запись потока-владельца в уже удалённую
+                # строку просто теряется вместе с сессией
+                row = shard.counters.pop(key, None)
+                if row is not None:
+                    removed += 1
+                    spent[key[1]] = spent.get(key[1], 0) + int(row[2] + row[3])
+        for key in keys:
+            self._last_dump.pop(key, None)
+
+        now = time.monotonic()
+        with self._shards_lock:
+            for sid in [sid for sid, (_, expires) in self._retired.items() if expires <= now]:
+                del self._retired[sid]
+            if self.session_ttl > 0:
+                for sid, tokens in spent.items():
+                    prev = self._retired.get(sid)
+                    self._retired[sid] = [(prev[0] if prev else 0) + tokens, now + self.session_ttl]
+        return removed
+
+    # --- Чтение ---
+
+    def _merged(self) -> Dict[Tuple[str, str], List[float]]:
+        merged: Dict[Tuple[str, str], List[float]] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, row in list(shard.counters.items()):
+                acc = merged.get(key)
+                if acc is None:
+                    merged[key] = list(row)
+                else:
+                    for i, v in enumerate(row):
+                        acc[i] += v
+        return merged
+
+    def session_tokens(self, session_id: str) -> int:
+        key = ("session", session_id)
+        total = 0
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            row = shard.counters.get(key)
+            if row is not None:
+                total += int(row[2] + row[3])
+        retired = self._retired.get(session_id)
+        if retired is not None and retired[1] > time.monotonic():
+            total += int(retired[0])
+        return total
+
+    def over_budget(self, session_id: Optional[str]) -> bool:
+        if not self.session_budget or not session_id:
+            return False
+        return self.session_tokens(session_id) >= self.session_budget
+
+    @staticmethod
+    def _row_dict(row: List[float]) -> Dict[str, Any]:
+        d: Dict[str, Any] = {f: int(v) for f, v in zip(FIELDS[:-2], row[:-2])}
+        calls = d["calls"] or 1
+        d["latency_ms_avg"] = round(row[-2] / calls, 2)
+        d["cost_usd"] = round(row[-1], 6)
+        return d
+
+    def _group(self, merged: Dict[Tuple[str, str], List[float]]) -> Dict[str, Dict[str, Any]]:
+        report: Dict[str, Dict[str, Any]] = {dim: {} for dim in DIMENSIONS}
+        for (dim, key), row in merged.items():
+            report[dim][key] = self._row_dict(row)
+        return report
+
+    def snapshot(self, session_id: Optional[str] = None, top_sessions: int = 20) -> Dict[str, Any]:
+        grouped = self._group(self._merged())
+        models = grouped["model"].values()
+        totals = {
+            "calls": sum(m["calls"] for m in models),
+            "prompt_tokens": sum(m["prompt_tokens"] for m in models),
+            "completion_tokens": sum(m["completion_tokens"] for m in models),
+            "cost_usd": round(sum(m["cost_usd"] for m in models), 6),
+        }
+        sessions = grouped.pop("session")
+        if session_id is not None:
+            session_view = {session_id: sessions.get(session_id)}
+        else:
+            ranked = sorted(sessions.items(), key=lambda kv: kv[1]["prompt_tokens"] + kv[1]["completion_tokens"], reverse=True)
+            session_view = dict(ranked[:top_sessions])
+        return {
+            "totals": totals,
+            "session_budget": self.session_budget or None,
+            "sessions_tracked": len(sessions),
+            "by_session": session_view,
+            **{f"by_{dim}": grouped[dim] for dim in ("persona", "model", "history")},
+        }
+
+    # --- Периодический дамп ---
+
+    def dump_delta(self, path: str) -> Dict[str, Any]:
+        """Дописывает в JSONL прирост счётчиков с прошлого дампа."""
+        merged = self._merged()
+        delta: Dict[Tuple[str, str], List[float]] = {}
+        for key, row in merged.items():
+            prev = self._last_dump.get(key)
+            diff = row if prev is None else [a - b for a, b in zip(row, prev)]
+            if diff[0] or diff[1]:
+                delta[key] = diff
+        self._last_dump = merged
+        entry = {"time": datetime.utcnow().isoformat(), **self._group(delta)}
+        if delta:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+    def start_dumper(self, path: Optional[str] = USAGE_DUMP_FILE, interval: float = USAGE_DUMP_INTERVAL) -> bool:
+        if not path or self._dumper is not None:
+            return False
+
+        def _loop() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump_delta(path)
+                except Exception:
+                    logger.exception("Usage dump to %s failed", path)
+
+        self._dumper = threading.Thread(target=_loop, name="romind-usage-dump", daemon=True)
+        self._dumper.start()
+        return True
@@ -0,0 +1,22 @@
+"""
+Общая настройка тестов: модули лежат в корне репозитория,
+а файлы памяти приложение пишет в текущий каталог — поэтому
+тесты работают во временном каталоге и без сети (заглушка LLM).
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ["ROMIND_LLM_BACKEND"] = "stub"
+os.environ["ROMIND_SCENARIOS"] = "0"
+os.environ["ROMIND_ENRICH_ASYNC"] = "0"
+for _name in ("ROMIND_CLUSTER_NODES", "ROMIND_CLUSTER_TOKEN", "ROMIND_EXPORT_TOKEN",
+              "ROMIND_CAPTURE_FILE", "ROMIND_USAGE_DUMP_FILE"):
+    os.environ.pop(_name, None)
+
+os.chdir(tempfile.mkdtemp(prefix="romind-tests-"))
@@ -0,0 +1,85 @@
+import random
+
+from romind_analytics import RomindRollups, TopCounter
+
+HOUR = 3600
+DAY = 86400
+
+
+def _brute_top(counts, k):
+    return sorted(v for v in counts.values() if v > 0)[::-1][:k]
+
+
+def test_top_counter_matches_full_sort_under_random_updates():
+    rng = random.Random(7)
+    counter = TopCounter(k=3)
+    counts = {}
+    for _ in range(2000):
+        key = f"t{rng.randrange(12)}"
+        delta = rng.choice([1, 1, 1, 2, -1, -2])
+        if delta < 0:
+            delta = -min(-delta, counts.get(key, 0))
+        counter.add(key, delta)
+        counts[key] = counts.get(key, 0) + delta
+        assert [n for _, n in counter.top_items()] == _brute_top(counts, 3)
+
+
+def test_windows_expire_old_buckets():
+    rollups = RomindRollups(k=5)
+    t0 = 1_000 * DAY
+    rollups.record(["work"], "tired", now=t0)
+    rollups.record(["work", "family"], "happy", now=t0 + 2 * HOUR)
+    rollups.record(["health"], "anxious", now=t0 + 3 * DAY)
+
+    day = rollups.snapshot("24h", now=t0 + 3 * DAY)
+    assert day["messages"] == 1 and day["themes"] == [("health", 1)]
+    week = rollups.snapshot("7d", now=t0 + 3 * DAY)
+    assert week["messages"] == 3 and week["themes"][0] == ("work", 2)
+    # «all» ничего не забывает, 7d — забывает через неделю
+    assert rollups.snapshot("all", now=t0 + 60 * DAY)["messages"] == 3
+    assert rollups.snapshot("7d", now=t0 + 60 * DAY)["themes"] == []
+
+
+def test_rollups_roundtrip_through_dict():
+    rollups = RomindRollups()
+    now = 1_000 * DAY
+    for i in range(5):
+        rollups.record(["work"] if i % 2 else ["family"], "calm", now=now + i)
+    restored = RomindRollups.from_dict(rollups.to_dict())
+    for window in ("24h", "7d", "30d", "all"):
+        assert restored.snapshot(window, now=now + 10) == rollups.snapshot(window, now=now + 10)
+
+
+def test_legacy_index_seeds_all_window_without_double_counting():
+    # одно сообщение «работа и семья» попало в связки обеих тем
+    index = {"work": 4, "family": 1, "_emotions": {"work": {"tired": 4}, "family": {"tired": 1}}}
+    records = [{"emotion": "tired"}] * 4 + [{"emotion": "happy"}]
+    rollups = RomindRollups.from_semantic_index(index, records)
+    assert rollups.top_themes("all") == [("work", 4), ("family", 1)]
+    seeded = rollups.snapshot("all")
+    assert seeded["emotions"] == [("tired", 4), ("happy", 1)]
+    assert seeded["messages"] == 5 and seeded["approximate"]
+    assert RomindRollups.from_dict(rollups.to_dict()).snapshot("all")["approximate"]
+    # временные окна истории не знают и начинаются с нуля
+    day = rollups.snapshot("24h")
+    assert day["messages"] == 0 and not day["approximate"]
+
+
+def test_late_event_lands_in_its_own_bucket():
+    rollups = RomindRollups(k=5)
+    t0 = 1_000 * DAY
+    rollups.record(["work"], "tired", now=t0 + 20 * HOUR)
+    rollups.record(["family"], "happy", now=t0 + HOUR)   # пришло с опозданием
+    # через сутки после опоздавшего события оно уходит из 24h, а новое — нет
+    day = rollups.snapshot("24h", now=t0 + 25 * HOUR + 1)
+    assert day["themes"] == [("work", 1)] and day["messages"] == 1
+
+
+def test_event_older_than_window_is_dropped_from_it():
+    rollups = RomindRollups(k=5)
+    t0 = 1_000 * DAY
+    rollups.record(["work"], "tired", now=t0)
+    rollups.record(["family"], "happy", now=t0 - 2 * DAY)
+    assert rollups.snapshot("24h", now=t0)["themes"] == [("work", 1)]
+    assert rollups.snapshot("7d", now=t0)["messages"] == 2
+    assert rollups.snapshot("all", now=t0)["messages"] == 2
@@ -0,0 +1,48 @@
+import romind_memory
+from romind_memory import RomindFullMemory
+
+
+def _memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return RomindFullMemory(str(tmp_path / "memory.json"))
+
+
+def test_one_message_fills_several_fields(tmp_path, monkeypatch):
+    memory = _memory(tmp_path, monkeypatch)
+    assert memory.update_profile("Меня зовут ира, у меня двое детей и мой муж. Я люблю горы, море")
+    p = memory.profile
+    assert p["primary"]["name"] == "Ира"
+    assert p["primary"]["children"] == 2
+    assert p["primary"]["partner"] == "есть"
+    assert len(p["secondary"]["likes"]) == 1 and p["secondary"]["likes"][0].startswith("горы")
+    assert p["meta"]["facts_count"] == memory._recount_facts()
+
+
+def test_first_mode_keeps_known_value(tmp_path, monkeypatch):
+    memory = _memory(tmp_path, monkeypatch)
+    memory.update_profile("меня зовут Ира")
+    assert not memory.update_profile("меня зовут Оля")
+    assert memory.profile["primary"]["name"] == "Ира"
+
+
+def test_list_items_dedup_and_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(romind_memory, "MAX_PROFILE_LIST", 3)
+    memory = _memory(tmp_path, monkeypatch)
+    assert memory.update_profile("я люблю чай")
+    assert not memory.update_profile("Я люблю чай")
+    for item in ("кофе", "книги", "кино"):
+        memory.update_profile(f"я люблю {item}")
+    assert memory.profile["secondary"]["likes"] == ["кофе", "книги", "кино"]
+    assert memory.profile["meta"]["facts_count"] == memory._recount_facts()
+
+
+def test_unchanged_profile_is_not_rewritten(tmp_path, monkeypatch):
+    memory = _memory(tmp_path, monkeypatch)
+    memory.update_profile("я живу в Казани")
+    path = tmp_path / RomindFullMemory.BIOGRAPHY_FILE
+    stamp = path.stat().st_mtime_ns
+    assert not memory.update_profile("просто поболтать")
+    assert path.stat().st_mtime_ns == stamp
+
+    reloaded = RomindFullMemory(str(tmp_path / "memory.json"))
+    assert reloaded.profile["primary"]["location"] == "в казани"
@@ -0,0 +1,70 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import romind_cloud_app as app
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """Все сообщения, ушедшие в LLM."""
+    seen = []
+    original = app.llm.complete
+
+    def spy(messages, *args, **kwargs):
+        seen.append(messages)
+        return original(messages, *args, **kwargs)
+
+    monkeypatch.setattr(app.llm, "complete", spy)
+    return seen
+
+
+def _contents(messages):
+    return " ".join(m["content"] for m in messages)
+
+
+def test_legacy_clients_do_not_share_the_default_buffer(prompts):
+    client = TestClient(app.app)
+    client.post("/chat", json={"message": "Мой секретный пароль от банка — сирень и туман"})
+    client.post("/chat", json={"message": "Расскажи, как лучше спланировать длинную неделю"})
+    assert "сирень" not in _contents(prompts[-1])
+
+
+def test_own_session_uses_server_buffer(prompts):
+    client = TestClient(app.app)
+    client.post("/chat", json={"message": "Меня беспокоит переезд в другой город", "session_id": "hist-1"})
+    client.post("/chat", json={"message": "Что ты думаешь об этом решении сейчас?", "session_id": "hist-1"})
+    assert "переезд" in _contents(prompts[-1])
+
+
+def test_unread_buffers_are_not_filled_or_summarized(monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(app.summarizer, "maybe_schedule", lambda session: scheduled.append(session.session_id))
+    client = TestClient(app.app)
+    default = app.sessions.get_or_create(app.DEFAULT_SESSION_ID)
+    before = len(default.history)
+    client.post("/chat", json={"message": "Просто старый клиент без сессии"})
+    client.post("/chat", json={
+        "message": "Своя история у клиента",
+        "session_id": "own-history",
+        "history": [{"role": "user", "content": "раньше"}],
+    })
+    assert len(default.history) == before
+    assert not app.sessions.get("own-history").history
+    assert scheduled == []
+
+    client.post("/chat", json={"message": "А тут буфер сервера", "session_id": "server-buffer"})
+    assert len(app.sessions.get("server-buffer").history) == 2
+    assert scheduled == ["server-buffer"]
+
+
+def test_ws_rejects_non_string_persona():
+    client = TestClient(app.app)
+    with client.websocket_connect("/ws") as ws:
+        assert ws.receive_json()["type"] == "session"
+        ws.send_json({"message": "привет", "persona": 42})
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json({"message": "Расскажи что-нибудь о запахах"})
+        frames = []
+        while not frames or frames[-1]["type"] != "done":
+            frames.append(ws.receive_json())
+        assert frames[-1]["type"] == "done"
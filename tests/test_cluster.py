@@ -0,0 +1,151 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import romind_cloud_app as app
+from romind_cluster import HashRing, RomindCluster, export_session, import_session, rebalance
+from romind_memory import RomindSemanticMemory
+from romind_rules import SYSTEM_RULE_PREFIX
+from romind_session import RomindSession, SessionRegistry
+
+KEYS = [f"user-{i}" for i in range(3000)]
+
+
+# --- Кольцо ---
+
+def test_ring_owner_is_deterministic_and_balanced():
+    ring = HashRing(["a", "b", "c"], vnodes=64)
+    assert all(ring.owner(k) == HashRing(["c", "b", "a"], vnodes=64).owner(k) for k in KEYS[:200])
+    spread = ring.spread(KEYS)
+    assert set(spread) == {"a", "b", "c"}
+    assert min(spread.values()) > len(KEYS) / 3 * 0.6
+
+
+def test_ring_join_moves_keys_only_to_new_node():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+    moved = [k for k in KEYS if before.owner(k) != after.owner(k)]
+    assert all(after.owner(k) == "d" for k in moved)
+    assert len(moved) < len(KEYS) / 4 * 1.5
+
+
+def test_empty_ring_keeps_sessions_local():
+    cluster = RomindCluster(node_id="solo", nodes={})
+    assert not cluster.enabled
+    assert cluster.route("anything") is None
+
+
+# --- Передача сессий ---
+
+def test_export_import_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source_mem = RomindSemanticMemory(str(tmp_path / "src.json"))
+    session = RomindSession("s1")
+    session.state.trust = 0.91
+    session.state.persona_id = "MIRA"
+    session.append("user", "я устала на работе")
+    session.append("assistant", "Я рядом.")
+    session.summary = "раньше говорили о семье"
+    source_mem.remember("я устала на работе", "MIRA", None, "tired", 0.91, session_id="s1")
+    source_mem.remember("чужая сессия", "ROMIND", None, "calm", 0.7, session_id="s2")
+
+    payload = export_session(session, source_mem)
+    assert [r["user_text"] for r in payload["memory"]] == ["я устала на работе"]
+
+    target_mem = RomindSemanticMemory(str(tmp_path / "dst.json"))
+    registry = SessionRegistry()
+    restored = import_session(registry, payload, target_mem)
+    assert restored.state.trust == pytest.approx(0.91)
+    assert restored.state.persona_id == "MIRA"
+    assert restored.history == session.history
+    assert restored.summary == "раньше говорили о семье"
+    assert target_mem.semantic_index.get("health") == 1
+
+    # повторная передача не дублирует память и индекс
+    import_session(registry, payload, target_mem)
+    assert len(target_mem.session_records("s1")) == 1
+    assert target_mem.semantic_index.get("health") == 1
+
+
+def test_import_logs_records_that_fail_to_index(caplog):
+    class BrokenMemory:
+        def import_records(self, records):
+            return records
+
+        def update_profile(self, text):
+            raise RuntimeError("profile is broken")
+
+        def update_semantic_patterns(self, text, emotion, now=None):
+            indexed.append(text)
+
+    indexed = []
+    payload = export_session(RomindSession("s9"))
+    payload["memory"] = [
+        {"time": "2024-05-01T10:00:00", "user_text": "сломается", "emotion": "calm"},
+        {"time": "2024-05-01T10:01:00", "user_text": f"{SYSTEM_RULE_PREFIX} говори короче"},
+    ]
+    import_session(SessionRegistry(), payload, BrokenMemory())
+    assert "Indexing imported record 2024-05-01T10:00:00 of session s9 failed" in caplog.text
+    assert "profile is broken" in caplog.text
+    assert indexed == ["говори короче"]
+
+
+def test_rebalance_hands_off_foreign_sessions(monkeypatch):
+    cluster = RomindCluster(node_id="a", nodes={"a": "http://a", "b": "http://b"}, token="t")
+    registry = SessionRegistry()
+    ids = [k for k in KEYS[:40]]
+    for sid in ids:
+        registry.get_or_create(sid)
+
+    sent = []
+    monkeypatch.setattr(cluster, "call", lambda node, path, payload, **kw: (sent.append((node, payload)), (200, {}, {}))[1])
+    moved = rebalance(cluster, registry, None)
+
+    foreign = [sid for sid in ids if cluster.owner(sid) == "b"]
+    assert moved == {"b": len(foreign)}
+    assert {p["session_id"] for _, batch in sent for p in batch["sessions"]} == set(foreign)
+    assert set(registry.ids()) == set(ids) - set(foreign)
+
+
+# --- Доступ к /cluster/* ---
+
+@pytest.fixture
+def client():
+    return TestClient(app.app)
+
+
+def test_cluster_endpoints_closed_without_cluster(client):
+    assert client.post("/cluster/members", json={"nodes": {"evil": "http://127.0.0.1:9"}}).status_code == 403
+    assert client.post("/cluster/handoff", json={"sessions": []}).status_code == 403
+    assert client.get("/cluster/sessions/default").status_code == 403
+    assert app.cluster.route("s1") is None
+
+
+def test_cluster_endpoints_require_token(client, monkeypatch):
+    monkeypatch.setattr(app, "cluster", RomindCluster(node_id="a", nodes={"a": "http://a"}, token="secret"))
+    evil = {"nodes": {"a": "http://a", "evil": "http://127.0.0.1:9"}}
+    assert client.post("/cluster/members", json=evil).status_code == 403
+    assert client.post("/cluster/members", json=evil, headers={"X-Romind-Cluster-Token": "wrong"}).status_code == 403
+    assert client.get("/cluster/sessions/default").status_code == 403
+    assert app.cluster.nodes == {"a": "http://a"}
+
+
+def test_cluster_endpoints_require_configured_token(client, monkeypatch):
+    monkeypatch.setattr(app, "cluster", RomindCluster(node_id="a", nodes={"a": "http://a"}, token=None))
+    assert client.post("/cluster/members", json={"nodes": {"a": "http://a"}}).status_code == 403
+
+
+def test_member_set_must_include_self(client, monkeypatch):
+    monkeypatch.setattr(app, "cluster", RomindCluster(node_id="a", nodes={"a": "http://a"}, token="secret"))
+    headers = {"X-Romind-Cluster-Token": "secret"}
+    r = client.post("/cluster/members", json={"nodes": {"evil": "http://127.0.0.1:9"}}, headers=headers)
+    assert r.status_code == 400
+    assert app.cluster.nodes == {"a": "http://a"}
+
+
+def test_cluster_status_hides_node_urls_without_token(client, monkeypatch):
+    monkeypatch.setattr(app, "cluster", RomindCluster(node_id="a", nodes={"a": "http://10.0.0.1:8801"}, token="secret"))
+    public = client.get("/cluster?session_id=s1").json()
+    assert "nodes" not in public and public["owner"] == "a"
+    assert "nodes" not in client.get("/cluster", headers={"X-Romind-Cluster-Token": "wrong"}).json()
+    full = client.get("/cluster", headers={"X-Romind-Cluster-Token": "secret"}).json()
+    assert full["nodes"] == {"a": "http://10.0.0.1:8801"}
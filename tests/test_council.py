@@ -0,0 +1,38 @@
+from romind_core_logic import RomindState
+from romind_council import RomindCouncil
+
+
+def _failing_ask(text, st, prompt, history, summary, session_id):
+    raise RuntimeError("llm is down")
+
+
+def test_all_personas_failed_uses_fallback():
+    council = RomindCouncil(ask=_failing_ask, fallback=lambda text, st: f"{st.persona_id}: я рядом")
+    result = council.run("привет", RomindState(), ["RO", "MIRA"])
+    assert result["reply"] == "ROMIND: я рядом"
+    assert result["fallback"]
+    assert [a["error"] for a in result["answers"]] == ["RuntimeError", "RuntimeError"]
+    assert council.stats()["fallbacks"] == 1
+
+
+def test_partial_answers_skip_fallback():
+    def ask(text, st, prompt, history, summary, session_id):
+        if st.persona_id == "RO":
+            raise RuntimeError("timeout")
+        return "держись"
+
+    council = RomindCouncil(ask=ask, fallback=lambda text, st: "резерв")
+    result = council.run("привет", RomindState(), ["RO", "MIRA"])
+    assert result["reply"] == "держись"
+    assert not result["fallback"]
+
+
+def test_council_endpoint_never_replies_empty(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import romind_cloud_app as app
+
+    monkeypatch.setattr(app.council, "ask", _failing_ask)
+    client = TestClient(app.app)
+    body = client.post("/chat", json={"message": "как дела", "council": ["RO", "MIRA"]}).json()
+    assert body["reply"]
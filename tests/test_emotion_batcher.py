@@ -0,0 +1,75 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from romind_emotion_model import NO_EMOTION, EmotionModel, MicroBatcher, make_emotion_classifier
+
+
+class SlowModel:
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.calls = []
+
+    def predict(self, texts):
+        self.calls.append(len(texts))
+        if self.gate is not None:
+            self.gate.wait(5)
+        return [("happy", 0.9)] * len(texts)
+
+
+def test_idle_batcher_does_not_wait():
+    batcher = MicroBatcher(SlowModel(), max_wait_ms=50)
+    started = time.perf_counter()
+    for _ in range(20):
+        assert batcher.classify("радость") == ("happy", 0.9)
+    # 20 вызовов по 50 мс окна заняли бы секунду
+    assert time.perf_counter() - started < 0.5
+    assert batcher.stats()["direct"] == 20
+
+
+def test_concurrent_calls_are_batched():
+    gate = threading.Event()
+    model = SlowModel(gate)
+    batcher = MicroBatcher(model, max_wait_ms=0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(batcher.classify("x"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert results == [("happy", 0.9)] * 5
+    # первый считался напрямую, остальные копились, пока шли predict()
+    assert model.calls[0] == 1 and sum(model.calls) == 5
+    assert len(model.calls) < 5
+
+
+def test_timeout_falls_back_to_keywords():
+    gate = threading.Event()
+    batcher = MicroBatcher(SlowModel(gate), timeout_ms=50)
+    busy = threading.Thread(target=batcher.classify, args=("первый",))
+    busy.start()
+    time.sleep(0.02)
+    started = time.perf_counter()
+    assert batcher.classify("второй") == (NO_EMOTION, 0.0)
+    assert time.perf_counter() - started < 1.0
+    assert batcher.stats()["timeouts"] == 1
+    gate.set()
+    busy.join(5)
+
+
+def test_startup_logs_active_classifier(tmp_path, caplog):
+    caplog.set_level(logging.INFO, logger="romind.emotion")
+    missing = str(tmp_path / "missing.npz")
+    assert make_emotion_classifier(missing, mode="auto") is None
+    assert "keywords, model is unavailable" in caplog.text
+
+    pytest.importorskip("numpy")
+    weights = str(tmp_path / "model.npz")
+    EmotionModel.train(["мне грустно", "я рада", "просто текст"], ["sad", "happy", NO_EMOTION], epochs=1).save(weights)
+    caplog.clear()
+    assert make_emotion_classifier(weights, mode="auto") is not None
+    assert f"Emotion classifier: model {weights}" in caplog.text
@@ -0,0 +1,63 @@
+import threading
+
+from romind_enrichment import EnrichmentQueue
+
+
+def _blocked_queue(**kwargs):
+    gate = threading.Event()
+    seen = []
+
+    def handler(session_id, text, emotion, profile):
+        gate.wait(5)
+        seen.append((session_id, text, emotion))
+
+    queue = EnrichmentQueue(handler, workers=1, maxsize=1, policy="coalesce", **kwargs)
+    return queue, gate, seen
+
+
+def test_coalesced_job_is_capped_and_keeps_latest():
+    queue, gate, seen = _blocked_queue(coalesce_max=3)
+    assert queue.submit("busy", "first", "calm")
+    # воркер занят первой задачей — дальше очередь переполнена
+    for _ in range(100):
+        if queue.depth() == 0:
+            break
+        threading.Event().wait(0.01)
+    assert queue.submit("s", "m0", "calm")
+    for i in range(1, 10):
+        assert queue.submit("s", f"m{i}", "happy")
+    assert len(queue._shards[0].pending["s"].items) == 3
+
+    gate.set()
+    assert queue.drain()
+    assert [t for sid, t, _ in seen if sid == "s"] == ["m7", "m8", "m9"]
+    stats = queue.stats()
+    assert stats["coalesced"] == 9
+    assert stats["dropped"] == 7
+    assert stats["processed"] == 4
+
+
+def test_no_pending_job_drops_message():
+    queue, gate, _ = _blocked_queue()
+    queue.submit("a", "x", "calm")
+    queue.submit("a", "y", "calm")
+    assert not queue.submit("b", "z", "calm")
+    gate.set()
+    assert queue.drain()
+    assert queue.stats()["dropped"] == 1
+
+
+def test_taught_rule_is_not_a_biography_fact(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import romind_cloud_app as app
+
+    jobs = []
+    monkeypatch.setattr(app, "ENRICH_ASYNC", True)
+    monkeypatch.setattr(app.enricher, "submit", lambda *args, **kwargs: jobs.append((args, kwargs)))
+    TestClient(app.app).post("/chat", json={"message": "ROMIND, запомни: не называй меня Ирочкой", "session_id": "teach-bio"})
+    assert jobs and jobs[0][1] == {"profile": False}
+
+    name = app.memory.profile["primary"]["name"]
+    app.enrich_memory("teach-bio", "меня зовут Правило", "calm", profile=False)
+    assert app.memory.profile["primary"]["name"] == name
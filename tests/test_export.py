@@ -0,0 +1,93 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import romind_cloud_app as app
+import romind_export
+from romind_export import iter_export_chunks, iter_export_records
+from romind_memory import RomindSemanticMemory
+
+
+def _memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    memory = RomindSemanticMemory(str(tmp_path / "memory.json"))
+    memory.remember("привет", "SOFIA", None, "calm", 0.5)
+    memory.remember("работа и проект", "ALEX", None, "tired", 0.4)
+    memory.update_profile("меня зовут Ира")
+    memory.update_semantic_patterns("работа и проект", "tired")
+    memory.update_semantic_patterns("здоровье и врач", "anxious")
+    return memory
+
+
+def test_persona_filter_is_case_insensitive(tmp_path, monkeypatch):
+    memory = _memory(tmp_path, monkeypatch)
+    records = list(iter_export_records(memory, kinds=("memory",), personas=["sofia"]))
+    assert [r["user_text"] for r in records] == ["привет"]
+
+
+def test_sections_survive_concurrent_changes(tmp_path, monkeypatch):
+    memory = _memory(tmp_path, monkeypatch)
+    profile = iter_export_records(memory, kinds=("profile",))
+    semantic = iter_export_records(memory, kinds=("semantic",))
+    next(profile)
+    next(semantic)
+    # пока экспорт идёт, память продолжает меняться
+    memory.update_profile("я живу в Казани")
+    memory.update_semantic_patterns("семья и мама", "happy")
+    assert not any("казан" in str(r["value"]) for r in profile)
+    assert "казан" in str(memory.profile)
+    assert not any(r.get("theme") == "family" for r in semantic)
+
+
+def test_memory_snapshot_ignores_reordering(tmp_path, monkeypatch):
+    memory = _memory(tmp_path, monkeypatch)
+    records = iter_export_records(memory, kinds=("memory",))
+    next(records)
+    memory.import_records([{"time": "2000-01-01T00:00:00", "user_text": "старое", "persona": "SOFIA"}])
+    assert [r["user_text"] for r in records] == ["работа и проект"]
+
+
+def test_jsonl_chunks_decode(tmp_path, monkeypatch):
+    memory = _memory(tmp_path, monkeypatch)
+    lines = b"".join(iter_export_chunks(memory)).decode("utf-8").splitlines()
+    assert all(json.loads(line)["kind"] for line in lines)
+
+
+def _timed_memory(tmp_path, monkeypatch):
+    memory = RomindSemanticMemory(str(tmp_path / "memory.json"))
+    monkeypatch.chdir(tmp_path)
+    memory.import_records([
+        {"time": "2024-05-01T20:30:00", "user_text": "вечер", "persona": "SOFIA"},
+        {"time": "2024-05-02T09:00:00.123456", "user_text": "утро", "persona": "SOFIA"},
+    ])
+    return memory
+
+
+@pytest.mark.parametrize("since, until, expected", [
+    ("2024-05-02", None, ["утро"]),                              # только дата
+    ("2024-05-01T20:30:00Z", "2024-05-02T09:00:00Z", ["вечер"]),  # «Z», микросекунды у записи
+    ("2024-05-01T23:30:00+03:00", None, ["вечер", "утро"]),      # смещение -> UTC
+    (None, "2024-05-02T12:00:00+03:00", ["вечер"]),             # 09:00 UTC, граница не включительно
+])
+def test_time_bounds_are_parsed_not_compared_as_strings(tmp_path, monkeypatch, since, until, expected):
+    memory = _timed_memory(tmp_path, monkeypatch)
+    records = iter_export_records(memory, kinds=("memory",), since=since, until=until)
+    assert [r["user_text"] for r in records] == expected
+
+
+def test_bad_time_bound_fails_before_streaming(tmp_path, monkeypatch):
+    memory = _timed_memory(tmp_path, monkeypatch)
+    with pytest.raises(ValueError):
+        iter_export_chunks(memory, since="вчера")
+
+
+def test_http_export_requires_token(monkeypatch):
+    client = TestClient(app.app)
+    assert client.get("/export").status_code == 403        # секрет не настроен
+    monkeypatch.setattr(romind_export, "EXPORT_TOKEN", "secret")
+    assert client.get("/export", headers={"X-Romind-Export-Token": "wrong"}).status_code == 403
+    ok = client.get("/export?kinds=profile", headers={"X-Romind-Export-Token": "secret"})
+    assert ok.status_code == 200
+    bad = client.get("/export?since=вчера", headers={"X-Romind-Export-Token": "secret"})
+    assert bad.status_code == 400
@@ -0,0 +1,23 @@
+from romind_core_logic import RomindState
+from romind_fastpath import FastPathRouter, classify_intent
+
+
+def test_greeting_answered_from_template():
+    assert FastPathRouter(enabled=True).route("Привет!", RomindState()) is not None
+
+
+def test_remember_check_goes_to_full_path():
+    router = FastPathRouter(enabled=True)
+    assert classify_intent("ты запомнил?") is None
+    assert router.route("ты запомнил?", RomindState()) is None
+
+
+def test_ack_needs_a_question_in_history():
+    router = FastPathRouter(enabled=True)
+    st = RomindState()
+    statement = [{"role": "user", "content": "x"}, {"role": "assistant", "content": "Я рядом."}]
+    question = [{"role": "user", "content": "x"}, {"role": "assistant", "content": "Сделаем первый шаг сегодня?"}]
+    assert router.route("да", st) is None
+    assert router.route("ок", st, statement) is None
+    assert router.route("хорошо", st, question) is not None
+    assert router.stats()["misses"]["ack_without_question"] == 2
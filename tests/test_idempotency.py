@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+from romind_idempotency import IdempotencyCache, IdempotencyConflict, IdempotencyTimeout
+
+
+def test_replay_returns_stored_result_without_recompute():
+    cache = IdempotencyCache()
+    calls = []
+    first = cache.run("s:k", "fp", lambda: calls.append(1) or {"reply": "a"})
+    second = cache.run("s:k", "fp", lambda: calls.append(1) or {"reply": "b"})
+    assert first == ({"reply": "a"}, False)
+    assert second == ({"reply": "a"}, True)
+    assert len(calls) == 1
+
+
+def test_same_key_with_other_body_conflicts():
+    cache = IdempotencyCache()
+    cache.run("s:k", "fp1", lambda: 1)
+    with pytest.raises(IdempotencyConflict):
+        cache.run("s:k", "fp2", lambda: 2)
+    assert cache.stats()["conflicts"] == 1
+
+
+def test_concurrent_duplicate_waits_for_original():
+    cache = IdempotencyCache()
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    original = threading.Thread(target=lambda: results.append(cache.run("s:k", "fp", slow)))
+    original.start()
+    started.wait(5)
+    duplicate = threading.Thread(target=lambda: results.append(cache.run("s:k", "fp", lambda: "again")))
+    duplicate.start()
+    release.set()
+    original.join(5)
+    duplicate.join(5)
+    assert sorted(results) == [("done", False), ("done", True)]
+
+
+def test_failed_original_lets_retry_compute():
+    cache = IdempotencyCache()
+    with pytest.raises(RuntimeError):
+        cache.run("s:k", "fp", lambda: (_ for _ in ()).throw(RuntimeError("llm down")))
+    assert cache.run("s:k", "fp", lambda: "ok") == ("ok", False)
+
+
+def test_duplicate_gives_up_after_wait():
+    cache = IdempotencyCache(wait=0.05)
+    release = threading.Event()
+    t = threading.Thread(target=cache.run, args=("s:k", "fp", lambda: release.wait(5)))
+    t.start()
+    while not cache.stats()["in_flight"]:
+        pass
+    with pytest.raises(IdempotencyTimeout):
+        cache.run("s:k", "fp", lambda: None)
+    release.set()
+    t.join(5)
+
+
+def test_expired_and_overflowing_keys_are_evicted():
+    cache = IdempotencyCache(ttl=0, max_keys=2)
+    cache.run("s:a", "fp", lambda: 1)
+    assert cache.run("s:a", "fp", lambda: 2) == (2, False)
+    cache = IdempotencyCache(max_keys=2)
+    for key in ("a", "b", "c"):
+        cache.run(key, "fp", lambda: key)
+    assert cache.stats()["keys"] == 2
+
+
+def test_chat_endpoint_replays_and_conflicts():
+    from fastapi.testclient import TestClient
+
+    import romind_cloud_app as app
+
+    client = TestClient(app.app)
+    headers = {"Idempotency-Key": "retry-1"}
+    body = {"message": "мне грустно", "session_id": "idem-test"}
+    first = client.post("/chat", json=body, headers=headers)
+    trust = first.json()["state"]["trust"]
+    second = client.post("/chat", json=body, headers=headers)
+    assert second.headers.get("Idempotent-Replayed") == "true"
+    assert second.json() == first.json()
+    assert app.sessions.get("idem-test").state.describe()["trust"] == trust
+
+    other = client.post("/chat", json={**body, "message": "другое"}, headers=headers)
+    assert other.status_code == 422
+
+
+def test_session_and_key_do_not_collide_across_separator():
+    from fastapi.testclient import TestClient
+
+    import romind_cloud_app as app
+
+    client = TestClient(app.app)
+    first = client.post("/chat", json={"message": "привет", "session_id": "a:b"},
+                        headers={"Idempotency-Key": "c"})
+    second = client.post("/chat", json={"message": "другое", "session_id": "a"},
+                         headers={"Idempotency-Key": "b:c"})
+    assert first.status_code == second.status_code == 200
+    assert "Idempotent-Replayed" not in second.headers
@@ -0,0 +1,52 @@
+import logging
+
+import pytest
+
+import romind_llm
+from romind_llm import LLMBackend, OfflineBackend, make_backend
+
+
+def _responder(text, context=None):
+    return "offline"
+
+
+def test_backend_must_implement_complete():
+    with pytest.raises(TypeError):
+        LLMBackend()
+
+
+def test_unknown_backend_fails_at_startup():
+    with pytest.raises(ValueError):
+        make_backend(_responder, "opneai")
+
+
+def test_explicit_openai_does_not_fall_back_silently(monkeypatch):
+    monkeypatch.setattr(romind_llm, "OpenAI", None)
+    with pytest.raises(RuntimeError):
+        make_backend(_responder, "openai")
+
+
+def test_auto_fallback_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr(romind_llm, "OpenAI", None)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    with caplog.at_level(logging.WARNING, logger="romind.llm"):
+        backend = make_backend(_responder, "auto")
+    assert isinstance(backend, OfflineBackend)
+    assert "offline" in caplog.text
+
+
+def test_app_shutdown_closes_backend():
+    from fastapi.testclient import TestClient
+
+    import romind_cloud_app as app
+
+    handlers = app.app.router.on_shutdown
+    i = handlers.index(app.llm.close)
+    closed = []
+    handlers[i] = lambda: closed.append(True)
+    try:
+        with TestClient(app.app):
+            assert not closed
+    finally:
+        handlers[i] = app.llm.close
+    assert closed
@@ -0,0 +1,40 @@
+import json
+import weakref
+
+import romind_memory
+from romind_memory import RomindSemanticMemory, flush_all
+
+
+def _memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # другие тесты держат свои экземпляры — flush_all не должен их трогать
+    monkeypatch.setattr(romind_memory, "_FLUSH_TARGETS", weakref.WeakSet())
+    return RomindSemanticMemory(str(tmp_path / "memory.json"))
+
+
+def test_message_without_themes_marks_rollups_dirty(tmp_path, monkeypatch):
+    memory = _memory(tmp_path, monkeypatch)
+    memory.update_semantic_patterns("просто так", "calm")
+    assert memory._semantic_dirty
+
+    flush_all()
+    assert not memory._semantic_dirty
+    with open(tmp_path / RomindSemanticMemory.SEMANTIC_FILE, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["_rollups"]["all"]["messages"] == 1
+
+
+def test_one_background_flusher_for_all_instances(tmp_path, monkeypatch):
+    first = _memory(tmp_path, monkeypatch)
+    second = RomindSemanticMemory(str(tmp_path / "other.json"))
+    assert first in romind_memory._FLUSH_TARGETS and second in romind_memory._FLUSH_TARGETS
+    assert romind_memory._flusher is not None and romind_memory._flusher.is_alive()
+
+
+def test_zero_interval_saves_immediately(tmp_path, monkeypatch):
+    memory = _memory(tmp_path, monkeypatch)
+    monkeypatch.setattr(romind_memory, "SEMANTIC_FLUSH_INTERVAL", 0)
+    memory.update_semantic_patterns("работа и проект", "tired")
+    assert not memory._semantic_dirty
+    with open(tmp_path / RomindSemanticMemory.SEMANTIC_FILE, encoding="utf-8") as f:
+        assert json.load(f)["_emotions"]["work"] == {"tired": 1}
@@ -0,0 +1,23 @@
+import pytest
+
+import romind_cloud_app as app
+from romind_core_logic import RomindState
+
+BASELINE_EXTRAS = {
+    "tired": " Ты устала — убираем лишнее, оставляем главное.",
+    "drained": " Ты устала — убираем лишнее, оставляем главное.",
+    "overwhelmed": " Ты устала — убираем лишнее, оставляем главное.",
+    "anxious": " В хаосе спасает структура. Давай 1–3 шага.",
+    "worried": " В хаосе спасает структура. Давай 1–3 шага.",
+    "happy": " Хороший импульс. Закрепим его конкретным решением.",
+    "joyful": " Хороший импульс. Закрепим его конкретным решением.",
+    "inspired": " Хороший импульс. Закрепим его конкретным решением.",
+}
+
+
+@pytest.mark.parametrize("emotion", list(BASELINE_EXTRAS) + ["insecure", "proud", "playful", "calm", "sad"])
+def test_offline_reply_matches_baseline_mapping(emotion):
+    st = RomindState()
+    st.emotion = emotion
+    expected = "Я здесь. Давай смотреть на вещи честно и структурно." + BASELINE_EXTRAS.get(emotion, "")
+    assert app.offline_reply("x", st) == expected
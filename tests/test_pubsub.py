@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import romind_cloud_app as app
+from romind_pubsub import StateBroker
+
+
+def test_fast_changes_coalesce_into_one_event():
+    async def scenario():
+        broker = StateBroker()
+        sub = broker.subscribe("s")
+        broker.publish("s", {"emotion": "anxious", "trust": 0.5})
+        broker.publish("s", {"emotion": "tired"})
+        broker.publish("s", {"emotion": "calm"})
+        diff = await sub.get(timeout=1)
+        assert diff == {"emotion": "calm", "trust": 0.5}
+        assert sub.seq == 3 and broker.stats()["coalesced"] == 2
+        assert await sub.get(timeout=0.01) is None
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_does_not_block_publishers_or_grow():
+    async def scenario():
+        broker = StateBroker()
+        slow = broker.subscribe("s")
+        fast = broker.subscribe("s")
+        for i in range(1000):
+            assert broker.publish("s", {"trust": i, "emotion": "calm"}) == 2
+            if i % 100 == 0:
+                await fast.get(timeout=1)
+        # медленный подписчик держит одно слитое событие, а не 1000
+        assert slow.pending == {"trust": 999, "emotion": "calm"}
+        assert await slow.get(timeout=1) == {"trust": 999, "emotion": "calm"}
+
+    asyncio.run(scenario())
+
+
+def test_subscriber_with_closed_loop_is_dropped():
+    broker = StateBroker()
+    loop = asyncio.new_event_loop()
+    broker.subscribe("s", loop=loop)
+    loop.close()
+    broker.publish("s", {"emotion": "calm"})
+    assert broker.subscribers("s") == 0 and broker.stats()["subscribers"] == 0
+
+
+def test_subscriber_limit():
+    async def scenario():
+        broker = StateBroker(max_subscribers=1)
+        assert broker.subscribe("a") is not None
+        assert broker.subscribe("b") is None
+        assert broker.stats()["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+class _Request:
+    def __init__(self):
+        self.headers = {}
+
+    async def is_disconnected(self):
+        return True
+
+
+def test_disconnect_unsubscribes(monkeypatch):
+    monkeypatch.setattr(app, "SSE_HEARTBEAT", 0.01)
+    app.sessions.get_or_create("sse-live")
+
+    async def scenario():
+        response = await app.session_events("sse-live", _Request())
+        chunks = [chunk async for chunk in response.body_iterator]
+        assert chunks[0].startswith("event: snapshot")
+        assert app.broker.subscribers("sse-live") == 0
+
+    asyncio.run(scenario())
+
+
+def test_unknown_session_is_not_created():
+    async def scenario():
+        with pytest.raises(HTTPException) as e:
+            await app.session_events("sse-nobody", _Request())
+        assert e.value.status_code == 404
+
+    asyncio.run(scenario())
+    assert app.sessions.get("sse-nobody") is None
@@ -0,0 +1,32 @@
+import romind_cloud_app as app
+from romind_replay import replay
+
+RECORDS = [
+    {"session": "r1", "message": "меня зовут Ира, я устала на работе", "state": {"persona": "MIRA"}},
+    {"session": "r1", "message": "ROMIND, запомни: говори короче"},
+    {"session": "r2", "message": "я люблю горы и море"},
+]
+
+
+def _isolate(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    for name in ("memory", "rule_store", "sessions", "summarizer", "ENRICH_ASYNC", "SCENARIOS_ENABLED"):
+        monkeypatch.setattr(app, name, getattr(app, name))
+
+
+def test_each_repeat_starts_clean(monkeypatch, tmp_path):
+    _isolate(monkeypatch, tmp_path)
+    report = replay(RECORDS, seed=1, repeat=3)
+    assert report["turns"] == 9
+    # последний повтор видел только свои три хода
+    assert len(app.memory.data) == 3
+    assert len(app.rule_store.rules) == 1
+    assert not app.ENRICH_ASYNC and not app.SCENARIOS_ENABLED
+
+
+def test_same_seed_same_replies(monkeypatch, tmp_path):
+    _isolate(monkeypatch, tmp_path)
+    first = replay(RECORDS, seed=3)
+    second = replay(RECORDS, seed=3)
+    assert first["reply_digest"] == second["reply_digest"]
+    assert app.summarizer.stats()["runs"] == 0
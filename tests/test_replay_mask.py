@@ -0,0 +1,19 @@
+from romind_replay import mask_pii
+
+
+def test_bio_values_are_masked():
+    masked = mask_pii("Привет, меня зовут Ира. Я живу в Казани. Я работаю врачом")
+    assert "Ира" not in masked and "Казани" not in masked and "врачом" not in masked
+    assert masked.startswith("Привет, меня зовут <name>.")
+    assert "<location>" in masked
+    assert mask_pii("Я работаю врачом") == "Я работаю <occupation>"
+
+
+def test_lists_and_contacts_are_masked():
+    masked = mask_pii("я люблю Машу и котов. пиши на ira@example.com или +7 912 000-11-22")
+    assert masked == "я люблю <likes>. пиши на <email> или <phone>"
+
+
+def test_plain_text_untouched():
+    text = "у меня трое детей и мой муж устал"
+    assert mask_pii(text) == text
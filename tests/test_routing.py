@@ -0,0 +1,44 @@
+import romind_routing
+from romind_routing import PROBE_INTERVAL, ModelRouter, ModelStats
+
+
+def _degrade(stats, now, n=50):
+    for i in range(n):
+        stats.record(1.0, ok=False, now=now + i * 0.01)
+
+
+def test_old_samples_expire():
+    stats = ModelStats(max_age=60)
+    _degrade(stats, now=0.0)
+    assert stats.degraded(now=1.0)
+    assert not stats.degraded(now=120.0)
+    assert not stats.samples
+
+
+def test_successful_probe_restores_model(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(romind_routing.time, "monotonic", lambda: clock[0])
+    router = ModelRouter({"fast": "nano", "standard": "mini", "deep": "big"})
+    stats = router._stats_for("nano")
+    _degrade(stats, now=clock[0])
+
+    assert not router._usable("nano", clock[0])        # первая встреча — отсчёт пробы
+    clock[0] += PROBE_INTERVAL
+    assert router._usable("nano", clock[0])            # проба
+    router.record("nano", 0.2, ok=True)
+    assert not stats.degraded()
+    assert router._usable("nano", clock[0] + 1)
+
+
+def test_failed_probe_keeps_model_degraded(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(romind_routing.time, "monotonic", lambda: clock[0])
+    router = ModelRouter({"fast": "nano", "standard": "mini", "deep": "big"})
+    stats = router._stats_for("nano")
+    _degrade(stats, now=clock[0])
+    router._usable("nano", clock[0])
+    clock[0] += PROBE_INTERVAL
+    assert router._usable("nano", clock[0])
+    router.record("nano", 0.2, ok=False)
+    assert stats.degraded()
+    assert not router._usable("nano", clock[0] + 1)
@@ -0,0 +1,66 @@
+import pytest
+
+from romind_rules import RomindRuleStore, rule_id
+
+
+def _store(tmp_path, budget=300):
+    return RomindRuleStore(str(tmp_path / "rules.json"), token_budget=budget)
+
+
+def test_rule_dedup_ignores_case_spaces_and_punctuation(tmp_path):
+    store = _store(tmp_path)
+    rule, changed = store.add("Не называй меня  Ирочкой.")
+    assert changed
+    again, changed = store.add("не называй меня ирочкой!")
+    assert not changed and again["id"] == rule["id"]
+    assert rule_id("  НЕ называй меня Ирочкой ") == rule["id"]
+    assert len(store.rules) == 1
+
+
+def test_repeat_widens_scope_and_shared_stays_shared(tmp_path):
+    store = _store(tmp_path)
+    store.add("говори короче", personas=["ro"])
+    rule, changed = store.add("Говори короче.", personas=["MIRA"])
+    assert changed and rule["personas"] == ["MIRA", "RO"]
+    rule, _ = store.add("говори короче")
+    assert rule["personas"] == []
+    shared, _ = store.add("без смайликов")
+    _, changed = store.add("без смайликов", personas=["RO"])
+    assert not changed and shared["personas"] == []
+
+
+def test_fragments_follow_scope_and_survive_reload(tmp_path):
+    store = _store(tmp_path)
+    store.add("без смайликов")
+    store.add("шути чаще", personas=["RAZ"])
+    assert "шути чаще" in store.fragment("RAZ")
+    assert "шути чаще" not in store.fragment("MIRA")
+    assert "без смайликов" in store.fragment("MIRA")
+
+    reloaded = _store(tmp_path)
+    assert reloaded.fragment("RAZ") == store.fragment("RAZ")
+
+
+def test_fragment_fits_token_budget(tmp_path):
+    store = _store(tmp_path, budget=10)
+    store.add("первое очень длинное правило", created_at="2024-01-01T00:00:00")
+    store.add("второе", created_at="2024-01-02T00:00:00")
+    assert store.fragment() == "- второе"
+
+
+def test_unknown_persona_is_rejected(tmp_path):
+    store = _store(tmp_path)
+    with pytest.raises(ValueError):
+        store.add("говори короче", personas=["MIRAA"])
+    assert not store.rules
+
+
+def test_rules_endpoint_rejects_unknown_persona():
+    from fastapi.testclient import TestClient
+
+    import romind_cloud_app as app
+
+    client = TestClient(app.app)
+    response = client.post("/rules", json={"text": "говори короче", "personas": ["MIRAA"]})
+    assert response.status_code == 400
+    assert "MIRAA" in response.json()["detail"]
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from romind_core_logic import RomindState
+from romind_scenarios import (
+    DeviceAdapter,
+    SCENARIO_TABLE,
+    SCENT_BLOCKS,
+    ScenarioEngine,
+    SimulatedDeviceAdapter,
+    scenario_key,
+    simulated_adapters,
+)
+
+
+def _state(emotion="calm", persona="ROMIND"):
+    st = RomindState()
+    st.emotion = emotion
+    st.persona_id = persona
+    return st
+
+
+def test_device_adapter_is_abstract():
+    with pytest.raises(TypeError):
+        DeviceAdapter("x", [])
+
+
+def test_fan_out_within_latency_bound_and_dedup():
+    engine = ScenarioEngine(lambda sid: simulated_adapters(hubs=4, latency=0.01, jitter=0.0))
+    report = asyncio.run(engine.apply(_state("tired")))
+    assert report["commands_sent"] == len(SCENT_BLOCKS)
+    assert report["errors"] == {}
+    # хабы работают параллельно: ~одна задержка хаба, а не четыре
+    assert report["duration_ms"] < 100
+
+    again = asyncio.run(engine.apply(_state("tired")))
+    assert again["commands_sent"] == 0
+
+
+def test_sessions_have_separate_devices():
+    engine = ScenarioEngine(lambda sid: simulated_adapters(latency=0.0, jitter=0.0))
+    asyncio.run(engine.apply(_state("tired"), "a"))
+    report = asyncio.run(engine.apply(_state("tired"), "b"))
+    assert report["commands_sent"] == len(SCENT_BLOCKS)
+    assert engine.devices("a").adapters is not engine.devices("b").adapters
+
+
+def test_submit_skips_unchanged_scenario_per_session():
+    engine = ScenarioEngine(lambda sid: simulated_adapters(latency=0.0, jitter=0.0))
+    assert engine.submit(_state("tired"), "a").result(2)["commands_sent"] == len(SCENT_BLOCKS)
+    assert engine.submit(_state("tired"), "a") is None
+    assert engine.submit(_state("tired"), "b") is not None
+
+
+class _SlowFirst(SimulatedDeviceAdapter):
+    """Первый пакет идёт дольше всех следующих."""
+
+    async def send_batch(self, commands):
+        await asyncio.sleep(0.15 if self.batches == 0 else 0.0)
+        self.batches += 1
+        for cmd in commands:
+            self.applied[cmd.device_id] = dict(cmd.params)
+
+
+def test_newer_scenario_is_not_overwritten_by_older():
+    hub = {}
+
+    def factory(sid):
+        hub["adapter"] = _SlowFirst("slow", SCENT_BLOCKS, latency=0.0, jitter=0.0)
+        return [hub["adapter"]]
+
+    engine = ScenarioEngine(factory, device_timeout=1.0)
+    first = engine.submit(_state("tired"), "s")
+    second = engine.submit(_state("happy"), "s")
+    third = engine.submit(_state("angry"), "s")
+    first.result(2), third.result(2)
+    assert second.result(2) == {"superseded": True}
+
+    scenario = SCENARIO_TABLE[scenario_key(_state("angry"))]
+    expected = {dev: scenario[cat] for dev, cat in SCENT_BLOCKS if cat in scenario}
+    assert hub["adapter"].applied == expected
+    assert engine.devices("s").last_key is not None
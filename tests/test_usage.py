@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+
+from romind_session import SessionRegistry
+from romind_usage import UsageLedger
+
+USAGE = {"prompt_tokens": 10, "completion_tokens": 5}
+
+
+def test_evicted_sessions_leave_the_ledger():
+    ledger = UsageLedger()
+    registry = SessionRegistry(max_sessions=2, on_evict=ledger.forget_sessions)
+    for sid in ("a", "b", "c"):
+        registry.get_or_create(sid)
+        # строки пишут разные потоки — у каждого свой шард
+        t = threading.Thread(target=ledger.record, args=("gpt-4.1-mini", USAGE, 0.1), kwargs={"session_id": sid})
+        t.start()
+        t.join()
+        ledger.record("gpt-4.1-mini", USAGE, 0.1, session_id=sid)
+    registry.get_or_create("d")
+
+    report = ledger.snapshot()
+    assert set(report["by_session"]) == {"c"}
+    # для бюджета расход вытесненной сессии помнится отдельно
+    assert ledger.session_tokens("a") == 30
+    assert ledger.session_tokens("c") == 30
+    # остальные разрезы не теряют вызовы забытых сессий
+    assert report["totals"]["calls"] == 6
+
+
+def test_dumper_logs_failures(tmp_path, caplog):
+    ledger = UsageLedger()
+    ledger.record("gpt-4.1-mini", USAGE, 0.1)
+    with caplog.at_level(logging.ERROR, logger="romind.usage"):
+        assert ledger.start_dumper(str(tmp_path / "missing" / "usage.jsonl"), interval=0.01)
+        deadline = time.monotonic() + 2
+        while "Usage dump" not in caplog.text and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert "Usage dump" in caplog.text
+    # поток-дампер живёт до конца процесса — даём ему писать дальше
+    (tmp_path / "missing").mkdir()
+
+
+def test_budget_survives_eviction():
+    ledger = UsageLedger(session_budget=20)
+    registry = SessionRegistry(max_sessions=1, on_evict=ledger.forget_sessions)
+    registry.get_or_create("greedy")
+    ledger.record("gpt-4.1-mini", USAGE, 0.1, session_id="greedy")
+    ledger.record("gpt-4.1-mini", USAGE, 0.1, session_id="greedy")
+    assert ledger.over_budget("greedy")
+
+    registry.get_or_create("other")          # "greedy" вытеснена
+    assert "greedy" not in ledger.snapshot()["by_session"]
+    registry.get_or_create("greedy")
+    assert ledger.over_budget("greedy")
+    assert ledger.session_tokens("greedy") == 30
+
+
+def test_retired_spend_expires():
+    ledger = UsageLedger(session_budget=20, session_ttl=0.01)
+    ledger.record("gpt-4.1-mini", USAGE, 0.1, session_id="s")
+    ledger.forget_sessions(["s"])
+    assert ledger.session_tokens("s") == 15
+    time.sleep(0.02)
+    assert ledger.session_tokens("s") == 0
+    ledger.forget_sessions([])
+    assert not ledger._retired
+
+
+def test_summary_and_synthesis_spend_is_attributed_and_budgeted(monkeypatch):
+    import romind_cloud_app as app
+
+    messages = [{"role": "user", "content": "сверни разговор"}]
+    assert app.summarize_via_gpt(messages, "budget-side")
+    assert app.synthesize_via_gpt(messages, "budget-side")
+    row = app.usage.snapshot("budget-side")["by_session"]["budget-side"]
+    assert row["calls"] == 2
+
+    monkeypatch.setattr(app.usage, "session_budget", 1)
+    calls = []
+    monkeypatch.setattr(app.llm, "complete", lambda *a, **kw: calls.append(a))
+    assert app.summarize_via_gpt(messages, "budget-side") is None
+    assert app.synthesize_via_gpt(messages, "budget-side") is None
+    assert not calls